@@ -30,8 +30,10 @@ from Joggers.ShuttleJogger import ShuttleJogger
 from gcode.GCodeLoader import GCodeLoader
 from gcode.JogHelper import JogHelper, JogHelper1_1
 from jogWidget_ui import Ui_joyWidget
-from gcode.GCodeRunner import truncateGCode
-from gcode.GrblWriter import showGrblErrorMessageBox
+from gcode.GCodeRunner import GCodeCheckRunner
+from gcode.GrblErrors import formatGrblError, lineLabel
+from gcode.FileLoader import getCheckResult, putCheckResult
+from gcode.CompiledJob import compileJob
 
 from string_format import config_string_format
 
@@ -71,6 +73,10 @@ class JogWidget(Ui_joyWidget, QWidget):
         self.setPosition([0,0,0])
         self.disableControls()
         self.isFileLoaded = False
+        self.gcode = None # lines of the loaded file: a list, or GCodeLines for large files
+        self.compiledJob = None # job with the Z compensation already applied
+        self.checkRunner = None # check of the file in grbl check mode, running in the background
+        self.checkProgress = None
         self.joggers = []
 
         if pycnc_config.JOG_JOYPAD_ENABLED:
@@ -97,26 +103,37 @@ class JogWidget(Ui_joyWidget, QWidget):
         return True
 
     def zProbeEvent(self):
-        if not self.grblWriter: return
-        if self.probeWarning():
+        if not self.grblWriter or self.isChecking(): return
+        if not self.probeWarning(): return
+        # the probe must not start while a jog command is running
+        if not self.releaseMachine(): return
+        try:
             currentZ = self.grblWriter.probe_z_offset()
             if currentZ is None:
                 QMessageBox.warning(self, "Error probing", "Error probing!")
                 return
             self.grblWriter.do_command("G0 Z" + str(-currentZ))
+        finally:
+            self.startJoggers()
 
     def gridProbeEvent(self):
-        if not self.grblWriter: return
+        if not self.grblWriter or self.isChecking(): return
 
         if self.GridProbeButton.text() == "Clear Grid":
             self.grblWriter.compensate_z(False)
             self.grblWriter.zCompensation = None
+            self.clearCompiledJob()
             self.GridProbeButton.setText("Grid Probe")
             return
 
         if not self.probeWarning(): return
+        self.clearCompiledJob()
 
-        res = self.grblWriter.probe_grid((self.bBox[0][0], self.bBox[1][0]), (self.bBox[0][1], self.bBox[1][1]), pycnc_config.PROBING_SPACING)
+        if not self.releaseMachine(): return
+        try:
+            res = self.grblWriter.probe_grid((self.bBox[0][0], self.bBox[1][0]), (self.bBox[0][1], self.bBox[1][1]), pycnc_config.PROBING_SPACING)
+        finally:
+            self.startJoggers()
         if not res:
             # error in probing
             QMessageBox.warning(self, "Error probing", "Error probing!")
@@ -124,6 +141,35 @@ class JogWidget(Ui_joyWidget, QWidget):
 
         self.grblWriter.compensate_z(True)
         self.GridProbeButton.setText("Clear Grid")
+        self.compileJob()
+
+    def compileJob(self):
+        # apply the Z compensation to the whole file once, so that it can be streamed at full speed
+        progress = QProgressDialog("Applying Z compensation...", "Cancel", 0, len(self.gcode))
+        progress.setWindowModality(Qt.WindowModal)
+
+        def updateProgress(lineIndex):
+            progress.setValue(lineIndex)
+            QApplication.processEvents()
+            return not progress.wasCanceled()
+
+        self.compiledJob = compileJob(self.gcode, self.times, self.grblWriter.zCompensation,
+                                      self.grblWriter.prepare_command, updateProgress)
+        progress.close()
+        if self.compiledJob is None:
+            QMessageBox.warning(self, "Z compensation", "Compilation canceled: the Z compensation will be applied while running")
+
+    def clearCompiledJob(self):
+        if self.compiledJob is not None:
+            self.compiledJob.close()
+            self.compiledJob = None
+
+    def getJob(self):
+        # lines and times to run, whether the Z compensation is already applied, the prepared commands and the
+        # compiled job the lines come from
+        if self.compiledJob is not None:
+            return self.compiledJob.gcode, self.compiledJob.times, True, self.compiledJob.commands, self.compiledJob
+        return self.gcode, self.times, False, self.commands, None
 
     def installJogger(self, jogger):
         jogger.install(self)
@@ -135,12 +181,13 @@ class JogWidget(Ui_joyWidget, QWidget):
 
 
     def relativeMove(self, xyz, feed):
-        if self.jogHelper.isBusy(): return
+        # the jog helper refuses the moves while it is busy, but a continuous jog (Grbl 1.1) is updated
+        if self.isChecking(): return
         if feed is not None and feed <= 0: feed = None
         self.jogHelper.relative_move(xyz, feed)
 
     def absoluteMove(self, xyz, feed):
-        if self.jogHelper.isBusy(): return
+        if self.jogHelper.isBusy() or self.isChecking(): return
         if feed is not None and feed <= 0: feed=None
         self.jogHelper.absolute_move(xyz, feed)
 
@@ -154,6 +201,7 @@ class JogWidget(Ui_joyWidget, QWidget):
         self.grblVersion = grblWriter.config['Major']
 
         if self.grblVersion >= 1:
+            self.jogHelper.shutdown()
             self.jogHelper = JogHelper1_1()
             self.jogHelper.error_event.connect(lambda err: self.error_event.emit(err))
 
@@ -163,6 +211,8 @@ class JogWidget(Ui_joyWidget, QWidget):
     def fileLoaded(self):
         self.isFileLoaded = True
         self.gcode = self.loader.gcode
+        self.commands = self.loader.commands
+        self.contentHash = self.loader.contentHash
         self.times = self.loader.times
         self.totalTime = self.loader.totalTime
         self.bBox = self.loader.bBox
@@ -179,45 +229,77 @@ class JogWidget(Ui_joyWidget, QWidget):
 
     def checkGCode(self):
         if 'raspycnc checked' in self.gcode[-1].lower():
-            # file was already checked
+            # file marked by older versions
             return
-        res = QMessageBox.question(self, "Check GCode", "GCode file was never checked. Run it in check mode?", QMessageBox.Yes | QMessageBox.No)
+        checked = getCheckResult(self.contentHash, self.grblWriter.config)
+        if checked is None:
+            question = "GCode file was never checked. Run it in check mode?"
+        elif checked.passed():
+            return
+        else:
+            self.fileLabel.setStyleSheet('background-color: red;')
+            question = "GCode file failed the check on %s:\n%s\n\nRun it in check mode again?" % (
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(checked.checkTime)), self.errorSummary(checked.errors))
+        res = QMessageBox.question(self, "Check GCode", question, QMessageBox.Yes | QMessageBox.No)
         if res == QMessageBox.No:
             return
 
-        progress = QProgressDialog("GCode checking in progress...", "Cancel", 0, len(self.gcode)-1)
-        progress.setWindowModality(Qt.WindowModal)
-
-        # check gcode
-        for lnum in range(len(self.gcode)):
-            QApplication.processEvents()
-            ok, err = self.grblWriter.check_gcode_line(truncateGCode(self.gcode[lnum]))
-            if not ok:
-                if showGrblErrorMessageBox(self, lnum, self.gcode[lnum], err):
-                    # if true, ignore
-                    ok = True
-                else:
-                    break
-            progress.setValue(lnum)
-            if progress.wasCanceled():
-                break
-
-        progress.close()
-        self.grblWriter.set_check_mode(False) # get out of check mode
+        # the check runs in the background: the dialog is not modal. Grbl does not move in check mode,
+        # so the machine cannot be jogged or probed, and the job cannot be started, until the check ends
+        self.checkProgress = QProgressDialog("GCode checking in progress...", "Cancel", 0, len(self.commands), self)
+        self.checkProgress.setWindowModality(Qt.NonModal)
+        self.checkProgress.setMinimumDuration(0)
+        self.RunButton.setEnabled(False)
 
-        if lnum == len(self.gcode)-1 and ok:
+        self.checkRunner = GCodeCheckRunner()
+        self.checkRunner.setGrbl(self.grblWriter)
+        self.checkRunner.setCommands(self.commands)
+        self.checkRunner.progress_event.connect(lambda line, totLines: self.checkProgress.setValue(line))
+        self.checkRunner.end_event.connect(self.checkFinished)
+        self.checkRunner.stop_event.connect(self.checkStopped)
+        self.checkRunner.error_event.connect(lambda err: self.checkEnded("Error while checking: %s" % err))
+        self.checkProgress.canceled.connect(self.checkRunner.stop)
+        self.checkRunner.start()
+
+    def isChecking(self):
+        return self.checkRunner is not None and self.checkRunner.isRunning()
+
+    def stopCheck(self):
+        if self.isChecking():
+            self.checkRunner.stop()
+            self.checkRunner.wait()
+
+    def checkEnded(self, message = None):
+        self.checkProgress.close()
+        self.RunButton.setEnabled(self.isFileLoaded)
+        if message is not None:
+            QMessageBox.warning(self, "GCode check", message)
+
+    def checkStopped(self):
+        # canceled by the user, or stopped because another file was loaded
+        self.checkEnded("Checking was canceled" if self.checkProgress.wasCanceled() else None)
+
+    def checkFinished(self, errors):
+        self.checkEnded()
+        # the result is stored in the check registry: the file itself is never modified
+        putCheckResult(self.contentHash, self.grblWriter.config, errors)
+        if not errors:
             # all ok
-            with open(self.file, 'a') as f:
-                f.write('\n(raspycnc checked)\n')
             QMessageBox.information(self, "GCode checked", "All OK")
             return
-        elif lnum < len(self.gcode)-1 and ok:
-            # operation was canceled
-            QMessageBox.warning(self, "Operation canceled", "Checking was canceled")
-            return
-        elif not ok:
-            QMessageBox.critical(self, "GCode error", "Error in GCode")
-            self.fileLabel.setStyleSheet('background-color: red;')
+
+        self.fileLabel.setStyleSheet('background-color: red;')
+        QMessageBox.critical(self, "GCode error", self.errorSummary(errors))
+
+    def errorSummary(self, errors):
+        # the first error in full, and the line numbers of the others
+        lnum, err = errors[0]
+        message = formatGrblError(lnum, self.gcode[lnum] if lnum is not None else None, err)
+        if len(errors) > 1:
+            message += "\n\n%d more errors at lines %s" % (len(errors) - 1, ', '.join(lineLabel(e[0]) for e in errors[1:11]))
+            if len(errors) > 11:
+                message += ', ...'
+        return message
 
 
 
@@ -227,14 +309,22 @@ class JogWidget(Ui_joyWidget, QWidget):
         self.fileLabel.setText("Error loading: %s" % err)
 
     def loadFile(self, filename):
+        self.stopCheck()
         self.file = filename
         self.isFileLoaded = False
+        self.clearCompiledJob()
+        if self.gcode is not None and hasattr(self.gcode, 'close'):
+            self.gcode.close() # lines read from the previous file (GCodeLines)
+            self.commands.close() # and their prepared commands
+        self.gcode = None
+        self.commands = None
         self.disableControls()
         #if self.grblWriter: # new file: discard old z compensation.
         #    self.grblWriter.compensate_z(False)
         #    self.grblWriter.zCompensation = None
         self.loader = GCodeLoader()
         self.loader.g0_feed = self.grblWriter.g0_feed
+        self.loader.grblConfig = self.grblWriter.config
         self.loader.load_finished.connect(self.fileLoaded)
         self.loader.load_error.connect(self.loadError)
         self.loader.load(filename)
@@ -289,8 +379,19 @@ class JogWidget(Ui_joyWidget, QWidget):
             jogger.start()
 
     def stopJoggers(self):
+        # returns False if a jog command is still running
         for jogger in self.joggers:
             jogger.stop()
+        return self.jogHelper.stop()
+
+    def releaseMachine(self):
+        # stops the joggers before another command is sent to grbl. If a jog command is still running, the
+        # joggers are restarted and False is returned: nothing else must be sent to grbl
+        if self.stopJoggers():
+            return True
+        QMessageBox.warning(self, "Jog", "The machine is still busy with a jog command")
+        self.startJoggers()
+        return False
 
     def setPosition(self, posXYZ):
         self.xPosTxt.setText("%.1f" % posXYZ[0])
@@ -298,11 +399,12 @@ class JogWidget(Ui_joyWidget, QWidget):
         self.zPosTxt.setText("%.1f" % posXYZ[2])
 
     def runEvent(self):
-        self.stopJoggers()
+        if self.isChecking(): return
+        if not self.releaseMachine(): return
         self.run_event.emit()
 
     def loadEvent(self):
-        self.stopJoggers()
+        if not self.releaseMachine(): return
         self.load_event.emit()
 
     def joyExitEvent(self, exitCondition):
@@ -18,47 +18,51 @@
 
 import PySide.QtCore
 from pyJoy.JoyEvdev import JoyEvdev
-import time
 import pycnc_config
 from AbstractJogger import AbstractJogger
-import math
-
-EVENT_MIN_INTERVAL = 20
-EVENT_INTERVAL = pycnc_config.BTN_REPEAT
+from pyJoy.JoyVelocity import VelocityFilter, responseCurve, velocityToJog
 
+# The joystick jogs in velocity mode (see JoyVelocity): the input events only update the requested velocity, which
+# is filtered and sent as a jog command JOY_SEND_RATE times per second while the joystick is deflected.
 class JoyJogThread(JoyEvdev, AbstractJogger): # order is important. Like this, JoyEvdev overrides the start and stop methods from AbstractJogger
 
     def __init__(self):
         JoyEvdev.__init__(self)
-        self.accumulatedMove = None
+        self.accumulatedMove = [0, 0, 0] # requested velocity, as a fraction of the maximum feed on each axis
+        self.moving = False
+        self.velocityFilter = VelocityFilter()
         self.eventTimer = PySide.QtCore.QTimer(self)
         self.eventTimer.timeout.connect(self.sendMoveEvent)
         self.movementConfig = [pycnc_config.JOY_XAXIS_MAP, pycnc_config.JOY_YAXIS_MAP, pycnc_config.JOY_ZAXIS_MAP]
         self.parent = None
-        self.lastEvent = 0
 
+    def start(self):
+        JoyEvdev.start(self)
+        if self.joyDev is not None:
+            # the timer runs in the GUI thread: it cannot be started by the input thread when the joystick moves
+            self.eventTimer.start(int(1000 / pycnc_config.JOY_SEND_RATE))
 
+    def stop(self):
+        self.eventTimer.stop()
+        JoyEvdev.stop(self)
 
     def processButtonMovement(self, buttonNumber, value):
         val = 1 if value == self.BUTTON_DOWN else 0
         for movementAxis, config in enumerate(self.movementConfig):
             if buttonNumber in config['btns']:
-                if self.accumulatedMove is None:
-                    self.accumulatedMove = [0,0,0]
                 self.accumulatedMove[movementAxis] = val * config['btnsMult'][config['btns'].index(buttonNumber)]
 
     def processAxisMovement(self, axisCode, value):
+        code = pycnc_config.JOY_AXES[axisCode[0]][axisCode[1]]
+        deadzone = max(pycnc_config.JOY_DEADZONE, self.axisRanges[code].deadzone)
+        value = responseCurve(value, deadzone)
         for movementAxis, config in enumerate(self.movementConfig):
             if axisCode in config['axes']:
-                if self.accumulatedMove is None:
-                    self.accumulatedMove = [0,0,0]
                 self.accumulatedMove[movementAxis] = config['axesMult'][config['axes'].index(axisCode)] * value
 
     def processHatMovement(self, hatCode, value):
         for movementAxis, config in enumerate(self.movementConfig):
             if hatCode in config['hats']:
-                if self.accumulatedMove is None:
-                    self.accumulatedMove = [0,0,0]
                 self.accumulatedMove[movementAxis] = config['hatsMult'][config['hats'].index(hatCode)] * value
 
     def processButton(self, code, value):
@@ -88,54 +92,27 @@ class JoyJogThread(JoyEvdev, AbstractJogger): # order is important. Like this, J
         self.processHatMovement(hatCode, value)
 
     def sendMoveEvent(self):
-        xyz = self.accumulatedMove
-
-        # go slower in Z moves
-        if xyz[2] != 0:  # Z axis
-            minFeed = pycnc_config.MIN_FEED_Z
-            maxFeed = pycnc_config.MAX_FEED_Z
-        else:
-            minFeed = pycnc_config.MIN_FEED
-            maxFeed = pycnc_config.MAX_FEED
-
-        feed = minFeed + int(math.sqrt(xyz[0] ** 2 + xyz[1] ** 2 + xyz[2] ** 2) * (maxFeed - minFeed) / 10)
-        # feed = int(math.sqrt(xyz[0]**2 + xyz[1]**2 + xyz[2]**2)*maxFeed)
-        if feed < minFeed: feed = minFeed
-        if feed > maxFeed: feed = maxFeed
-
-        self.relative_move_event.emit(xyz, feed)
-        # print cmd
-
-    def processSYN(self):
-        print "Syn received", self.accumulatedMove
-        if self.accumulatedMove is None:
+        # called by the timer: send the filtered velocity
+        if not self.moving:
             return
+        jog = velocityToJog(self.velocityFilter.sample())
+        if jog is not None:
+            self.relative_move_event.emit(jog[0], jog[1])
 
-        # send the move event
-        if all([move == 0 for move in self.accumulatedMove]):
-            print "Stopping"
-            self.accumulatedMove = None
-            if self.eventTimer.isActive():
-                #print "Stopping timer"
-                self.eventTimer.stop()
-            if self.parent.grblWriter is not None:
-                self.parent.grblWriter.cancelJog() # using messages is sometimes not fast enough
-            self.relative_move_event.emit([0,0,0], 1000) # this is to stop a jog if Grbl1.1 is used
-            PySide.QtCore.QCoreApplication.processEvents()
+    def processSYN(self):
+        # the end of a block of events: update the requested velocity
+        self.velocityFilter.setTarget([max(-1.0, min(1.0, move)) for move in self.accumulatedMove])
+        if not self.velocityFilter.isStopped():
+            self.moving = True
             return
 
-        t = time.time()
-
-        if (t - self.lastEvent)*1000 < EVENT_MIN_INTERVAL:
+        if not self.moving:
             return
-        
-        self.lastEvent = t
-        # keep sending events to keep jogging while a button is pressed
-        if self.eventTimer.isActive():
-            self.eventTimer.stop()
-
-        self.sendMoveEvent()  # send one event now
-        self.eventTimer.start(EVENT_INTERVAL)
+        # the joystick was released: stop at once, without waiting for the timer
+        self.moving = False
+        if self.parent.grblWriter is not None:
+            self.parent.grblWriter.cancelJog() # using messages is sometimes not fast enough
+        self.relative_move_event.emit([0,0,0], None) # this is to stop a jog if Grbl1.1 is used
 
     # attach this jogger to a particular widget. Use for example to install a keyboard filter
     def install(self, widget):
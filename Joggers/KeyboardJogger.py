@@ -21,17 +21,24 @@ import pycnc_config
 from AbstractJogger import AbstractJogger
 import pycnc_config
 
+# While a move key is held, the move is sent again every BTN_REPEAT by a timer, instead of relying on the key
+# auto-repeat: its delay (500 ms or more) is longer than JOG_WATCHDOG, and the continuous jog would stop and restart.
 class KeyboardJogger(AbstractJogger):
 
     def __init__(self):
         AbstractJogger.__init__(self)
         self.enabled = False
+        self.heldMove = None # (direction, feed) of the move key that is held
+        self.repeatTimer = QTimer(self)
+        self.repeatTimer.timeout.connect(self.repeatMove)
 
     def start(self):
         self.enabled = True
 
     def stop(self):
         self.enabled = False
+        self.repeatTimer.stop()
+        self.heldMove = None
 
     def install(self, widget):
         widget.installEventFilter(self)
@@ -41,23 +48,31 @@ class KeyboardJogger(AbstractJogger):
         if not self.enabled:
             return False
 
+        if event.type() == QEvent.Type.KeyRelease:
+            return self.keyReleased(event)
+
+        if event.type() in (QEvent.Type.FocusOut, QEvent.Type.WindowDeactivate):
+            # the release of a held key would be lost
+            self.releaseMove()
+            return False
+
         if event.type() != QEvent.Type.KeyPress:
             return False
 
         k = event.key()
 
         if k in pycnc_config.KEY_XPOS:
-            self.relative_move_event.emit([1, 0, 0], pycnc_config.MAX_FEED)
+            self.pressMove(event, [1, 0, 0], pycnc_config.MAX_FEED)
         elif k in pycnc_config.KEY_XNEG:
-            self.relative_move_event.emit([-1, 0, 0], pycnc_config.MAX_FEED)
+            self.pressMove(event, [-1, 0, 0], pycnc_config.MAX_FEED)
         elif k in pycnc_config.KEY_YPOS:
-            self.relative_move_event.emit([0, 1, 0], pycnc_config.MAX_FEED)
+            self.pressMove(event, [0, 1, 0], pycnc_config.MAX_FEED)
         elif k in pycnc_config.KEY_YNEG:
-            self.relative_move_event.emit([0, -1, 0], pycnc_config.MAX_FEED)
+            self.pressMove(event, [0, -1, 0], pycnc_config.MAX_FEED)
         elif k in pycnc_config.KEY_ZPOS:
-            self.relative_move_event.emit([0, 0, 1], pycnc_config.MAX_FEED_Z)
+            self.pressMove(event, [0, 0, 1], pycnc_config.MAX_FEED_Z)
         elif k in pycnc_config.KEY_ZNEG:
-            self.relative_move_event.emit([0, 0, -1], pycnc_config.MAX_FEED_Z)
+            self.pressMove(event, [0, 0, -1], pycnc_config.MAX_FEED_Z)
         elif k in pycnc_config.KEY_HOME:
             self.absolute_move_event.emit([0, 0, 0], None)
         elif k in pycnc_config.KEY_SETHOME:
@@ -68,3 +83,33 @@ class KeyboardJogger(AbstractJogger):
             return False
 
         return True
+
+    def keyReleased(self, event):
+        # releasing a move key stops a continuous jog (Grbl 1.1). The releases of the key auto-repeat are ignored
+        if event.isAutoRepeat():
+            return False
+        k = event.key()
+        moveKeys = [pycnc_config.KEY_XPOS, pycnc_config.KEY_XNEG, pycnc_config.KEY_YPOS, pycnc_config.KEY_YNEG,
+                    pycnc_config.KEY_ZPOS, pycnc_config.KEY_ZNEG]
+        if not any(k in keys for keys in moveKeys):
+            return False
+        self.releaseMove()
+        return True
+
+    def pressMove(self, event, direction, feed):
+        # the auto-repeat presses are ignored: the timer repeats the move
+        if event.isAutoRepeat() and self.heldMove is not None:
+            return
+        self.heldMove = (direction, feed)
+        self.relative_move_event.emit(direction, feed)
+        self.repeatTimer.start(pycnc_config.BTN_REPEAT)
+
+    def repeatMove(self):
+        if self.heldMove is not None:
+            self.relative_move_event.emit(*self.heldMove)
+
+    def releaseMove(self):
+        self.repeatTimer.stop()
+        if self.heldMove is not None:
+            self.heldMove = None
+            self.relative_move_event.emit([0, 0, 0], None)
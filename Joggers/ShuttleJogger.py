@@ -3,50 +3,15 @@ try:
     import evdev
 except:
     evdev_available = False
-import PySide.QtCore
 import math
 import time
 import pycnc_config
 from AbstractJogger import AbstractJogger
+from pyJoy.EvdevHub import getHub, findDevice
 
-class WheelEventThread(PySide.QtCore.QThread):
-    def __init__(self, jogger):
-        PySide.QtCore.QThread.__init__(self)
-        self.jogger = jogger
-        self.active = False
-
-    def start(self):
-        self.killMe = False
-        PySide.QtCore.QThread.start(self)
-
-    def run(self):
-        self.active = True
-        while not self.killMe:
-            if self.jogger.activeAxis != 0 and self.jogger.wheelStatus != 0:
-                if self.jogger.activeAxis == 3: # Z axis
-                    minFeed = pycnc_config.MIN_FEED_Z
-                    maxFeed = pycnc_config.MAX_FEED_Z
-                else:
-                    minFeed = pycnc_config.MIN_FEED
-                    maxFeed = pycnc_config.MAX_FEED
-
-                xyz = [0.0,0.0,0.0]
-                xyz[self.jogger.activeAxis-1] = self.jogger.wheelStatus
-
-                feed = minFeed + int(math.sqrt(xyz[0]**2 + xyz[1]**2 + xyz[2]**2)*(maxFeed-minFeed)/10)
-                #feed = int(math.sqrt(xyz[0] ** 2 + xyz[1] ** 2 + xyz[2] ** 2) * minFeed)
-                if feed < minFeed: feed = minFeed
-                if feed > maxFeed: feed = maxFeed
-
-                self.jogger.relative_move_event.emit(xyz, feed)
-                time.sleep(float(pycnc_config.BTN_REPEAT) / 1000.0) # limit events to 1 each BTN_REPEAT
-
-        self.active = False
-
-    def stop(self):
-        self.killMe = True
-
-class ShuttleJogger(PySide.QtCore.QThread, AbstractJogger):
+# the events of the shuttle are received from the EvdevHub, in the hub thread. While the wheel is turned, the move is
+# repeated every BTN_REPEAT by a hub timer
+class ShuttleJogger(AbstractJogger):
 
     # codes
     BUTTON_1 = pycnc_config.SHUTTLE_BUTTON_1
@@ -67,25 +32,20 @@ class ShuttleJogger(PySide.QtCore.QThread, AbstractJogger):
     BUTTON_UP = 0
 
     def __init__(self):
-        PySide.QtCore.QThread.__init__(self)
-        #AbstractJogger.__init__(self)
+        AbstractJogger.__init__(self)
         self.shuttleDev = None
-        self.killMe = False
+        self.running = False
+        self.wheelTimer = None # repeat of the wheel move, while the wheel is turned
+        self.jogWidget = None
         if not evdev_available:
             print "Evdev system not available!"
             return
-        devices = [evdev.InputDevice(fn) for fn in evdev.list_devices()]
-        for dev in devices:
-            if pycnc_config.SHUTTLE_IDENTIFIER in dev.name:
-                self.shuttleDev = dev
-                break
+        self.shuttleDev = findDevice(pycnc_config.SHUTTLE_IDENTIFIER)
 
         if self.shuttleDev is None:
             print "Shuttle not found!"
 
         #self.relative_move_event.connect(self.printMove)
-        self.wheelEventThread = WheelEventThread(self)
-        self.jogWidget = None
 
     def printMove(self, xyz, feed):
         print xyz, "Feed", feed
@@ -94,8 +54,7 @@ class ShuttleJogger(PySide.QtCore.QThread, AbstractJogger):
         if self.shuttleDev is None:
             print "Cannot start Shuttle jogger"
             return
-        self.shuttleDev.grab()
-        self.killMe = False
+        if self.running: return
 
         # initialize events
         self.eventBlock = None
@@ -104,8 +63,8 @@ class ShuttleJogger(PySide.QtCore.QThread, AbstractJogger):
         self.activeAxis = 0
         self.currentStepSizeIndex = 0
 
-        PySide.QtCore.QThread.start(self)
-        time.sleep(0.1)
+        self.running = True
+        getHub().subscribe(self.shuttleDev, self.handleEvent)
 
     def process_events(self):
         # process the event block
@@ -164,46 +123,60 @@ class ShuttleJogger(PySide.QtCore.QThread, AbstractJogger):
                 self.relative_move_event.emit(xyz, -1)
 
         if self.activeAxis != 0 and self.wheelStatus != 0:
-            if not self.wheelEventThread.active:
-                self.wheelEventThread.start()
+            if self.wheelTimer is None:
+                self.sendWheelMove()
         else:
-            if self.wheelEventThread.active:
-                self.wheelEventThread.stop()
+            if self.wheelTimer is not None:
+                self.stopWheel()
+                self.relative_move_event.emit([0, 0, 0], None) # stop a continuous jog (Grbl 1.1)
 
         self.eventBlock = None
 
-    def run(self):
-        if self.shuttleDev is None:
-            print "Cannot start Shuttle jogger"
-            return
+    def sendWheelMove(self):
+        # send the move of the wheel now, and again after BTN_REPEAT
+        if self.activeAxis == 3: # Z axis
+            minFeed = pycnc_config.MIN_FEED_Z
+            maxFeed = pycnc_config.MAX_FEED_Z
+        else:
+            minFeed = pycnc_config.MIN_FEED
+            maxFeed = pycnc_config.MAX_FEED
 
-        for event in self.shuttleDev.read_loop():
-            if self.killMe:
-                return
+        xyz = [0.0,0.0,0.0]
+        xyz[self.activeAxis-1] = self.wheelStatus
 
-            if event.type == 0 and event.code == evdev.ecodes.SYN_REPORT:
-                self.process_events() # the block is closed
-                continue
-            if event.code == self.WHEEL:
-                self.eventBlock = event # this is the most important event
-                continue
+        feed = minFeed + int(math.sqrt(xyz[0]**2 + xyz[1]**2 + xyz[2]**2)*(maxFeed-minFeed)/10)
+        if feed < minFeed: feed = minFeed
+        if feed > maxFeed: feed = maxFeed
 
-            if event.code in self.BUTTONS:
-                self.eventBlock = event
-                continue
+        self.relative_move_event.emit(xyz, feed)
+        self.wheelTimer = getHub().callLater(float(pycnc_config.BTN_REPEAT) / 1000.0, self.sendWheelMove)
 
-            # a dial event is always sent; only process it if there is no other event in the pipeline
-            if event.code == self.DIAL and self.eventBlock is None:
-                self.eventBlock = event
-                continue
+    def stopWheel(self):
+        if self.wheelTimer is not None:
+            self.wheelTimer.cancel()
+            self.wheelTimer = None
+
+    def handleEvent(self, event):
+        if event.type == 0 and event.code == evdev.ecodes.SYN_REPORT:
+            self.process_events() # the block is closed
+            return
+        if event.code == self.WHEEL:
+            self.eventBlock = event # this is the most important event
+            return
+
+        if event.code in self.BUTTONS:
+            self.eventBlock = event
+            return
 
+        # a dial event is always sent; only process it if there is no other event in the pipeline
+        if event.code == self.DIAL and self.eventBlock is None:
+            self.eventBlock = event
 
     def stop(self):
-        self.killMe = True
-        self.wheelEventThread.stop()
-        time.sleep(0.1)
-        if self.shuttleDev:
-            self.shuttleDev.ungrab()
+        if not self.running: return
+        self.running = False
+        getHub().unsubscribe(self.shuttleDev, self.handleEvent)
+        self.stopWheel()
 
     # attach this jogger to a particular widget. Use for example to install a keyboard filter
     def install(self, widget):
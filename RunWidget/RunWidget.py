@@ -77,7 +77,7 @@ class RunWidget(Ui_runWidget, QWidget):
         self.yMaxBBoxTxt.setText("%.1f" % BBox[1][1])
         self.zMaxBBoxTxt.setText("%.1f" % BBox[1][2])
 
-    def runGCode(self, filename, gcode, times, totalTime, bbox):
+    def runGCode(self, filename, gcode, times, totalTime, bbox, zCompensated = False, commands = None, source = None):
         if self.grblWriter == None:
             self.error_event.emit("No Grbl writer")
             return
@@ -114,7 +114,9 @@ class RunWidget(Ui_runWidget, QWidget):
         self.runner.end_event.connect(lambda: self.setRunning(False))
         self.runner.stop_event.connect(lambda: self.setRunning(False))
 
-        self.runner.setGcode(gcode)
+        self.runner.setGcode(gcode, zCompensated, commands, source)
+        self.runner.setTimes(times, totalTime)
+        self.runner.setBBox(bbox)
         self.running = True
         self.runner.start()
 
@@ -155,10 +157,11 @@ class RunWidget(Ui_runWidget, QWidget):
 
         return ("%02d:%02d:%02d" % (hours, mins, secs))
 
-    def setProgress(self, lineNo):
-        if lineNo >= len(self.times):
+    def setProgress(self, progress):
+        # progress is a GCodeStreamer.Progress, sent at most PROGRESS_UPDATE_RATE times per second
+        if progress.remaining is None:
             return
-        self.setTime(self.totalTime - self.times[lineNo])
+        self.setTime(max(progress.remaining, 0))
 
     def startJoy(self):
         print "Run widget starting Joy"
@@ -167,4 +170,3 @@ class RunWidget(Ui_runWidget, QWidget):
 
     def stopJoy(self):
         self.joy.stop()
-        time.sleep(0.05)
@@ -0,0 +1,91 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark of the G-code analysis speed (lines/second), as performed by the GCodeLoader.
+# A synthetic 3D-relief-like file is generated if no file is given.
+#
+# Usage: python benchmarks/bench_analyzer.py [-n LINES] [file.nc]
+
+import sys
+import os
+import time
+import math
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gcode.GCodeAnalyzer import GCodeAnalyzer
+
+
+def generateRelief(fileName, nLines):
+    # raster toolpath over a wavy surface, with short segments, rapids and a few arcs
+    with open(fileName, 'w') as f:
+        f.write('(synthetic relief)\nG90 G21\nG0 Z5.000\nG0 X0.000 Y0.000\nF1200\n')
+        n = 5
+        row = 0
+        while n < nLines:
+            y = row * 0.2
+            for col in range(200):
+                x = col * 0.25 if row % 2 == 0 else (199 - col) * 0.25
+                z = -1.0 + 0.5 * math.sin(x / 7.0) * math.cos(y / 5.0)
+                f.write('G1 X%.4f Y%.4f Z%.4f\n' % (x, y, z))
+            f.write('G0 Z5.000 ; retract\n')
+            f.write('G2 X%.4f Y%.4f I0.1000 J0.1000 F800\n' % (x, y + 0.2))
+            f.write('X%.4f Y%.4f\n' % (x, y + 0.2))
+            f.write('G1 Z-1.000 F1200\n')
+            n += 204
+            row += 1
+
+
+def benchmark(fileName):
+    analyzer = GCodeAnalyzer()
+    nLines = 0
+    start = time.time()
+    with open(fileName) as f:
+        for line in f:
+            analyzer.Analyze(line)
+            nLines += 1
+    elapsed = time.time() - start
+    return nLines, elapsed, analyzer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the G-code analyzer")
+    parser.add_argument("-n", "--lines", type=int, default=1000000, help="number of lines of the synthetic file")
+    parser.add_argument("file", nargs="?", help="G-code file to analyze (default: synthetic file)")
+    args = parser.parse_args()
+
+    fileName = args.file
+    if fileName is None:
+        fd, fileName = tempfile.mkstemp(suffix='.nc')
+        os.close(fd)
+        print "Generating %d lines in %s" % (args.lines, fileName)
+        generateRelief(fileName, args.lines)
+
+    try:
+        nLines, elapsed, analyzer = benchmark(fileName)
+    finally:
+        if args.file is None:
+            os.remove(fileName)
+
+    print "Lines: %d" % nLines
+    print "Time: %.2f s" % elapsed
+    print "Speed: %.0f lines/s" % (nLines / elapsed)
+    print "Bounding box:", analyzer.getBoundingBox()
+    print "Travel time: %.1f min" % analyzer.getTravelTime()
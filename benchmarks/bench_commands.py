@@ -0,0 +1,152 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Commands of the jog controls against the Grbl emulator (grbl_emulator.py), in real time: a sequence of moves like
+# the jog buttons and the shuttle dial send them (steps, return to zero, zero setting), each waited for before the next.
+#  - legacy: a new thread for each command, G90/G91 and G21 sent as separate commands, and a status request after
+#    each command (as JogHelper did before CommandWorker)
+#  - worker: CommandWorker, without and with the status polling (STATUS_POLL_RATE)
+# For each: latency of a command (from the request to the end of the motion, until the next command is accepted) and
+# lines sent to grbl per command.
+#
+# Usage: python benchmarks/bench_commands.py [--moves 100] [--latency 0.001]
+
+import sys
+import os
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pycnc_config
+from gcode.GrblWriter import GrblWriter
+from gcode.CommandWorker import CommandWorker
+from grbl_emulator import EmulatorProcess
+
+
+class LegacyCommands:
+    # the commands of JogHelper before CommandWorker
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.thread = None
+
+    def run_command(self, command, wait = False):
+        self.thread = threading.Thread(target = self.run, args = (command, wait))
+        self.thread.start()
+        self.thread.join() # JogHelper.waitThread
+
+    def run(self, command, wait):
+        self.writer.do_command(command, wait)
+        self.writer.update_position()
+
+    def submit(self, command, wait = False, relative = None, metric = False):
+        analyzer = self.writer.analyzer
+        if relative is not None and analyzer.relative != relative:
+            self.run_command("G91" if relative else "G90")
+        if metric and not analyzer.metric:
+            self.run_command("G21")
+        self.run_command(command, wait)
+
+    def waitIdle(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class Worker(CommandWorker):
+    # CommandWorker that wakes up the benchmark when a command is complete
+
+    def __init__(self, writer):
+        CommandWorker.__init__(self)
+        self.setGrbl(writer)
+        self.idle = threading.Event()
+        self.start()
+
+    def execute(self, *job):
+        CommandWorker.execute(self, *job)
+        self.idle.set()
+
+    def waitIdle(self):
+        # the commands are submitted one at a time: the command is complete when it was executed
+        self.idle.wait()
+        self.idle.clear()
+
+
+def commandSequence(moves):
+    # (command, wait, relative, metric) like the jog controls: steps of the shuttle dial, a return to zero every 10 steps,
+    # and a zero setting every 50
+    sequence = []
+    for i in range(moves):
+        if i % 50 == 49:
+            sequence.append(("G10 P0 L20 X0.0 Y0.0", False, None, False))
+        elif i % 10 == 9:
+            sequence.append(("G0 X0.0 Y0.0 Z0.0", True, False, True))
+        else:
+            sequence.append(("G0 X%.1f Y0.0 Z0.0" % (0.1 if i % 2 else -0.1), True, True, True))
+    return sequence
+
+def measure(commands, emulator, sequence):
+    emulator.resetStats()
+    latencies = []
+    for job in sequence:
+        start = time.time()
+        commands.submit(*job)
+        commands.waitIdle()
+        latencies.append(time.time() - start)
+    stats = emulator.getStats()
+    latencies.sort()
+    return {'mean': sum(latencies) / len(latencies), 'p95': latencies[int(len(latencies) * 0.95)],
+            'lines': float(stats['lines']) / len(sequence), 'statusReports': stats['statusReports']}
+
+def openWriter(pollRate):
+    pycnc_config.STATUS_POLL_RATE = pollRate
+    writer = GrblWriter()
+    if not writer.open():
+        print "Cannot connect to the emulator on %s" % pycnc_config.SERIAL_PATTERN
+        sys.exit(1)
+    return writer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the jog commands against the Grbl emulator")
+    parser.add_argument("--moves", type=int, default=100, help="commands in the sequence")
+    parser.add_argument("--latency", type=float, default=0.001, help="processing time of each line in the emulator (s)")
+    parser.add_argument("--poll-rate", type=float, default=5, help="STATUS_POLL_RATE of the worker with polling (Hz)")
+    args = parser.parse_args()
+
+    emulator = EmulatorProcess(lineLatency=args.latency)
+    pycnc_config.SERIAL_PATTERN = emulator.start()
+    pycnc_config.SERIAL_DEBUG = False
+    sequence = commandSequence(args.moves)
+    try:
+        for name, pollRate, factory in [('legacy', 0, LegacyCommands), ('worker', 0, Worker),
+                                        ('worker, polling', args.poll_rate, Worker)]:
+            writer = openWriter(pollRate)
+            commands = factory(writer)
+            try:
+                result = measure(commands, emulator, sequence)
+            finally:
+                commands.shutdown()
+                writer.close()
+            print "%-16s latency %6.1f ms (p95 %6.1f ms)   lines/command %.2f   status reports %d" % (
+                name, result['mean'] * 1000, result['p95'] * 1000, result['lines'], result['statusReports'])
+    finally:
+        emulator.stop()
@@ -0,0 +1,258 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Input handling of the joypad, the shuttle and a keypad, with fake devices (pipes that deliver evdev-like events):
+#  - polling: a thread per device reads the device state every 50 ms and times the repeats of the held buttons in
+#    the same loop (as the pygame JoyEventGenerator did)
+#  - threads: a thread per device blocked reading it (as JoyEvdev and ShuttleJogger did with read_loop), repeats in
+#    a thread per held button
+#  - hub: EvdevHub, one epoll thread for all the devices, repeats with hub timers
+# For each: latency from a button press to its event, interval of the repeats (BTN_REPEAT), CPU time while idle and
+# number of threads.
+#
+# Usage: python benchmarks/bench_input.py [--devices 3] [--presses 10]
+
+import sys
+import os
+import time
+import fcntl
+import errno
+import struct
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pycnc_config
+from pyJoy.EvdevHub import EvdevHub
+
+POLL_INTERVAL = 0.05
+EVENT_FORMAT = 'hh'
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+
+
+class FakeEvent(object):
+
+    def __init__(self, code, value):
+        self.type = 1 # EV_KEY
+        self.code = code
+        self.value = value
+        self.timestamp = time.time()
+
+
+class FakeDevice(object):
+    # an input device fed through a pipe
+
+    def __init__(self, name):
+        self.name = name
+        self.readFd, self.writeFd = os.pipe()
+        fcntl.fcntl(self.readFd, fcntl.F_SETFL, fcntl.fcntl(self.readFd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def fileno(self):
+        return self.readFd
+
+    def grab(self):
+        pass
+
+    def ungrab(self):
+        pass
+
+    def send(self, code, value):
+        os.write(self.writeFd, struct.pack(EVENT_FORMAT, code, value))
+
+    def read(self):
+        # like evdev: raises EAGAIN if there are no events
+        data = os.read(self.readFd, 4096)
+        if not data:
+            raise OSError(errno.ENODEV, "device closed")
+        for offset in range(0, len(data) - EVENT_SIZE + 1, EVENT_SIZE):
+            code, value = struct.unpack_from(EVENT_FORMAT, data, offset)
+            yield FakeEvent(code, value)
+
+    def close(self):
+        os.close(self.writeFd)
+
+    def readBlocking(self):
+        while True:
+            fcntl.fcntl(self.readFd, fcntl.F_SETFL, fcntl.fcntl(self.readFd, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+            data = os.read(self.readFd, EVENT_SIZE)
+            if not data:
+                return
+            yield FakeEvent(*struct.unpack(EVENT_FORMAT, data))
+
+
+class Recorder(object):
+    # receives the button events and their repeats
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+
+    def fire(self, device, code):
+        with self.lock:
+            self.events.append((time.time(), device, code))
+
+
+class PollingBackend(object):
+
+    def __init__(self, devices, recorder):
+        self.devices = devices
+        self.recorder = recorder
+        self.running = True
+        self.threads = [threading.Thread(target = self.run, args = (device,)) for device in devices]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def run(self, device):
+        state = {}
+        lastFired = {}
+        while self.running:
+            try:
+                for event in device.read():
+                    state[event.code] = event.value
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    return
+            now = time.time()
+            # the state of every button is rebuilt at every loop, as with pygame
+            buttonTimes = [now if state.get(code) else -1 for code in range(16)]
+            for code, pressed in enumerate(buttonTimes):
+                if pressed < 0:
+                    lastFired.pop(code, None)
+                elif code not in lastFired or (now - lastFired[code]) * 1000 > pycnc_config.BTN_REPEAT:
+                    lastFired[code] = now
+                    self.recorder.fire(device, code)
+            time.sleep(POLL_INTERVAL)
+
+    def stop(self):
+        self.running = False
+
+
+class ThreadsBackend(object):
+
+    def __init__(self, devices, recorder):
+        self.recorder = recorder
+        self.held = {}
+        self.threads = [threading.Thread(target = self.run, args = (device,)) for device in devices]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def run(self, device):
+        for event in device.readBlocking():
+            key = (device, event.code)
+            if event.value:
+                self.held[key] = True
+                thread = threading.Thread(target = self.repeat, args = (device, event.code))
+                thread.daemon = True
+                thread.start()
+            else:
+                self.held[key] = False
+
+    def repeat(self, device, code):
+        while self.held.get((device, code)):
+            self.recorder.fire(device, code)
+            time.sleep(pycnc_config.BTN_REPEAT / 1000.0)
+
+    def stop(self):
+        pass
+
+
+class HubBackend(object):
+
+    def __init__(self, devices, recorder):
+        self.hub = EvdevHub()
+        self.recorder = recorder
+        self.timers = {}
+        self.callbacks = {}
+        for device in devices:
+            self.callbacks[device] = lambda event, device = device: self.handleEvent(device, event)
+            self.hub.subscribe(device, self.callbacks[device])
+
+    def handleEvent(self, device, event):
+        key = (device, event.code)
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if event.value:
+            self.repeat(device, event.code)
+
+    def repeat(self, device, code):
+        self.recorder.fire(device, code)
+        self.timers[(device, code)] = self.hub.callLater(pycnc_config.BTN_REPEAT / 1000.0,
+                                                         lambda: self.repeat(device, code))
+
+    def stop(self):
+        for device, callback in self.callbacks.items():
+            self.hub.unsubscribe(device, callback)
+
+
+def cpuTime():
+    times = os.times()
+    return times[0] + times[1]
+
+def measure(backendClass, args):
+    devices = [FakeDevice("device %d" % i) for i in range(args.devices)]
+    recorder = Recorder()
+    threads = threading.active_count()
+    backend = backendClass(devices, recorder)
+    time.sleep(0.2)
+    threads = threading.active_count() - threads
+
+    latencies = []
+    intervals = []
+    for i in range(args.presses):
+        device = devices[i % len(devices)]
+        del recorder.events[:]
+        pressTime = time.time()
+        device.send(1, 1)
+        time.sleep(args.hold)
+        device.send(1, 0)
+        time.sleep(0.2)
+        times = [t for t, d, code in recorder.events if d is device]
+        if times:
+            latencies.append(times[0] - pressTime)
+            intervals.extend(b - a for a, b in zip(times[:-1], times[1:]))
+
+    idleStart = cpuTime()
+    time.sleep(args.idle)
+    idleCpu = (cpuTime() - idleStart) / args.idle
+    backend.stop()
+    for device in devices:
+        device.close()
+    time.sleep(POLL_INTERVAL * 2) # the threads of the backend end
+    return {'latency': sum(latencies) / len(latencies), 'maxLatency': max(latencies),
+            'interval': sum(intervals) / len(intervals) if intervals else float('nan'),
+            'maxInterval': max(intervals) if intervals else float('nan'), 'idleCpu': idleCpu,
+            'threads': threads}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the input devices handling")
+    parser.add_argument("--devices", type=int, default=3, help="number of input devices")
+    parser.add_argument("--presses", type=int, default=10, help="button presses")
+    parser.add_argument("--hold", type=float, default=0.55, help="time a button is held (s)")
+    parser.add_argument("--idle", type=float, default=3.0, help="idle time for the CPU measure (s)")
+    args = parser.parse_args()
+
+    for name, backendClass in [('polling', PollingBackend), ('threads', ThreadsBackend), ('hub', HubBackend)]:
+        result = measure(backendClass, args)
+        print "%-8s latency %5.1f ms (max %5.1f)   repeat every %5.1f ms (max %5.1f)   idle CPU %5.2f%%   threads %d" % (
+            name, result['latency'] * 1000, result['maxLatency'] * 1000, result['interval'] * 1000,
+            result['maxInterval'] * 1000, result['idleCpu'] * 100, result['threads'])
@@ -0,0 +1,156 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Jogging with Grbl 1.1 against the Grbl emulator (grbl_emulator.py), in real time:
+#  - engine: JogEngine, the jogger repeats the request every BTN_REPEAT and releases with a stop
+#  - legacy: one $J= move of BTN_REPEAT length for each repeat of the jogger, sent with a blocking command in a new
+#    thread and refused while the previous one runs (as JogHelper1_1 did before JogEngine), stopped with 0x85
+# For each: planner starvation while jogging (stutter), speed reached, latency of a change of direction, and latency
+# and overshoot of the stop (from the release to grbl Idle).
+#
+# Usage: python benchmarks/bench_jog.py [--feed 3000] [--time 2] [--repeats 5]
+
+import sys
+import os
+import math
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pycnc_config
+from gcode.GrblWriter import GrblWriter
+from gcode.JogEngine import JogEngine
+from grbl_emulator import EmulatorProcess
+
+POLL_INTERVAL = 0.002
+
+
+class LegacyJogger:
+    # the jog of JogHelper1_1 before JogEngine
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.busy = False
+
+    def jog(self, xyz, feed):
+        if self.busy:
+            return # the event is dropped
+        travelDistance = pycnc_config.BTN_REPEAT * float(feed) / 60 / 1000
+        factor = travelDistance / math.sqrt(sum(c ** 2 for c in xyz))
+        command = "$J=G91 X%.1f Y%.1f Z%.1f F%d" % (xyz[0] * factor, xyz[1] * factor, xyz[2] * factor, feed)
+        self.busy = True
+        thread = threading.Thread(target = self.run, args = (command,))
+        thread.start()
+
+    def run(self, command):
+        self.writer.do_command(command)
+        self.writer.update_position()
+        self.busy = False
+
+    def stop(self):
+        self.writer.cancelJog()
+        while self.busy:
+            time.sleep(0.001)
+        self.writer.wait_motion()
+        self.writer.update_position()
+
+    def waitIdle(self):
+        pass
+
+
+def waitFor(emulator, condition, timeout = 2.0):
+    # time until the emulator statistics satisfy condition (None on timeout)
+    start = time.time()
+    while time.time() - start < timeout:
+        stats = emulator.getStats()
+        if condition(stats):
+            return time.time() - start, stats
+        time.sleep(POLL_INTERVAL)
+    return None, emulator.getStats()
+
+def holdJog(jogger, xyz, feed, duration):
+    # the jogger repeats the move every BTN_REPEAT while the button is held
+    end = time.time() + duration
+    while time.time() < end:
+        jogger.jog(xyz, feed)
+        time.sleep(pycnc_config.BTN_REPEAT / 1000.0)
+
+def measure(jogger, emulator, feed, duration):
+    emulator.resetStats()
+    start = emulator.getStats()['position']
+    startTime = time.time()
+    holdJog(jogger, (1, 0, 0), feed, duration)
+    stats = emulator.getStats()
+    elapsed = time.time() - startTime
+    speed = (stats['position'][0] - start[0]) / elapsed * 60
+    starvation = stats['plannerEmptyTime']
+
+    # change of direction: +X to +Y, time until Y moves
+    y0 = stats['position'][1]
+    jogger.jog((0, 1, 0), feed)
+    changeLatency, stats = waitFor(emulator, lambda s: s['position'][1] > y0 + 0.005)
+    holdJog(jogger, (0, 1, 0), feed, 0.5)
+
+    # release: the emulator records when the motion stopped
+    released = emulator.getStats()['position']
+    stopTime = time.time()
+    jogger.stop()
+    waitFor(emulator, lambda s: s['state'] == 'Idle')
+    jogger.waitIdle()
+    stats = emulator.getStats()
+    stopLatency = stats['idleTime'] - stopTime if stats['idleTime'] is not None else None
+    overshoot = math.sqrt(sum((a - b) ** 2 for a, b in zip(stats['position'], released)))
+    return {'speed': speed, 'starvation': starvation / elapsed, 'changeLatency': changeLatency,
+            'stopLatency': stopLatency, 'overshoot': overshoot}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the jogging against the Grbl emulator")
+    parser.add_argument("--feed", type=float, default=3000, help="jog feed (mm/min)")
+    parser.add_argument("--time", type=float, default=2.0, help="duration of the continuous jog (s)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.001, help="processing time of each line in the emulator (s)")
+    parser.add_argument("--acceleration", type=float, default=100.0, help="acceleration of the emulator (mm/s^2, $120)")
+    args = parser.parse_args()
+
+    emulator = EmulatorProcess(lineLatency=args.latency, acceleration=args.acceleration)
+    pycnc_config.SERIAL_PATTERN = emulator.start()
+    pycnc_config.SERIAL_DEBUG = False
+    writer = GrblWriter()
+    if not writer.open():
+        print "Cannot connect to the emulator on %s" % pycnc_config.SERIAL_PATTERN
+        sys.exit(1)
+
+    engine = JogEngine()
+    engine.setGrbl(writer)
+    engine.start()
+    try:
+        for name, jogger in [('legacy', LegacyJogger(writer)), ('engine', engine)]:
+            results = [measure(jogger, emulator, args.feed, args.time) for i in range(args.repeats)]
+            def mean(key):
+                values = [r[key] for r in results if r[key] is not None]
+                return sum(values) / len(values) if values else float('nan')
+            print "%-8s speed %6.0f mm/min   starved %5.1f%%   direction change %6.1f ms   stop %6.1f ms   overshoot %.3f mm" % (
+                name, mean('speed'), mean('starvation') * 100, mean('changeLatency') * 1000, mean('stopLatency') * 1000,
+                mean('overshoot'))
+    finally:
+        engine.shutdown()
+        writer.close()
+        emulator.stop()
@@ -0,0 +1,226 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Analog joystick jogging against the Grbl emulator (grbl_emulator.py), with a synthetic stick in real time: the stick
+# sends events at --event-rate with some noise, rests at the center, is deflected fully, then halfway, and released.
+#  - legacy: every event is sent as a jog unless it comes within 20 ms of the previous one, the last one is repeated
+#    every BTN_REPEAT, and the feed is linear in the deflection (as JoyJogThread did before JoyVelocity)
+#  - velocity: JoyVelocity (dead zone, response curve, filter, commands sent at JOY_SEND_RATE)
+# Both drive a JogEngine. For each: jog commands per second, motion while the stick rests at the center, latency from
+# the deflection to the motion and from the release to the stop, and the speed at full and half deflection.
+#
+# Usage: python benchmarks/bench_joystick.py [--event-rate 250] [--noise 0.03]
+
+import sys
+import os
+import math
+import time
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pycnc_config
+from gcode.GrblWriter import GrblWriter
+from gcode.JogEngine import JogEngine
+from pyJoy.JoyVelocity import VelocityFilter, responseCurve, velocityToJog
+from grbl_emulator import EmulatorProcess
+
+LEGACY_MIN_INTERVAL = 0.02
+TICK = 0.002 # resolution of the timers of the pipelines
+
+
+class LegacyPipeline:
+    # the joystick jogging of JoyJogThread before JoyVelocity
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.move = None
+        self.lastEvent = 0
+        self.nextRepeat = None
+        self.commands = 0
+
+    def input(self, x):
+        if x == 0:
+            self.move = None
+            self.nextRepeat = None
+            self.engine.stop()
+            return
+        self.move = [x, 0, 0]
+        now = time.time()
+        if now - self.lastEvent < LEGACY_MIN_INTERVAL:
+            return # the event is dropped
+        self.lastEvent = now
+        self.send()
+        self.nextRepeat = now + pycnc_config.BTN_REPEAT / 1000.0
+
+    def tick(self, now):
+        if self.nextRepeat is not None and now >= self.nextRepeat:
+            self.send()
+            self.nextRepeat += pycnc_config.BTN_REPEAT / 1000.0
+
+    def send(self):
+        move = self.move
+        if move is None:
+            return
+        length = math.sqrt(sum(c ** 2 for c in move))
+        feed = pycnc_config.MIN_FEED + min(1.0, length) * (pycnc_config.MAX_FEED - pycnc_config.MIN_FEED)
+        self.engine.jog(move, feed)
+        self.commands += 1
+
+
+class VelocityPipeline:
+    # JoyJogThread with JoyVelocity
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.filter = VelocityFilter()
+        self.moving = False
+        self.nextSample = 0
+        self.commands = 0
+
+    def input(self, x):
+        self.filter.setTarget([responseCurve(x), 0, 0])
+        if not self.filter.isStopped():
+            self.moving = True
+        elif self.moving:
+            self.moving = False
+            self.engine.stop()
+
+    def tick(self, now):
+        if now < self.nextSample:
+            return
+        self.nextSample = now + 1.0 / pycnc_config.JOY_SEND_RATE
+        if not self.moving:
+            return
+        jog = velocityToJog(self.filter.sample(now))
+        if jog is not None:
+            self.engine.jog(*jog)
+            self.commands += 1
+
+
+def stickTrace(rest, hold):
+    # (duration, deflection) of the phases of the stick
+    return [(rest, 0.0), (hold, 1.0), (hold, 0.5), (rest, None)] # None: released exactly at the center
+
+def run(pipeline, emulator, trace, eventRate, noise):
+    # feed the stick events and the timer of the pipeline; returns the times and positions of the phase changes
+    events = 0
+    marks = []
+    for duration, deflection in trace:
+        start = time.time()
+        marks.append((start, emulator.getStats()['position'][0]))
+        nextEvent = start
+        released = False
+        while time.time() - start < duration:
+            now = time.time()
+            if now >= nextEvent:
+                if deflection is None:
+                    if not released:
+                        pipeline.input(0.0)
+                        released = True
+                        events += 1
+                else:
+                    pipeline.input(max(-1.0, min(1.0, deflection + random.uniform(-noise, noise))))
+                    events += 1
+                nextEvent += 1.0 / eventRate
+            pipeline.tick(now)
+            time.sleep(TICK)
+    marks.append((time.time(), emulator.getStats()['position'][0]))
+    return events, marks
+
+def firstTime(emulator, condition, timeout = 2.0):
+    start = time.time()
+    while time.time() - start < timeout:
+        stats = emulator.getStats()
+        if condition(stats):
+            return stats
+        time.sleep(0.002)
+    return None
+
+def measure(name, pipelineClass, engine, emulator, args):
+    emulator.resetStats()
+    pipeline = pipelineClass(engine)
+    trace = stickTrace(args.rest, args.hold)
+    result = {}
+
+    # deflection latency: watched in a separate thread while the trace runs
+    deflected = {}
+    def watch():
+        startTime = time.time() + args.rest
+        x0 = emulator.getStats()['position'][0]
+        while time.time() < startTime:
+            x0 = emulator.getStats()['position'][0]
+            time.sleep(0.002)
+        if firstTime(emulator, lambda s: s['position'][0] > x0 + 0.01, args.hold) is not None:
+            deflected['latency'] = time.time() - startTime
+    watcher = threading.Thread(target = watch)
+    watcher.start()
+    events, marks = run(pipeline, emulator, trace, args.event_rate, args.noise)
+    watcher.join()
+    engine.waitIdle()
+
+    (t0, x0), (t1, x1), (t2, x2), (t3, x3), (t4, x4) = marks
+    stats = emulator.getStats()
+    result['commandRate'] = pipeline.commands / (t4 - t0)
+    result['eventRate'] = events / (t4 - t0)
+    result['restMotion'] = abs(x1 - x0)
+    result['deflectLatency'] = deflected.get('latency')
+    # speed in the second half of each phase, when the speed settled
+    result['fullSpeed'] = (x2 - x1) / (t2 - t1) * 60
+    result['halfSpeed'] = (x3 - x2) / (t3 - t2) * 60
+    result['releaseLatency'] = stats['idleTime'] - t3 if stats['idleTime'] is not None and stats['idleTime'] >= t3 else None
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analog joystick jogging against the Grbl emulator")
+    parser.add_argument("--event-rate", type=float, default=250, help="events per second sent by the stick")
+    parser.add_argument("--noise", type=float, default=0.03, help="noise of the stick, as a fraction of the range")
+    parser.add_argument("--rest", type=float, default=0.5, help="time at the center (s)")
+    parser.add_argument("--hold", type=float, default=1.5, help="time at each deflection (s)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--acceleration", type=float, default=100.0, help="acceleration of the emulator (mm/s^2, $120)")
+    args = parser.parse_args()
+
+    emulator = EmulatorProcess(acceleration=args.acceleration)
+    pycnc_config.SERIAL_PATTERN = emulator.start()
+    pycnc_config.SERIAL_DEBUG = False
+    writer = GrblWriter()
+    if not writer.open():
+        print "Cannot connect to the emulator on %s" % pycnc_config.SERIAL_PATTERN
+        sys.exit(1)
+
+    engine = JogEngine()
+    engine.setGrbl(writer)
+    engine.start()
+    try:
+        for name, pipelineClass in [('legacy', LegacyPipeline), ('velocity', VelocityPipeline)]:
+            results = [measure(name, pipelineClass, engine, emulator, args) for i in range(args.repeats)]
+            def mean(key):
+                values = [r[key] for r in results if r[key] is not None]
+                return sum(values) / len(values) if values else float('nan')
+            print ("%-9s events %4.0f/s  commands %5.1f/s  motion at rest %5.2f mm  deflection %5.0f ms  release %5.1f ms"
+                   "  speed full %5.0f half %5.0f mm/min") % (
+                name, mean('eventRate'), mean('commandRate'), mean('restMotion'), mean('deflectLatency') * 1000,
+                mean('releaseLatency') * 1000, mean('fullSpeed'), mean('halfSpeed'))
+    finally:
+        engine.shutdown()
+        writer.close()
+        emulator.stop()
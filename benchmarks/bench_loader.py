@@ -0,0 +1,86 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark of the gcode loader: load time and peak memory for large files, with the lines kept
+# in memory and with the offset index used for large files (LOADER_INDEX_SIZE).
+# Each measurement is run in a separate process, so that the peak memory of a run does not affect the others.
+#
+# Usage: python benchmarks/bench_loader.py [-s SIZE_MB ...] [--no-planner]
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import subprocess
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gcode.GCodeIndex import analyzeFile
+from bench_analyzer import generateRelief
+
+# typical settings of a small hobby machine, used for the acceleration-aware estimation
+GRBL_SETTINGS = {11: 0.01, 12: 0.002, 110: 2000.0, 111: 2000.0, 112: 500.0, 120: 50.0, 121: 50.0, 122: 50.0}
+
+BYTES_PER_LINE = 31 # average line length of the synthetic relief
+
+
+def measure(fileName, lowMemory, planner):
+    # runs in the child process: load the file and print time and peak memory
+    start = time.time()
+    result = analyzeFile(fileName, 5000, GRBL_SETTINGS if planner else None, lowMemory)
+    elapsed = time.time() - start
+    peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # kB on Linux
+    print "%d %f %f %f" % (len(result.gcode), elapsed, peakRss / 1024.0, result.totalTime)
+
+
+def runMeasure(fileName, lowMemory, planner):
+    command = [sys.executable, os.path.abspath(__file__), '--measure', fileName]
+    if lowMemory:
+        command.append('--index')
+    if not planner:
+        command.append('--no-planner')
+    output = subprocess.check_output(command).split()
+    return int(output[0]), float(output[1]), float(output[2]), float(output[3])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the gcode loader")
+    parser.add_argument("-s", "--size", type=int, nargs="+", default=[10, 100, 300], help="file sizes in MB")
+    parser.add_argument("--no-planner", action="store_true", help="use the simple time estimation")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--index", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.index, not args.no_planner)
+        sys.exit(0)
+
+    print "%8s %10s %12s %10s %12s %10s %10s" % ("Size MB", "Lines", "Mode", "Time (s)", "Lines/s", "Peak MB", "Job (s)")
+    for size in args.size:
+        fd, fileName = tempfile.mkstemp(suffix='.nc')
+        os.close(fd)
+        try:
+            generateRelief(fileName, size * 1024 * 1024 / BYTES_PER_LINE)
+            for lowMemory in (False, True):
+                nLines, elapsed, peak, jobTime = runMeasure(fileName, lowMemory, not args.no_planner)
+                print "%8d %10d %12s %10.1f %12.0f %10.0f %10.0f" % (size, nLines, "index" if lowMemory else "in memory",
+                                                                    elapsed, nLines / elapsed, peak, jobTime)
+        finally:
+            os.remove(fileName)
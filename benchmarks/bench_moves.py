@@ -0,0 +1,104 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Memory of the parsed moves, per million lines: MovementGCode objects with a __dict__ (as they were before) and
+# with __slots__. Also reports the analysis speed with and without the creation of a MovementGCode for every move.
+#
+# Usage: python benchmarks/bench_moves.py [-n LINES]
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gcode.GCodeAnalyzer import GCodeAnalyzer, MovementGCode
+from bench_analyzer import generateRelief
+
+
+class DictMovement:
+    # MovementGCode before __slots__
+    def __init__(self, g):
+        self.g = g
+        self.x = None
+        self.y = None
+        self.i = None
+        self.j = None
+        self.z = None
+        self.e = None
+        self.f = None
+        self.startX = None
+        self.startY = None
+        self.startZ = None
+
+
+def currentRss():
+    # resident memory in bytes (Linux)
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def objectMemory(cls, n):
+    # memory used by n moves stored as objects, with distinct float coordinates
+    before = currentRss()
+    moves = []
+    for k in xrange(n):
+        move = cls(1)
+        move.startX, move.startY, move.startZ = k * 0.1, k * 0.2, k * 0.3
+        move.x, move.y, move.z = k * 0.1 + 0.05, k * 0.2 + 0.05, k * 0.3 + 0.05
+        move.f = 1000.0
+        moves.append(move)
+    return currentRss() - before
+
+
+def analyze(fileName, trackMovements):
+    analyzer = GCodeAnalyzer()
+    analyzer.trackMovements = trackMovements
+    start = time.time()
+    nLines = 0
+    with open(fileName) as f:
+        for line in f:
+            analyzer.Analyze(line)
+            nLines += 1
+    return nLines, time.time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory of the parsed moves")
+    parser.add_argument("-n", "--lines", type=int, default=1000000, help="number of lines of the synthetic file")
+    args = parser.parse_args()
+
+    perMillion = 1e6 / args.lines
+    print "Memory per million moves:"
+    print "  %-28s %8.1f MB" % ("MovementGCode with __dict__", objectMemory(DictMovement, args.lines) * perMillion / 2**20)
+    print "  %-28s %8.1f MB" % ("MovementGCode with __slots__", objectMemory(MovementGCode, args.lines) * perMillion / 2**20)
+
+    fd, fileName = tempfile.mkstemp(suffix='.nc')
+    os.close(fd)
+    try:
+        generateRelief(fileName, args.lines)
+        nLines, trackedTime = analyze(fileName, True)
+        nLines, untrackedTime = analyze(fileName, False)
+    finally:
+        os.remove(fileName)
+
+    print "Analysis speed:"
+    print "  %-28s %8.0f lines/s" % ("with MovementGCode", nLines / trackedTime)
+    print "  %-28s %8.0f lines/s" % ("without MovementGCode", nLines / untrackedTime)
@@ -0,0 +1,81 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark of the parallel analysis of large gcode files, compared with the sequential analysis.
+# The results of both are compared, and must be the same.
+#
+# Usage: python benchmarks/bench_parallel.py [-n LINES] [-p PROCESSES ...] [--no-planner] [file.nc]
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gcode.GCodeIndex import analyzeFile
+from gcode.ParallelAnalysis import analyzeFileParallel
+from bench_analyzer import generateRelief
+from bench_loader import GRBL_SETTINGS
+
+
+def compareResults(serial, parallel):
+    if serial.bBox != parallel.bBox:
+        return "bounding box differs"
+    if len(serial.times) != len(parallel.times):
+        return "number of lines differs"
+    maxDiff = max([abs(a - b) for a, b in zip(serial.times, parallel.times)] + [0])
+    if maxDiff > 1e-6:
+        return "times differ by up to %g s" % maxDiff
+    return "same"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the parallel gcode analysis")
+    parser.add_argument("-n", "--lines", type=int, default=2000000, help="number of lines of the synthetic file")
+    parser.add_argument("-p", "--processes", type=int, nargs="+", default=[2, 4], help="numbers of processes to test")
+    parser.add_argument("--no-planner", action="store_true", help="use the simple time estimation")
+    parser.add_argument("file", nargs="?", help="G-code file to analyze (default: synthetic file)")
+    args = parser.parse_args()
+
+    fileName = args.file
+    if fileName is None:
+        fd, fileName = tempfile.mkstemp(suffix='.nc')
+        os.close(fd)
+        print "Generating %d lines in %s" % (args.lines, fileName)
+        generateRelief(fileName, args.lines)
+
+    grblConfig = None if args.no_planner else GRBL_SETTINGS
+    print "Cores: %d" % multiprocessing.cpu_count()
+    try:
+        start = time.time()
+        serial = analyzeFile(fileName, 5000, grblConfig)
+        serialTime = time.time() - start
+        print "%-12s %10.1f s %8.2fx" % ("sequential", serialTime, 1.0)
+
+        for processes in args.processes:
+            start = time.time()
+            parallel = analyzeFileParallel(fileName, 5000, grblConfig, False, processes)
+            elapsed = time.time() - start
+            print "%-12s %10.1f s %8.2fx   results: %s" % ("%d processes" % processes, elapsed, serialTime / elapsed,
+                                                         compareResults(serial, parallel))
+    finally:
+        if args.file is None:
+            os.remove(fileName)
@@ -0,0 +1,104 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Per-line cost of preparing the gcode lines for grbl, before and after GCodePreprocessor:
+#  - before: what the streaming loop did for every line (truncateGCode with a callback, one regex compiled for each
+#    suppressed code, strip)
+#  - lazy: prepareGCode for every line while streaming (PreparedLines)
+#  - prepared: the commands prepared at load time (prepareLines), the loop only reads them
+# The Analyze of the line, which is only done when sending if the position is not polled, is measured for reference.
+#
+# Usage: python benchmarks/bench_send.py [-n LINES] [file]
+
+import sys
+import os
+import re
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pycnc_config
+from gcode.GCodeAnalyzer import GCodeAnalyzer
+from gcode.GCodePreprocessor import PreparedLines, prepareLines
+
+
+# --- preparation before GCodePreprocessor ---
+
+def oldTruncateGCode(gcode):
+    def replace(match):
+        match = match.group(2)
+        return "." + match[0:4]
+
+    pattern = re.compile(r"([.])([0-9]+)")
+    return re.sub(pattern, replace, gcode)
+
+def oldSuppressGCode(gcodeLine, toSuppress):
+    gcodefinder = re.compile(toSuppress + '(?![0-9.])[^MG]*', re.I)
+    return gcodefinder.sub('', gcodeLine)
+
+def oldPrepare(line):
+    line = oldTruncateGCode(line).strip()
+    for gcode in pycnc_config.SUPPRESS_GCODE:
+        line = oldSuppressGCode(line, gcode)
+    return line
+
+
+def testLines(n):
+    # finishing moves with the usual precision of CAM output, and a few comments and tool changes
+    lines = []
+    for i in range(n):
+        if i % 500 == 0:
+            lines.append('(pass %d)\n' % (i // 500))
+        elif i % 5000 == 1:
+            lines.append('M6 T1\n')
+        else:
+            lines.append('G1 X%.6f Y%.6f Z%.6f F1200\n' % (i * 0.05, (i % 300) * 0.05, -0.1 - (i % 7) * 0.013))
+    return lines
+
+def timeLoop(name, lines, function):
+    start = time.time()
+    for line in function(lines):
+        pass
+    elapsed = time.time() - start
+    print "%-10s %8.2f us/line   %10.0f lines/s" % (name, elapsed / len(lines) * 1e6, len(lines) / elapsed)
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the preparation of the gcode lines for grbl")
+    parser.add_argument("-n", "--lines", type=int, default=200000, help="number of lines of the synthetic job")
+    parser.add_argument("file", nargs="?", help="G-code file (default: synthetic job)")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file) as f:
+            lines = f.readlines()
+    else:
+        lines = testLines(args.lines)
+    print "Lines: %d" % len(lines)
+
+    before = timeLoop("before", lines, lambda lines: (oldPrepare(line) for line in lines))
+    timeLoop("lazy", lines, lambda lines: PreparedLines(lines))
+    start = time.time()
+    commands = prepareLines(lines)
+    print "%-10s %8.2f us/line   (once, when the file is loaded)" % ("load", (time.time() - start) / len(lines) * 1e6)
+    after = timeLoop("prepared", lines, lambda lines: (commands[i] for i in xrange(len(lines))))
+    analyzer = GCodeAnalyzer(False)
+    timeLoop("analyze", lines, lambda lines: (analyzer.Analyze(commands[i]) for i in xrange(len(lines))))
+    print "Per-line overhead in the streaming loop: %.1fx lower" % (before / after)
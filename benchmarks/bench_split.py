@@ -0,0 +1,90 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark of the segment splitting used by the Z compensation: the generator-based splitter (splitPoints)
+# compared with the recursive halving that was used before (reproduced here for reference).
+#
+# Usage: python benchmarks/bench_split.py [-l LENGTH] [-s SPACING] [-n MOVES]
+
+import sys
+import os
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gcode.GCodeAnalyzer import GCodeAnalyzer, MovementGCode, euclidean_distance
+
+
+def recursiveSplit(move, maxDistance):
+    # the old MovementGCode.splitMovement
+    if move.isArc():
+        return [move]
+    if euclidean_distance((move.startX, move.startY, move.startZ), (move.x, move.y, move.z)) <= maxDistance:
+        return [move]
+    first = MovementGCode(move.g)
+    first.f = move.f
+    first.startX, first.startY, first.startZ = move.startX, move.startY, move.startZ
+    first.x, first.y, first.z = (move.startX + move.x) / 2, (move.startY + move.y) / 2, (move.startZ + move.z) / 2
+    second = MovementGCode(move.g)
+    second.f = move.f
+    second.startX, second.startY, second.startZ = first.x, first.y, first.z
+    second.x, second.y, second.z = move.x, move.y, move.z
+    outList = []
+    outList.extend(recursiveSplit(first, maxDistance))
+    outList.extend(recursiveSplit(second, maxDistance))
+    return outList
+
+
+def makeMove(command):
+    analyzer = GCodeAnalyzer(False)
+    analyzer.Analyze("G0 X0 Y0 Z0")
+    analyzer.Analyze(command)
+    return analyzer.lastMovementGCode
+
+
+def timeIt(function, nMoves):
+    start = time.time()
+    for i in xrange(nMoves):
+        result = function()
+    return (time.time() - start) / nMoves, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the move splitting")
+    parser.add_argument("-l", "--length", type=float, default=200.0, help="length of the line (mm)")
+    parser.add_argument("-s", "--spacing", type=float, default=1.0, help="max segment length (mm)")
+    parser.add_argument("-n", "--moves", type=int, default=2000, help="number of moves to split")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.01, help="arc tolerance (mm)")
+    args = parser.parse_args()
+
+    line = makeMove("G1 X%f Y0 Z-1 F1000" % args.length)
+    arc = makeMove("G2 X%f Y0 I%f J0 F1000" % (args.length / 2, args.length / 4))
+
+    oldTime, oldSegments = timeIt(lambda: recursiveSplit(line, args.spacing), args.moves)
+    newTime, newSegments = timeIt(lambda: list(line.splitPoints(args.spacing)), args.moves)
+    oldLengths = [euclidean_distance((m.startX, m.startY, m.startZ), (m.x, m.y, m.z)) for m in oldSegments]
+
+    print "%.0f mm line, max %.2f mm segments:" % (args.length, args.spacing)
+    print "  %-12s %6d segments (%.3f-%.3f mm) %10.1f us/move" % ("recursive", len(oldSegments), min(oldLengths), max(oldLengths), oldTime * 1e6)
+    print "  %-12s %6d segments (%.3f mm) %16.1f us/move" % ("splitPoints", len(newSegments), args.length / len(newSegments), newTime * 1e6)
+    print "  speedup: %.1fx" % (oldTime / newTime)
+
+    arcTime, arcPoints = timeIt(lambda: list(arc.splitPoints(args.spacing, args.tolerance)), args.moves)
+    print "Half circle, radius %.1f mm, tolerance %.3f mm: %d chords, %.1f us/move (the recursive splitter did not split arcs)" % (
+        args.length / 4, args.tolerance, len(arcPoints), arcTime * 1e6)
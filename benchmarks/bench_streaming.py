@@ -0,0 +1,276 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# End-to-end streaming benchmark: representative jobs are streamed by the GCodeStreamer and the GrblWriter to the
+# Grbl emulator (grbl_emulator.py), through a pseudo-terminal. For each workload it reports:
+#  - lines per second (while streaming, and over the whole job including the end of the motion)
+#  - mean and 99th percentile of the ack latency (time between sending a line and seeing its ok)
+#  - time the emulated planner was empty during the job (starvation)
+#  - CPU time per line (all the threads of the host: streamer, reader and status poller)
+# The results can be saved as JSON and compared with a previous run.
+#
+# Requires pyserial.
+#
+# Usage: python benchmarks/bench_streaming.py [-n LINES] [--time-scale 10] [-o results.json] [--compare old.json]
+
+import sys
+import os
+import time
+import math
+import json
+import random
+import argparse
+from array import array
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pycnc_config
+from gcode.GrblWriter import GrblWriter
+from gcode.GCodeStreamer import GCodeStreamer
+from gcode.CompiledJob import compileJob
+from gcode import ZCompensation as zcomp
+from grbl_emulator import EmulatorProcess
+
+GRID_SIZE = 100.0 # size of the Z compensation grid and of the compensated workloads (mm)
+
+
+# --- workloads ---
+
+def straightLines(nLines):
+    # long raster passes
+    lines = ['G0 Z5', 'G0 X0 Y0', 'G1 Z-1 F6000']
+    for i in range(nLines - len(lines)):
+        x = 10.0 * (i % 2)
+        lines.append('G1 X%.3f Y%.3f' % (x, (i // 2) * 0.5))
+    return lines
+
+def finishing3D(nLines):
+    # 3D finishing: 0.05 mm segments over a wavy surface
+    lines = ['G0 Z5', 'G0 X0 Y0', 'G1 Z-1 F1500']
+    x = 0.0
+    y = 0.0
+    direction = 1
+    for i in range(nLines - len(lines)):
+        x += 0.05 * direction
+        if x > 20.0 or x < 0.0:
+            direction = -direction
+            x += 0.05 * direction
+            y += 0.05
+        z = -1.0 + 0.3 * math.sin(x / 2.0) * math.cos(y / 3.0)
+        lines.append('G1 X%.4f Y%.4f Z%.4f' % (x, y, z))
+    return lines
+
+def arcEngraving(nLines):
+    # small arcs, as in text engraving
+    lines = ['G0 Z5', 'G0 X0 Y0', 'G1 Z-0.2 F1200']
+    x = 0.0
+    y = 0.0
+    for i in range(nLines - len(lines)):
+        # quarter circles of 0.5 mm radius, alternating the direction
+        if i % 2 == 0:
+            lines.append('G2 X%.3f Y%.3f I0.5 J0' % (x + 0.5, y - 0.5))
+            x, y = x + 0.5, y - 0.5
+        else:
+            lines.append('G3 X%.3f Y%.3f I0 J0.5' % (x + 0.5, y + 0.5))
+            x, y = x + 0.5, y + 0.5
+        if x > 50.0:
+            x = 0.0
+            y += 2.0
+            lines.append('G1 X0 Y%.3f' % y)
+    return lines[:nLines]
+
+def zCompensatedEngraving(nLines):
+    # engraving moves of a few mm inside the Z compensation grid
+    random.seed(0)
+    lines = ['G0 Z5', 'G0 X50 Y50', 'G1 Z-0.2 F1200']
+    for i in range(nLines - len(lines)):
+        lines.append('G1 X%.3f Y%.3f' % (random.uniform(48.0, 52.0), random.uniform(48.0, 52.0)))
+    return lines
+
+WORKLOADS = [('straight', straightLines, None),
+             ('finishing', finishing3D, None),
+             ('arcs', arcEngraving, None),
+             ('zcomp', zCompensatedEngraving, 'live'), # compensated while streaming
+             ('zcomp-compiled', zCompensatedEngraving, 'compiled')] # compiled before streaming
+
+
+def makeGrid():
+    zComp = zcomp.ZCompensation(GRID_SIZE, GRID_SIZE, 5.0)
+    random.seed(1)
+    for index in range(len(zComp.getProbePoints())):
+        zComp.setZValue(index, random.uniform(-0.2, 0.2))
+    return zComp
+
+
+# --- instrumented writer ---
+
+class TimedGrblWriter(GrblWriter):
+    # GrblWriter that records the time between sending each line and receiving its ack
+
+    def __init__(self):
+        GrblWriter.__init__(self)
+        self.sendTimes = deque()
+        self.latencies = []
+
+    def send_nonblock(self, command, lineNumber = None):
+        pending = len(self.pendingLines)
+        GrblWriter.send_nonblock(self, command, lineNumber)
+        if len(self.pendingLines) > pending:
+            self.sendTimes.append(time.time())
+
+    def _pop_pending_line(self):
+        if self.sendTimes:
+            self.latencies.append(time.time() - self.sendTimes.popleft())
+        return GrblWriter._pop_pending_line(self)
+
+    def do_compensated_move(self, lastMoveCommand):
+        # same as GrblWriter.do_compensated_move, timing each command
+        response = None
+        for command in self.zCompensation.compensateMove(lastMoveCommand):
+            sent = time.time()
+            self.serial.write(command + '\n')
+            response = self.read_response()
+            self.latencies.append(time.time() - sent)
+        return response
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def runWorkload(writer, emulator, gcode, zMode, zComp):
+    streamer = GCodeStreamer()
+    streamer.setGrbl(writer)
+    compiled = None
+    if zMode == 'compiled':
+        compiled = compileJob(gcode, array('d', [0.0] * len(gcode)), zComp, writer.prepare_command)
+        streamer.setGcode(compiled.gcode, True, compiled.commands)
+    else:
+        streamer.setGcode(gcode)
+    writer.zCompensation = zComp if zMode is not None else None
+    writer.compensate_z(zMode is not None)
+
+    updates = [0] # progress and position events, each of them is a signal to the GUI thread
+    def countUpdate(*args):
+        updates[0] += 1
+    streamer.progress_event.connect(countUpdate)
+    writer.position_updated.connect(countUpdate)
+
+    writer.sendTimes.clear()
+    writer.latencies = []
+    emulator.resetStats()
+    cpuStart = sum(os.times()[:2])
+    start = time.time()
+    streamer.run() # synchronously, in this thread
+    elapsed = time.time() - start
+    cpu = sum(os.times()[:2]) - cpuStart
+    stats = emulator.getStats()
+
+    writer.grbl_error.disconnect(streamer.grblError)
+    writer.position_updated.disconnect(countUpdate)
+    writer.compensate_z(False)
+    writer.zCompensation = None
+    if compiled is not None:
+        compiled.close()
+
+    nLines = len(gcode)
+    latencies = writer.latencies
+    return {'lines': nLines,
+            'commands': stats['lines'], # lines received by Grbl
+            'elapsed': elapsed,
+            'streamingLinesPerSecond': streamer.linesPerSecond,
+            'linesPerSecond': nLines / elapsed,
+            'meanAckLatency': sum(latencies) / len(latencies) if latencies else 0.0,
+            'p99AckLatency': percentile(latencies, 0.99),
+            'plannerEmptyTime': stats['plannerEmptyTime'],
+            'plannerBusyTime': stats['busyTime'],
+            'cpuPerLine': cpu / nLines,
+            'grblErrors': stats['errors'],
+            'overflowBytes': stats['overflowBytes'],
+            'uiUpdatesPerSecond': updates[0] / elapsed}
+
+
+def printResults(results, baseline = None):
+    metrics = ['linesPerSecond', 'streamingLinesPerSecond', 'meanAckLatency', 'p99AckLatency', 'plannerEmptyTime', 'cpuPerLine', 'uiUpdatesPerSecond']
+    print "%-16s" % "workload" + ''.join("%16s" % m[:15] for m in metrics)
+    for name in [w[0] for w in WORKLOADS if w[0] in results]:
+        result = results[name]
+        print "%-16s" % name + ''.join("%16.4g" % result[m] for m in metrics)
+        if baseline is not None and name in baseline:
+            print "%-16s" % "  vs baseline" + ''.join(
+                "%15.1f%%" % (100.0 * (result[m] / baseline[name][m] - 1)) if baseline[name].get(m) else "%16s" % '-'
+                for m in metrics)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the streaming of gcode to the Grbl emulator")
+    parser.add_argument("-n", "--lines", type=int, default=2000, help="lines per workload")
+    parser.add_argument("-w", "--workload", action='append', choices=[w[0] for w in WORKLOADS], help="workloads to run (default: all)")
+    parser.add_argument("--time-scale", type=float, default=10.0, help="the emulator moves this many times faster than a real machine")
+    parser.add_argument("--latency", type=float, default=0.001, help="processing time of each line in the emulator (s)")
+    parser.add_argument("--protocol", choices=['charcount', 'simple'], default=pycnc_config.STREAMING_PROTOCOL)
+    parser.add_argument("--transport", choices=['threads', 'select'], default=pycnc_config.SERIAL_TRANSPORT)
+    parser.add_argument("--poll-rate", type=float, default=pycnc_config.STATUS_POLL_RATE, help="status reports per second")
+    parser.add_argument("--update-rate", type=float, default=pycnc_config.PROGRESS_UPDATE_RATE, help="maximum progress updates per second")
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with")
+    args = parser.parse_args()
+
+    emulator = EmulatorProcess(lineLatency=args.latency, timeScale=args.time_scale)
+    pycnc_config.SERIAL_PATTERN = emulator.start()
+    pycnc_config.STREAMING_PROTOCOL = args.protocol
+    pycnc_config.STATUS_POLL_RATE = args.poll_rate
+    pycnc_config.SERIAL_TRANSPORT = args.transport
+    pycnc_config.PROGRESS_UPDATE_RATE = args.update_rate
+    pycnc_config.SERIAL_DEBUG = False
+
+    writer = TimedGrblWriter()
+    if not writer.open():
+        print "Cannot connect to the emulator on %s" % pycnc_config.SERIAL_PATTERN
+        sys.exit(1)
+
+    sys.stdout = open(os.devnull, 'w') # the grid construction prints all the points
+    zComp = makeGrid()
+    sys.stdout = sys.__stdout__
+
+    results = {}
+    try:
+        for name, generator, zMode in WORKLOADS:
+            if args.workload and name not in args.workload:
+                continue
+            print "Running %s..." % name
+            results[name] = runWorkload(writer, emulator, generator(args.lines), zMode, zComp)
+    finally:
+        writer.close()
+        emulator.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    printResults(results, baseline)
+
+    if args.output:
+        settings = dict(vars(args))
+        del settings['output'], settings['compare']
+        with open(args.output, 'w') as f:
+            json.dump({'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'settings': settings, 'results': results}, f, indent=2, sort_keys=True)
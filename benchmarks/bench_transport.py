@@ -0,0 +1,128 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Latency of the serial transports against the Grbl emulator (grbl_emulator.py), through the GrblWriter:
+#  - threads: GrblReader thread, the lines are written by the writer and their responses read from the queue
+#  - select: GrblTransport, single thread with poll(): the lines are sent with send_line and their responses are Futures
+# Measures the round trip of a command (do_command, as the CommandWorker), of a jog line (stream_line and
+# stream_response, as the JogEngine), of a status request (get_status), and the throughput of a stream of lines with
+# character counting (send_nonblock and ack_received, as the GCodeStreamer).
+#
+# Usage: python benchmarks/bench_transport.py [-n LINES] [--latency 0.0005]
+
+import sys
+import os
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pycnc_config
+from gcode.GrblWriter import GrblWriter
+from grbl_emulator import EmulatorProcess
+
+
+def testLines(n):
+    # short moves: with a large time scale of the emulator, the planner never fills up
+    return ['G1 X%d Y%d F1000' % (i % 10, i % 7) for i in range(n)]
+
+def stats(latencies):
+    latencies = sorted(latencies)
+    return (sum(latencies) / len(latencies) * 1000, latencies[len(latencies) // 2] * 1000,
+            latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000)
+
+def printRow(name, latencies):
+    print "%-28s mean %7.3f ms   p50 %7.3f ms   p99 %7.3f ms" % ((name,) + stats(latencies))
+
+
+def commandRoundTrip(writer, lines):
+    latencies = []
+    for line in lines:
+        start = time.time()
+        writer.do_command(line)
+        latencies.append(time.time() - start)
+    return latencies
+
+def jogRoundTrip(writer, lines, received):
+    latencies = []
+    for line in lines:
+        start = time.time()
+        writer.stream_line(line)
+        while True:
+            received.clear()
+            if writer.stream_response()[0]:
+                break
+            received.wait(1)
+        latencies.append(time.time() - start)
+    return latencies
+
+def statusRequest(writer, n):
+    latencies = []
+    for i in range(n):
+        start = time.time()
+        writer.get_status()
+        latencies.append(time.time() - start)
+    return latencies
+
+def stream(writer, lines, received):
+    for index, line in enumerate(lines):
+        while not writer.has_buffer_space(line):
+            received.clear()
+            if writer.ack_received()[1] is None:
+                received.wait(1)
+        writer.send_nonblock(line, index)
+    writer.wait_pending()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of the serial transports")
+    parser.add_argument("-n", "--lines", type=int, default=2000, help="lines per test")
+    parser.add_argument("--latency", type=float, default=0.0005, help="processing time of each line in the emulator (s)")
+    args = parser.parse_args()
+
+    emulator = EmulatorProcess(lineLatency=args.latency, timeScale=1000.0)
+    pycnc_config.SERIAL_PATTERN = emulator.start()
+    pycnc_config.STATUS_POLL_RATE = 0 # the status requests are measured separately
+    pycnc_config.STREAMING_PROTOCOL = 'charcount'
+    pycnc_config.SERIAL_DEBUG = False
+    lines = testLines(args.lines)
+    print "Emulator line latency %.3f ms, %d lines" % (args.latency * 1000, args.lines)
+
+    try:
+        streamTimes = []
+        for transport in ['threads', 'select']:
+            pycnc_config.SERIAL_TRANSPORT = transport
+            writer = GrblWriter()
+            if not writer.open():
+                print "Cannot connect to the emulator"
+                sys.exit(1)
+            received = threading.Event()
+            writer.line_received.connect(received.set)
+            printRow("%s: command round trip" % transport, commandRoundTrip(writer, lines))
+            printRow("%s: jog line round trip" % transport, jogRoundTrip(writer, lines, received))
+            printRow("%s: status request" % transport, statusRequest(writer, args.lines // 4))
+            start = time.time()
+            stream(writer, lines, received)
+            streamTimes.append((transport, time.time() - start))
+            writer.close()
+
+        for transport, streamTime in streamTimes:
+            print "%-28s %8.0f lines/s" % ("%s: stream" % transport, len(lines) / streamTime)
+    finally:
+        emulator.stop()
@@ -0,0 +1,76 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Microbenchmark of the Z compensation: interpolated Z offsets per second, one point at a time (getZValue)
+# and for arrays of points (getZValues, with NumPy).
+#
+# Usage: python benchmarks/bench_zcomp.py [-n POINTS] [-s SPACING] [--size X Y]
+
+import sys
+import os
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gcode import ZCompensation as zcomp
+
+
+def makeGrid(sizeX, sizeY, spacing):
+    zComp = zcomp.ZCompensation(sizeX, sizeY, spacing)
+    for index in range(len(zComp.getProbePoints())):
+        zComp.setZValue(index, random.uniform(-0.5, 0.5))
+    return zComp
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Z compensation")
+    parser.add_argument("-n", "--points", type=int, default=200000, help="number of points")
+    parser.add_argument("-s", "--spacing", type=float, default=2.0, help="grid spacing (mm)")
+    parser.add_argument("--size", type=float, nargs=2, default=[300.0, 200.0], help="grid size (mm)")
+    parser.add_argument("--batch", type=int, default=16, help="points per call of getZValues (segments of a move)")
+    args = parser.parse_args()
+
+    random.seed(0)
+    sys.stdout = open(os.devnull, 'w') # the grid construction prints all the points
+    zComp = makeGrid(args.size[0], args.size[1], args.spacing)
+    sys.stdout = sys.__stdout__
+    xs = [random.uniform(-10, args.size[0] + 10) for i in range(args.points)]
+    ys = [random.uniform(-10, args.size[1] + 10) for i in range(args.points)]
+
+    print "Grid: %dx%d points, NumPy: %s" % (zComp.nPointsX, zComp.nPointsY, zcomp.numpy_available)
+
+    start = time.time()
+    scalar = [zComp.getZValue(x, y) for x, y in zip(xs, ys)]
+    elapsed = time.time() - start
+    print "%-30s %12.0f points/s" % ("getZValue", args.points / elapsed)
+
+    start = time.time()
+    batch = []
+    for i in range(0, args.points, args.batch):
+        batch.extend(zComp.getZValues(xs[i:i+args.batch], ys[i:i+args.batch]))
+    elapsed = time.time() - start
+    print "%-30s %12.0f points/s" % ("getZValues, %d points/call" % args.batch, args.points / elapsed)
+
+    start = time.time()
+    full = zComp.getZValues(xs, ys)
+    elapsed = time.time() - start
+    print "%-30s %12.0f points/s" % ("getZValues, all points", args.points / elapsed)
+
+    print "Max difference: %g" % max(max(abs(a - b) for a, b in zip(scalar, batch)), max(abs(a - b) for a, b in zip(scalar, full)))
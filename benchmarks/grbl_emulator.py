@@ -0,0 +1,677 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Grbl emulator on a pseudo-terminal, for benchmarks and tests without a machine.
+#
+# The emulator implements the parts of the Grbl protocol used by rasPyCNCController: the startup banner, $$,
+# real-time commands (?, soft reset, feed hold, cycle start, jog cancel), $C check mode, $J= jogging,
+# ok/error/ALARM responses, probing, a 128-byte serial RX buffer and a planner with a limited number of blocks.
+# Every line takes a configurable processing time; every move takes length/feed, optionally scaled down with
+# timeScale. With an acceleration, the motion is integrated in small time steps instead: the speed never exceeds what
+# still allows slowing down for the junctions (Grbl junction deviation) and stopping at the end of the queued moves,
+# as the Grbl planner does when it replans with every new block. G4 and the other synchronizing commands are
+# acknowledged when the planner is empty.
+#
+# Usage: python benchmarks/grbl_emulator.py [--link /tmp/ttyGRBL0] [--latency 0.001] ...
+# then set SERIAL_PATTERN in pycnc_config.py to the printed port (or to the link).
+# From Python, EmulatorProcess runs the emulator in a separate process and gives access to its statistics.
+
+import os
+import sys
+import re
+import pty
+import tty
+import math
+import time
+import fcntl
+import select
+import argparse
+import multiprocessing
+from collections import deque
+
+DEFAULT_SETTINGS = [(0, '10'), (1, '25'), (2, '0'), (3, '0'), (4, '0'), (5, '0'), (6, '0'), (10, '1'),
+                    (11, '0.010'), (12, '0.002'), (13, '0'), (20, '0'), (21, '0'), (22, '0'), (23, '0'),
+                    (24, '25.000'), (25, '500.000'), (26, '250'), (27, '1.000'), (30, '1000'), (31, '0'), (32, '0'),
+                    (100, '250.000'), (101, '250.000'), (102, '250.000'),
+                    (110, '5000.000'), (111, '5000.000'), (112, '1000.000'),
+                    (120, '100.000'), (121, '100.000'), (122, '50.000'),
+                    (130, '300.000'), (131, '200.000'), (132, '80.000')]
+
+SUPPORTED_G = set([0, 1, 2, 3, 4, 10, 17, 18, 19, 20, 21, 28, 30, 38.2, 38.3, 38.4, 38.5, 40, 43.1, 49, 53,
+                   54, 55, 56, 57, 58, 59, 61, 80, 90, 91, 91.1, 92, 92.1, 93, 94])
+SUPPORTED_M = set([0, 1, 2, 3, 4, 5, 7, 8, 9, 30, 56])
+VALID_LETTERS = 'FGIJKLMNPRSTXYZ'
+SYNC_G = set([4, 10, 28, 30, 38.2, 38.3, 38.4, 38.5, 92])
+SYNC_M = set([0, 1, 2, 3, 4, 5, 30])
+
+wordPattern = re.compile("([A-Z])([-+]?[0-9]*\.?[0-9]*)")
+commentPattern = re.compile("\([^)]*\)|;.*")
+
+
+class Block:
+    # a move in the planner
+    def __init__(self, start, end, duration, jog, length = 0.0, speed = 0.0):
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.jog = jog
+        self.length = length
+        self.speed = speed # nominal speed (mm/s)
+        self.startTime = None # set when the block starts to execute
+
+
+class GrblEmulator:
+
+    MOTION_STEP = 0.002 # integration step of the motion with an acceleration (s)
+
+    def __init__(self, rxBufferSize = 128, plannerSize = 15, lineLatency = 0.001, timeScale = 1.0,
+                 version = '1.1f', probeDepth = 2.0, link = None, acceleration = None):
+        self.rxBufferSize = rxBufferSize
+        self.plannerSize = plannerSize
+        self.lineLatency = lineLatency # processing time of each line (s)
+        self.timeScale = timeScale # moves are executed timeScale times faster than real time
+        self.acceleration = acceleration # mm/s^2, None for moves at constant speed
+        self.version = version
+        self.probeDepth = probeDepth # the probe touches this far below the position where probing starts
+        self.settings = list(DEFAULT_SETTINGS)
+        self.errorPattern = None # lines matching this regular expression return error:20
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave) # no echo, no line editing
+        fcntl.fcntl(self.master, fcntl.F_SETFL, fcntl.fcntl(self.master, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.portName = os.ttyname(self.slave)
+        self.link = link
+        if link is not None:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(self.portName, link)
+
+        self.running = False
+        self.output = ''
+        self.mpos = [0.0, 0.0, 0.0]
+        self.wco = [0.0, 0.0, 0.0]
+        self.resetStats()
+        self.softReset(sendBanner = False)
+
+    # --- state ---
+
+    def softReset(self, sendBanner = True):
+        self.rx = bytearray()
+        self.planner = deque()
+        self.speed = 0.0 # current speed with an acceleration (mm/s, emulated time)
+        self.progress = 0.0 # distance done in the first block with an acceleration
+        self.motionTime = None # time up to which the motion is integrated
+        self.state = 'Idle'
+        self.checkMode = False
+        self.holdStart = None
+        self.relative = False
+        self.metric = True
+        self.motion = 0
+        self.feed = 0.0
+        self.nextLineTime = 0.0
+        self.waitSync = None # (dwell, responses, probeTarget) of a command that waits for the planner to be empty
+        self.busyUntil = None # a blocking operation (dwell, probe) is running
+        self.busyOutput = []
+        if sendBanner:
+            self.send("\r\nGrbl %s ['$' for help]\r\n" % self.version)
+
+    def resetStats(self):
+        self.stats = {'lines': 0, 'bytes': 0, 'errors': 0, 'overflowBytes': 0, 'statusReports': 0,
+                      'blocks': 0, 'plannerEmptyTime': 0.0, 'maxPlannerBlocks': 0, 'busyTime': 0.0,
+                      'idleTime': None} # last time the motion stopped
+        self.lastBlockEnd = None # time when the planner became empty, after the first block
+
+    def getStats(self):
+        now = time.time()
+        self.advancePlanner(now)
+        stats = dict(self.stats)
+        stats['rxFree'] = self.rxBufferSize - len(self.rx)
+        stats['plannerBlocks'] = len(self.planner)
+        stats['state'] = self.state
+        stats['position'] = self.currentPosition(now) # machine position
+        return stats
+
+    def setting(self, key):
+        for settingKey, value in self.settings:
+            if settingKey == key:
+                return float(value)
+        return 0.0
+
+    # --- output ---
+
+    def send(self, text):
+        self.output += text
+
+    def flush(self):
+        while self.output:
+            try:
+                written = os.write(self.master, self.output)
+            except OSError:
+                return # nobody is reading: keep the output
+            self.output = self.output[written:]
+
+    def statusReport(self, now):
+        pos = self.currentPosition(now)
+        self.stats['statusReports'] += 1
+        if self.version.startswith('0.'):
+            self.send("<%s,MPos:%.3f,%.3f,%.3f,WPos:%.3f,%.3f,%.3f,Buf:%d,RX:%d>\r\n" % (
+                self.state, pos[0], pos[1], pos[2], pos[0] - self.wco[0], pos[1] - self.wco[1], pos[2] - self.wco[2],
+                len(self.planner), len(self.rx)))
+        else:
+            self.send("<%s|MPos:%.3f,%.3f,%.3f|Bf:%d,%d|FS:%d,0|WCO:%.3f,%.3f,%.3f>\r\n" % (
+                self.state, pos[0], pos[1], pos[2], self.plannerSize - len(self.planner), self.rxBufferSize - len(self.rx),
+                self.feed if self.planner else 0, self.wco[0], self.wco[1], self.wco[2]))
+
+    # --- planner ---
+
+    def currentPosition(self, now):
+        if not self.planner or self.planner[0].startTime is None:
+            return self.mpos
+        block = self.planner[0]
+        if self.acceleration:
+            fraction = self.progress / block.length if block.length > 0 else 1.0
+            return [s + (e - s) * fraction for s, e in zip(block.start, block.end)]
+        t = now if self.holdStart is None else self.holdStart
+        fraction = min(1.0, max(0.0, (t - block.startTime) / block.duration)) if block.duration > 0 else 1.0
+        return [s + (e - s) * fraction for s, e in zip(block.start, block.end)]
+
+    def addBlock(self, end, feed, jog = False, length = None):
+        start = self.planner[-1].end if self.planner else list(self.mpos)
+        if length is None:
+            length = math.sqrt(sum((e - s) ** 2 for s, e in zip(start, end)))
+        duration = length / (feed / 60.0) / self.timeScale if feed > 0 else 0.0
+        block = Block(start, end, duration, jog, length, feed / 60.0)
+        self.planner.append(block)
+        self.stats['blocks'] += 1
+        self.stats['maxPlannerBlocks'] = max(self.stats['maxPlannerBlocks'], len(self.planner))
+        if self.state == 'Idle':
+            self.state = 'Jog' if jog else 'Run'
+
+    def advancePlanner(self, now):
+        if self.holdStart is not None:
+            return
+        if self.acceleration:
+            self.integrateMotion(now)
+            return
+        while self.planner:
+            block = self.planner[0]
+            if block.startTime is None:
+                # the planner was empty: the block starts now
+                self.startMotion(block, now)
+            if block.startTime + block.duration > now:
+                return
+            # block completed
+            endTime = block.startTime + block.duration
+            self.completeBlock(endTime)
+            if self.planner:
+                self.planner[0].startTime = endTime
+
+    def startMotion(self, block, now):
+        block.startTime = now
+        self.motionTime = now
+        self.speed = 0.0
+        self.progress = 0.0
+        if self.lastBlockEnd is not None:
+            self.stats['plannerEmptyTime'] += now - self.lastBlockEnd
+
+    def completeBlock(self, endTime):
+        block = self.planner.popleft()
+        self.mpos = list(block.end)
+        self.stats['busyTime'] += endTime - block.startTime
+        if not self.planner:
+            self.speed = 0.0
+            self.progress = 0.0
+            self.lastBlockEnd = endTime
+            if self.state in ('Run', 'Jog'):
+                self.state = 'Idle'
+                self.stats['idleTime'] = endTime
+
+    def integrateMotion(self, now):
+        a = self.acceleration * self.timeScale ** 2
+        while self.planner and self.motionTime < now:
+            block = self.planner[0]
+            if block.startTime is None:
+                self.startMotion(block, now)
+                return
+            step = min(self.MOTION_STEP, now - self.motionTime)
+            speed = max(min(self.speed + a * step, self.speedLimit(a)), a * step)
+            self.progress += (self.speed + speed) / 2 * step
+            self.speed = speed
+            self.motionTime += step
+            while self.planner and self.progress >= self.planner[0].length:
+                self.progress -= self.planner[0].length
+                self.completeBlock(self.motionTime)
+                if self.planner:
+                    self.planner[0].startTime = self.motionTime
+
+    def speedLimit(self, a):
+        # highest speed in the first block that still allows to stop at the end of the queue, going backwards through
+        # the junctions
+        blocks = list(self.planner)
+        exitSpeed = 0.0
+        for previous, block in reversed(zip(blocks[:-1], blocks[1:])):
+            entrySpeed = min(block.speed * self.timeScale, math.sqrt(exitSpeed ** 2 + 2 * a * block.length))
+            exitSpeed = min(entrySpeed, self.junctionSpeed(previous, block, a))
+        first = blocks[0]
+        return min(first.speed * self.timeScale, math.sqrt(exitSpeed ** 2 + 2 * a * max(0.0, first.length - self.progress)))
+
+    def junctionSpeed(self, previous, block, a):
+        # Grbl junction deviation: the speed of a circle tangent to both moves, deviating from the corner by $11
+        if previous.length <= 0 or block.length <= 0:
+            return 0.0
+        cosine = -sum((e1 - s1) * (e2 - s2) for s1, e1, s2, e2 in zip(previous.start, previous.end, block.start, block.end))
+        cosine /= previous.length * block.length
+        if cosine <= -0.999999:
+            return float('inf') # straight line
+        sinHalf = math.sqrt(0.5 * (1.0 - cosine))
+        if sinHalf <= 1e-6:
+            return 0.0 # reversal
+        return math.sqrt(a * self.setting(11) * sinHalf / (1.0 - sinHalf))
+
+    def nextPlannerEvent(self):
+        if self.holdStart is not None or not self.planner or self.planner[0].startTime is None:
+            return None
+        if self.acceleration:
+            return self.motionTime + self.MOTION_STEP
+        return self.planner[0].startTime + self.planner[0].duration
+
+    # --- real-time commands ---
+
+    def receive(self, data, now):
+        for char in data:
+            if char == '?':
+                self.statusReport(now)
+            elif char == '\x18':
+                self.advancePlanner(now)
+                self.mpos = self.currentPosition(now)
+                self.softReset()
+            elif char == '!':
+                if self.holdStart is None and self.planner:
+                    self.holdStart = now
+                    self.state = 'Hold:0'
+            elif char == '~':
+                if self.holdStart is not None:
+                    for block in self.planner:
+                        if block.startTime is not None:
+                            block.startTime += now - self.holdStart
+                    self.motionTime = now
+                    self.speed = 0.0
+                    self.holdStart = None
+                    self.state = 'Run' if self.planner else 'Idle'
+            elif char == '\x85':
+                if self.state == 'Jog':
+                    # stop immediately and discard the jog blocks
+                    self.mpos = self.currentPosition(now)
+                    self.planner = deque(block for block in self.planner if not block.jog)
+                    self.speed = 0.0
+                    self.progress = 0.0
+                    self.lastBlockEnd = now
+                    self.state = 'Idle'
+                    self.stats['idleTime'] = now
+            elif ord(char) >= 0x80:
+                pass # other real-time commands are ignored
+            elif len(self.rx) >= self.rxBufferSize:
+                self.stats['overflowBytes'] += 1 # the host sent too much: the byte is lost, as on the real Grbl
+            else:
+                self.rx.append(char)
+                self.stats['bytes'] += 1
+
+    # --- line processing ---
+
+    def processLines(self, now):
+        while True:
+            if self.busyUntil is not None:
+                if now < self.busyUntil:
+                    return
+                self.busyUntil = None
+                for text in self.busyOutput:
+                    self.send(text)
+                self.busyOutput = []
+            if self.waitSync is not None:
+                if self.planner:
+                    return
+                self.finishSync(now)
+                continue
+            if now < self.nextLineTime:
+                return
+            end = self.rx.find('\n')
+            if end < 0:
+                return
+            line = str(self.rx[:end]).replace('\r', '')
+            if len(self.planner) >= self.plannerSize and self.isMotion(line):
+                return # planner full: the line waits in the RX buffer
+            del self.rx[:end+1]
+            self.stats['lines'] += 1
+            self.nextLineTime = now + self.lineLatency
+            response = self.executeLine(line.strip(), now)
+            if response is not None:
+                if response.startswith('error'):
+                    self.stats['errors'] += 1
+                self.send(response + '\r\n')
+
+    def isMotion(self, line):
+        line = line.upper()
+        return line.startswith('$J=') or any(axis in line for axis in 'XYZ')
+
+    def finishSync(self, now):
+        dwell, responses, probe = self.waitSync
+        self.waitSync = None
+        if probe is not None:
+            # move down until the probe touches
+            contact = self.mpos[2] - self.probeDepth
+            target = probe[2]
+            if target <= contact:
+                end = [probe[0], probe[1], contact]
+                responses = ["[PRB:%.3f,%.3f,%.3f:1]\r\n" % tuple(end)] + responses
+            else:
+                end = list(probe)
+                responses = ["ALARM:5\r\n"]
+                self.state = 'Alarm'
+            length = math.sqrt(sum((e - s) ** 2 for s, e in zip(self.mpos, end)))
+            dwell += length / (self.feed / 60.0) if self.feed > 0 else 0.0
+            self.mpos = end
+        self.busyUntil = now + dwell / self.timeScale
+        self.busyOutput = responses
+
+    def executeLine(self, line, now):
+        # returns the response to the line, or None if it is sent later
+        if not line:
+            return 'ok'
+        if line[0] == '$':
+            return self.systemCommand(line, now)
+        if self.state == 'Alarm':
+            return 'error:9'
+        if self.errorPattern is not None and re.search(self.errorPattern, line):
+            return 'error:20'
+        return self.gcodeLine(line.upper(), now, jog = False)
+
+    def systemCommand(self, line, now):
+        command = line[1:].upper()
+        if command == '$':
+            for key, value in self.settings:
+                self.send("$%d=%s\r\n" % (key, value))
+            return 'ok'
+        if command == 'C':
+            self.checkMode = not self.checkMode
+            if self.checkMode:
+                self.state = 'Check'
+                self.send("[MSG:Enabled]\r\n")
+                return 'ok'
+            self.send("[MSG:Disabled]\r\n")
+            self.softReset() # Grbl resets when leaving check mode
+            return None
+        if command == 'X':
+            if self.state == 'Alarm':
+                self.state = 'Idle'
+            return 'ok'
+        if command == 'H':
+            self.waitSync = (0.0, ['ok\r\n'], None)
+            self.mpos = [0.0, 0.0, 0.0]
+            return None
+        if command == 'G':
+            self.send("[GC:G%d G54 G17 %s %s G94 M5 M9 T0 F%d S0]\r\n" % (self.motion, 'G21' if self.metric else 'G20',
+                                                                       'G91' if self.relative else 'G90', self.feed))
+            return 'ok'
+        if command == 'I':
+            self.send("[VER:%s.20170801:]\r\n" % self.version)
+            return 'ok'
+        if command.startswith('J='):
+            if self.version.startswith('0.'):
+                return 'error:3'
+            if self.state not in ('Idle', 'Jog'):
+                return 'error:8'
+            # the G90/G91 and G20/G21 words of a jog do not change the modal state
+            relative, metric = self.relative, self.metric
+            try:
+                return self.gcodeLine(command[2:], now, jog = True)
+            finally:
+                self.relative, self.metric = relative, metric
+        m = re.match("([0-9]+)=([-0-9.]+)$", command)
+        if m:
+            key = int(m.group(1))
+            self.settings = [(k, v) for k, v in self.settings if k != key] + [(key, m.group(2))]
+            self.settings.sort()
+            return 'ok'
+        return 'error:3'
+
+    def gcodeLine(self, line, now, jog):
+        line = commentPattern.sub('', line).replace(' ', '')
+        words = {}
+        gcodes = []
+        mcodes = []
+        position = 0
+        for match in wordPattern.finditer(line):
+            if match.start() != position:
+                return 'error:1' # not a gcode word
+            position = match.end()
+            letter, value = match.group(1), match.group(2)
+            if value in ('', '.', '-', '+'):
+                return 'error:2'
+            if letter not in VALID_LETTERS:
+                return 'error:20'
+            number = float(value)
+            if letter == 'G':
+                if number not in SUPPORTED_G:
+                    return 'error:20'
+                gcodes.append(number)
+            elif letter == 'M':
+                if number not in SUPPORTED_M:
+                    return 'error:20'
+                mcodes.append(number)
+            else:
+                words[letter] = number
+        if position != len(line):
+            return 'error:1'
+
+        # modal state
+        machineCoords = False
+        motion = None
+        for g in gcodes:
+            if g in (0, 1, 2, 3, 38.2, 38.3, 38.4, 38.5):
+                motion = g
+            elif g == 20:
+                self.metric = False
+            elif g == 21:
+                self.metric = True
+            elif g == 90:
+                self.relative = False
+            elif g == 91:
+                self.relative = True
+            elif g == 53:
+                machineCoords = True
+        scale = 1.0 if self.metric else 25.4
+        if 'F' in words:
+            self.feed = words['F'] * scale
+        if jog:
+            motion = 1
+        elif motion in (0, 1, 2, 3):
+            self.motion = motion
+        elif motion is None and any(axis in words for axis in 'XYZ') and not any(g in (10, 28, 30, 92) for g in gcodes):
+            motion = self.motion
+
+        start = self.planner[-1].end if self.planner else list(self.mpos)
+        target = list(start)
+        for axis, letter in enumerate('XYZ'):
+            if letter in words:
+                value = words[letter] * scale
+                if self.relative and not machineCoords:
+                    target[axis] += value
+                elif machineCoords:
+                    target[axis] = value
+                else:
+                    target[axis] = value + self.wco[axis]
+
+        # coordinate systems
+        if 10 in gcodes and words.get('L') == 20:
+            for axis, letter in enumerate('XYZ'):
+                if letter in words:
+                    self.wco[axis] = start[axis] - words[letter] * scale
+        if 92 in gcodes:
+            for axis, letter in enumerate('XYZ'):
+                if letter in words:
+                    self.wco[axis] = start[axis] - words[letter] * scale
+
+        if self.checkMode:
+            return 'ok'
+
+        if motion in (38.2, 38.3, 38.4, 38.5):
+            self.waitSync = (0.0, ['ok\r\n'], target)
+            return None
+        if motion in (0, 1, 2, 3):
+            if motion != 0 and self.feed <= 0:
+                return 'error:22' # undefined feed rate
+            feed = self.setting(110) if motion == 0 else self.feed
+            length = None
+            if motion in (2, 3):
+                # arc length from the center given with I and J
+                i, j = words.get('I', 0.0) * scale, words.get('J', 0.0) * scale
+                radius = math.hypot(i, j)
+                if radius > 0:
+                    startAngle = math.atan2(-j, -i)
+                    endAngle = math.atan2(target[1] - start[1] - j, target[0] - start[0] - i)
+                    angle = (endAngle - startAngle) if motion == 3 else (startAngle - endAngle)
+                    angle = angle % (2 * math.pi) or 2 * math.pi
+                    length = math.hypot(angle * radius, target[2] - start[2])
+            self.addBlock(target, feed, jog, length)
+
+        dwell = words.get('P', 0.0) if 4 in gcodes else 0.0
+        if any(g in SYNC_G for g in gcodes) or any(m in SYNC_M for m in mcodes):
+            self.waitSync = (dwell, ['ok\r\n'], None)
+            return None
+        return 'ok'
+
+    # --- main loop ---
+
+    def run(self, control = None):
+        # serve the pty until stop() is called, or until 'stop' is received on the control connection
+        self.running = True
+        self.send("\r\nGrbl %s ['$' for help]\r\n" % self.version)
+        inputs = [self.master] + ([control] if control is not None else [])
+        while self.running:
+            now = time.time()
+            self.advancePlanner(now)
+            self.processLines(now)
+            self.flush()
+
+            events = [t for t in (self.nextPlannerEvent(), self.busyUntil,
+                                  self.nextLineTime if self.rx.find('\n') >= 0 else None) if t is not None]
+            timeout = 0.05
+            if events:
+                timeout = max(0.0, min(timeout, min(events) - time.time()))
+            if self.output:
+                timeout = min(timeout, 0.001)
+            readable = select.select(inputs, [], [], timeout)[0]
+            if self.master in readable:
+                try:
+                    data = os.read(self.master, 4096)
+                except OSError:
+                    data = '' # the port is not open on the other side
+                self.receive(data, time.time())
+            if control is not None and control in readable:
+                self.controlCommand(control)
+        self.close()
+
+    def controlCommand(self, control):
+        command = control.recv()
+        if command[0] == 'stats':
+            control.send(self.getStats())
+        elif command[0] == 'resetStats':
+            self.resetStats()
+            control.send(True)
+        elif command[0] == 'set':
+            setattr(self, command[1], command[2])
+            control.send(True)
+        elif command[0] == 'stop':
+            self.running = False
+            control.send(True)
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        if self.link is not None and os.path.lexists(self.link):
+            os.remove(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def runEmulator(control, options):
+    emulator = GrblEmulator(**options)
+    control.send(emulator.portName)
+    emulator.run(control)
+
+
+class EmulatorProcess:
+    # runs a GrblEmulator in a separate process, so that it does not compete with the host for the interpreter
+
+    def __init__(self, **options):
+        self.options = options
+        self.process = None
+        self.connection = None
+        self.portName = None
+
+    def start(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=runEmulator, args=(child, self.options))
+        self.process.daemon = True
+        self.process.start()
+        self.portName = self.connection.recv()
+        return self.portName
+
+    def _call(self, *command):
+        self.connection.send(command)
+        return self.connection.recv()
+
+    def getStats(self):
+        return self._call('stats')
+
+    def resetStats(self):
+        self._call('resetStats')
+
+    def set(self, name, value):
+        # change an attribute of the emulator (e.g. lineLatency, timeScale, errorPattern)
+        self._call('set', name, value)
+
+    def stop(self):
+        if self.process is None:
+            return
+        self._call('stop')
+        self.process.join(5)
+        self.process = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grbl emulator on a pseudo-terminal")
+    parser.add_argument("--link", help="symbolic link to the port (e.g. /tmp/ttyGRBL0), to be used in SERIAL_PATTERN")
+    parser.add_argument("--latency", type=float, default=0.001, help="processing time of each line (s)")
+    parser.add_argument("--planner", type=int, default=15, help="planner blocks")
+    parser.add_argument("--rx", type=int, default=128, help="size of the serial receive buffer")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="execute the moves this many times faster")
+    parser.add_argument("--grbl-version", default='1.1f', help="version in the banner (0.9j uses the old status format)")
+    parser.add_argument("--acceleration", type=float, help="acceleration of the moves (mm/s^2). Default: constant speed")
+    args = parser.parse_args()
+
+    emulator = GrblEmulator(rxBufferSize=args.rx, plannerSize=args.planner, lineLatency=args.latency,
+                            timeScale=args.time_scale, version=args.grbl_version, link=args.link,
+                            acceleration=args.acceleration)
+    print "Grbl emulator on %s%s" % (emulator.portName, (" (%s)" % args.link) if args.link else "")
+    try:
+        emulator.run()
+    except KeyboardInterrupt:
+        emulator.close()
+    print emulator.getStats()
@@ -0,0 +1,78 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compare the simple and the acceleration-aware job time estimates against measured run times.
+#
+# Usage: python benchmarks/validate_estimator.py settings.txt file1.nc=seconds [file2.nc=seconds ...]
+#
+# settings.txt is the output of the Grbl '$$' command of the machine that ran the jobs;
+# seconds is the real run time of each file on that machine.
+
+import sys
+import os
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gcode.GCodeAnalyzer import GCodeAnalyzer
+from gcode.PlannerTimeEstimator import PlannerTimeEstimator
+import re
+
+settingPattern = re.compile("\$([0-9]+)\s*=\s*([0-9.]+)")
+
+def readSettings(fileName):
+    settings = {}
+    with open(fileName) as f:
+        for line in f:
+            m = settingPattern.match(line.strip())
+            if m:
+                settings[int(m.group(1))] = float(m.group(2))
+    return settings
+
+def estimate(fileName, settings):
+    analyzer = GCodeAnalyzer()
+    analyzer.fastf = settings.get(110, 5000)
+    analyzer.planner = PlannerTimeEstimator(settings)
+    with open(fileName) as f:
+        for line in f:
+            analyzer.Analyze(line)
+    times = analyzer.planner.computeLineTimes()
+    return analyzer.getTravelTime()*60, times[-1] if len(times) > 0 else 0.0
+
+def formatError(estimated, real):
+    return "%+.1f%%" % ((estimated - real) / real * 100)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate the job time estimators against measured run times")
+    parser.add_argument("settings", help="file with the output of the Grbl $$ command")
+    parser.add_argument("jobs", nargs="+", help="file.nc=seconds")
+    args = parser.parse_args()
+
+    settings = readSettings(args.settings)
+    if not PlannerTimeEstimator.isSupported(settings):
+        print "The settings file must contain $110-$112 and $120-$122"
+        sys.exit(1)
+
+    print "%-40s %10s %10s %8s %10s %8s" % ("File", "Real (s)", "Simple", "Error", "Planner", "Error")
+    for job in args.jobs:
+        fileName, real = job.rsplit('=', 1)
+        real = float(real)
+        simple, planner = estimate(fileName, settings)
+        print "%-40s %10.0f %10.0f %8s %10.0f %8s" % (os.path.basename(fileName), real,
+                                                      simple, formatError(simple, real),
+                                                      planner, formatError(planner, real))
@@ -0,0 +1,169 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Persistent cache of the results of the gcode analysis (time table, bounding box, line offsets).
+#
+# Entries are stored in a cache directory and are keyed by the hash of the file content and by the settings
+# that affect the analysis. A small index maps the path, size and modification time of a file to its hash,
+# so that the content is only hashed again when the file changes.
+# The least recently used entries are removed when the cache exceeds its maximum size.
+
+import os
+import time
+import hashlib
+import cPickle as pickle
+from array import array
+
+from GCodeIndex import GCodeAnalysis, readLines
+from PlannerTimeEstimator import PlannerTimeEstimator, REQUIRED_SETTINGS
+
+CACHE_VERSION = 1 # increase when the analysis results or the entry format change
+ENTRY_EXTENSION = '.analysis'
+INDEX_FILE = 'index.pickle'
+INDEX_SIZE = 1000 # max number of files remembered in the index
+HASH_BLOCK_SIZE = 1024*1024
+
+
+def fileHash(fileName):
+    # sha1 of the content of a file
+    h = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def analysisSignature(g0_feed, grblConfig):
+    # settings that affect the results of the analysis
+    if PlannerTimeEstimator.isSupported(grblConfig):
+        settings = tuple((key, grblConfig.get(key)) for key in sorted(REQUIRED_SETTINGS + [11, 12]))
+    else:
+        settings = None
+    return hashlib.sha1(repr((CACHE_VERSION, float(g0_feed), settings))).hexdigest()[:16]
+
+
+class AnalysisCache:
+
+    def __init__(self, cacheDir, maxSize):
+        self.cacheDir = os.path.expanduser(cacheDir)
+        self.maxSize = maxSize
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+    def _readIndex(self):
+        try:
+            with open(os.path.join(self.cacheDir, INDEX_FILE), 'rb') as f:
+                return pickle.load(f)
+        except:
+            return {}
+
+    def _writeIndex(self, index):
+        if len(index) > INDEX_SIZE:
+            # forget the files that were hashed first
+            for path in sorted(index, key=lambda p: index[p][3])[:len(index) - INDEX_SIZE]:
+                del index[path]
+        self._atomicWrite(os.path.join(self.cacheDir, INDEX_FILE), lambda f: pickle.dump(index, f, 2))
+
+    def _atomicWrite(self, fileName, writeFunction):
+        # write to a temporary file and rename it, so that a crash never leaves a truncated file
+        tmpName = fileName + '.tmp%d' % os.getpid()
+        try:
+            with open(tmpName, 'wb') as f:
+                writeFunction(f)
+            os.rename(tmpName, fileName)
+        finally:
+            if os.path.exists(tmpName):
+                os.remove(tmpName)
+
+    def contentHash(self, fileName):
+        # hash of a file, only recomputed if the size or modification time changed
+        path = os.path.abspath(fileName)
+        st = os.stat(path)
+        index = self._readIndex()
+        entry = index.get(path)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime:
+            return entry[2]
+        digest = fileHash(path)
+        index[path] = (st.st_size, st.st_mtime, digest, time.time())
+        self._writeIndex(index)
+        return digest
+
+    def _entryName(self, fileName, signature):
+        return os.path.join(self.cacheDir, self.contentHash(fileName) + '-' + signature + ENTRY_EXTENSION)
+
+    def get(self, fileName, signature, lowMemory = False):
+        # cached analysis of a file, or None
+        entryName = self._entryName(fileName, signature)
+        if not os.path.exists(entryName):
+            return None
+        try:
+            with open(entryName, 'rb') as f:
+                header = pickle.load(f)
+                times = array(header['timeTypecode'])
+                times.fromfile(f, header['nLines'])
+                offsets = array('L')
+                offsets.fromfile(f, header['nLines'] + 1)
+            if offsets[-1] != os.path.getsize(fileName):
+                raise ValueError("entry does not match the file")
+        except:
+            # damaged entry: analyze the file again
+            os.remove(entryName)
+            return None
+
+        os.utime(entryName, None) # mark as recently used
+
+        result = GCodeAnalysis()
+        result.gcode = readLines(fileName, offsets, lowMemory)
+        result.times = times
+        result.totalTime = header['totalTime']
+        result.bBox = header['bBox']
+        result.travel = header['travel']
+        result.offsets = offsets
+        return result
+
+    def put(self, fileName, signature, result):
+        header = {'nLines': len(result.times),
+                  'timeTypecode': result.times.typecode,
+                  'totalTime': result.totalTime,
+                  'bBox': result.bBox,
+                  'travel': result.travel}
+
+        def writeEntry(f):
+            pickle.dump(header, f, 2)
+            result.times.tofile(f)
+            result.offsets.tofile(f)
+
+        self._atomicWrite(self._entryName(fileName, signature), writeEntry)
+        self.evict()
+
+    def evict(self):
+        # remove the least recently used entries until the cache fits in maxSize
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            if name.endswith(ENTRY_EXTENSION):
+                st = os.stat(os.path.join(self.cacheDir, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        totalSize = sum(entry[1] for entry in entries)
+        for mtime, size, name in sorted(entries):
+            if totalSize <= self.maxSize:
+                break
+            os.remove(os.path.join(self.cacheDir, name))
+            totalSize -= size
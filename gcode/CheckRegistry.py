@@ -0,0 +1,84 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Registry of the results of the grbl check mode, so that a file is only checked once and is never modified.
+#
+# The results are stored in a sqlite database, keyed by the hash of the file content (so a copied or renamed file is
+# still recognized) and by a signature of what the check depends on: the grbl version and settings, and the codes
+# removed from the lines before sending them.
+
+import os
+import time
+import json
+import hashlib
+import sqlite3
+
+CHECK_VERSION = 1 # increase when the way the files are checked changes
+
+
+def checkSignature(grblConfig, suppressedCodes):
+    # grbl version and settings (e.g. soft limits and travel produce alarms in check mode), and the suppressed codes
+    grblConfig = grblConfig or {}
+    settings = tuple((key, grblConfig[key]) for key in sorted(grblConfig) if isinstance(key, int))
+    return hashlib.sha1(repr((CHECK_VERSION, grblVersion(grblConfig), settings, tuple(suppressedCodes)))).hexdigest()[:16]
+
+def grblVersion(grblConfig):
+    if 'Major' not in grblConfig:
+        return None
+    return "%d.%d%s" % (grblConfig['Major'], grblConfig['Minor'], grblConfig.get('Revision', ''))
+
+
+class CheckResult:
+
+    def __init__(self, errors, grblVersion, checkTime):
+        self.errors = errors # list of (line number, error message). Empty if the file passed the check
+        self.grblVersion = grblVersion
+        self.checkTime = checkTime
+
+    def passed(self):
+        return not self.errors
+
+
+class CheckRegistry:
+
+    def __init__(self, fileName):
+        fileName = os.path.expanduser(fileName)
+        directory = os.path.dirname(fileName)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(fileName)
+        self.db.execute("CREATE TABLE IF NOT EXISTS checks (contentHash TEXT, signature TEXT, passed INTEGER, "
+                        "errors TEXT, grblVersion TEXT, checkTime REAL, PRIMARY KEY (contentHash, signature))")
+        self.db.commit()
+
+    def get(self, contentHash, signature):
+        # result of the last check of a file with the same settings, or None
+        row = self.db.execute("SELECT errors, grblVersion, checkTime FROM checks WHERE contentHash = ? AND signature = ?",
+                              (contentHash, signature)).fetchone()
+        if row is None:
+            return None
+        errors, version, checkTime = row
+        return CheckResult([tuple(error) for error in json.loads(errors)], version, checkTime)
+
+    def put(self, contentHash, signature, errors, grblVersion = None):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?, ?, ?)",
+                            (contentHash, signature, 0 if errors else 1, json.dumps(errors), grblVersion, time.time()))
+
+    def close(self):
+        self.db.close()
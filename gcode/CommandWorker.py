@@ -0,0 +1,170 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Commands of the jog controls (moves, steps, zero setting) run by a single long-lived thread, in the order they are
+# submitted.
+#
+# A command can require a distance mode (G90/G91) and millimeters (G21): the words are added to the command line
+# only if the machine is not already in that mode, so a move is one round trip. After a command, the position of the
+# analyzer is synced with grbl: from the polled status reports when STATUS_POLL_RATE is enabled (after the machine
+# is idle, as soon as a report arrives), otherwise with a status request. The worker is busy until the position is
+# synced, so that nothing else (a job) uses the analyzer meanwhile.
+
+import sys
+import time
+import Queue
+import threading
+
+import pycnc_config
+from gcode.Events import Event
+
+SYNC_TIMEOUT = 5.0 # without an idle status report in this time, the position is requested
+
+
+class CommandTiming(object):
+    # timing of a command, sent with the done_event
+
+    def __init__(self, command, wait, duration):
+        self.command = command # line sent to grbl, with the modal words
+        self.wait = wait # seconds in the queue
+        self.duration = duration # seconds from sending to the response (to the end of the motion for waiting commands)
+
+    def latency(self):
+        return self.wait + self.duration
+
+
+class CommandWorker(object):
+
+    def __init__(self):
+        self.error_event = Event() # emitted with the exception when a command fails
+        self.done_event = Event() # emitted with the CommandTiming of each command
+        self.grblWriter = None
+        self.queue = Queue.Queue()
+        self.pending = 0 # commands submitted and not completed
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock) # notified when the worker becomes idle
+        self.thread = None
+        self.syncSince = None # the position must be synced with a status report received after this time
+
+    def setGrbl(self, grblWriter):
+        self.grblWriter = grblWriter
+
+    def start(self):
+        if self.thread is not None: return
+        self.thread = threading.Thread(target = self.run, name = "CommandWorker")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def shutdown(self):
+        if self.thread is None: return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def submit(self, command, wait = False, relative = None, metric = False):
+        # queue a command. wait: return after the motion is complete. relative: G91 (True) or G90 (False) is needed,
+        # None for commands that do not depend on it. metric: G21 is needed
+        with self.lock:
+            self.pending += 1
+        self.queue.put((command, wait, relative, metric, time.time()))
+
+    def isBusy(self):
+        return self.pending > 0 or self.syncSince is not None
+
+    def waitIdle(self, timeout = 10.0):
+        # returns False if the worker is still busy after the timeout: nothing else must be sent to grbl
+        end = time.time() + timeout
+        with self.idle:
+            while self.isBusy():
+                remaining = end - time.time()
+                if remaining <= 0:
+                    return False
+                self.idle.wait(remaining)
+        return True
+
+    # --- worker thread ---
+
+    def run(self):
+        while True:
+            try:
+                job = self.queue.get(timeout = self.syncTimeout())
+            except Queue.Empty:
+                self.syncPosition()
+                continue
+            if job is None:
+                return
+            try:
+                self.execute(*job)
+            finally:
+                with self.idle:
+                    self.pending -= 1
+                    self.idle.notifyAll()
+
+    def syncTimeout(self):
+        # how long to wait for a command: polling for the status report of a pending sync
+        if self.syncSince is None:
+            return None
+        return 0.5 / pycnc_config.STATUS_POLL_RATE
+
+    def modalWords(self, relative, metric):
+        analyzer = self.grblWriter.analyzer
+        words = ''
+        if relative is not None and analyzer.relative != relative:
+            words += 'G91 ' if relative else 'G90 '
+        if metric and not analyzer.metric:
+            words += 'G21 '
+        return words
+
+    def execute(self, command, wait, relative, metric, submitted):
+        writer = self.grblWriter
+        if writer is None:
+            return
+        start = time.time()
+        line = command
+        try:
+            words = self.modalWords(relative, metric)
+            if words and writer.doZCompensation:
+                writer.do_command(words) # the compensated moves are rewritten: the modal words need their own line
+            else:
+                line = words + command
+            writer.do_command(line, wait)
+        except:
+            self.endSync()
+            self.error_event.emit(sys.exc_info()[0])
+            return
+        end = time.time()
+        if writer.pollingStatus:
+            self.syncSince = end
+            self.syncPosition()
+        else:
+            writer.update_position()
+        self.done_event.emit(CommandTiming(line, start - submitted, end - start))
+
+    def syncPosition(self):
+        if self.syncSince is None:
+            return
+        if self.grblWriter.sync_polled_position(self.syncSince):
+            self.endSync()
+        elif time.time() - self.syncSince > SYNC_TIMEOUT or not self.grblWriter.pollingStatus:
+            self.grblWriter.update_position()
+            self.endSync() # after the update: the worker is busy until then
+
+    def endSync(self):
+        with self.idle:
+            self.syncSince = None
+            self.idle.notifyAll()
@@ -0,0 +1,107 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compilation of a job with Z compensation.
+#
+# When a height map is active, every move has to be split and corrected. Doing it while streaming makes each move
+# a blocking command, so the job is compiled once instead: the result is a new gcode file, with the moves already
+# compensated, that is streamed like any other file.
+
+import os
+import re
+import tempfile
+from array import array
+
+from GCodeAnalyzer import GCodeAnalyzer
+from GCodeIndex import GCodeLines
+
+PROGRESS_INTERVAL = 1000 # lines between calls of the progress callback
+AXIS_WORD = re.compile(r'([XYZ])\s*[-+.\d]')
+
+
+class CompiledJob:
+
+    def __init__(self, fileName, gcode, times, source, sourceLines):
+        self.fileName = fileName # compiled gcode file, removed by close()
+        self.gcode = gcode # compiled lines
+        self.commands = GCodeLines(fileName, gcode.offsets, True) # the compiled lines are already prepared commands
+        self.times = times # cumulative time of each compiled line (the time of the line it comes from)
+        self.source = source # original lines
+        self.sourceLines = sourceLines # index of the original line of each compiled line
+
+    def sourceLine(self, index):
+        # index and text of the original line a compiled line comes from, used to report the grbl errors
+        sourceIndex = self.sourceLines[index]
+        return sourceIndex, self.source[sourceIndex]
+
+    def close(self):
+        self.gcode.close()
+        self.commands.close()
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
+
+
+def compileJob(gcode, times, zCompensation, prepare = None, progress = None):
+    # compile the lines of a job with a ZCompensation. prepare converts a line into the command sent to grbl;
+    # progress is called with the current line index, and can return False to cancel the compilation (None is returned)
+    analyzer = GCodeAnalyzer(False)
+    # the analyzer starts at X0 Y0 Z0, but the machine doesn't: the moves are sent unchanged until the job has set
+    # the three axes, otherwise the first move would get a Z target from a wrong start point
+    knownAxes = set()
+    fd, fileName = tempfile.mkstemp(suffix='.nc', prefix='raspycnc-compiled-')
+    offsets = array('L', [0])
+    compiledTimes = array(times.typecode if isinstance(times, array) else 'd')
+    sourceLines = array('l')
+    offset = 0
+    canceled = False
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for index, line in enumerate(gcode):
+                if progress is not None and index % PROGRESS_INTERVAL == 0 and progress(index) is False:
+                    canceled = True
+                    break
+
+                command = prepare(line) if prepare is not None else line.strip()
+                if not command or command[0] == '(':
+                    continue
+
+                analyzer.Analyze(command)
+                move = analyzer.lastMovementGCode
+                if move is not None and not analyzer.relative and len(knownAxes) == 3: # z compensation only works in absolute coords
+                    commands = zCompensation.compensateMove(move)
+                else:
+                    commands = [command]
+                if len(knownAxes) < 3 and not analyzer.relative:
+                    knownAxes.update(AXIS_WORD.findall(command.upper()))
+
+                for command in commands:
+                    f.write(command + '\n')
+                    offset += len(command) + 1
+                    offsets.append(offset)
+                    compiledTimes.append(times[index])
+                    sourceLines.append(index)
+    except:
+        os.remove(fileName)
+        raise
+
+    if canceled:
+        os.remove(fileName)
+        return None
+
+    return CompiledJob(fileName, GCodeLines(fileName, offsets), compiledTimes, gcode, sourceLines)
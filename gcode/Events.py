@@ -0,0 +1,46 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Events with the interface of the Qt signals (connect, disconnect, emit), for the parts of the program that must
+# work without Qt. The callbacks are called in the thread that emits the event: the Qt adapters replace the events
+# with real signals when the connected slots must run in the GUI thread.
+
+import threading
+
+
+class Event(object):
+
+    def __init__(self):
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def connect(self, callback):
+        with self.lock:
+            self.callbacks = self.callbacks + [callback]
+
+    def disconnect(self, callback = None):
+        # remove a callback, or all of them
+        with self.lock:
+            if callback is None:
+                self.callbacks = []
+            else:
+                self.callbacks = [c for c in self.callbacks if c != callback]
+
+    def emit(self, *args):
+        for callback in self.callbacks:
+            callback(*args)
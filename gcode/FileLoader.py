@@ -0,0 +1,102 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Loading of a gcode file for a job, independent of the user interface: the lines are analyzed (on all the cores
+# for large files), or the analysis is taken from the cache. The results of the check mode are kept in the check registry.
+
+import os
+import multiprocessing
+
+import pycnc_config
+from GCodeIndex import analyzeFile
+from ParallelAnalysis import analyzeFileParallel
+from AnalysisCache import AnalysisCache, analysisSignature, fileHash
+from CheckRegistry import CheckRegistry, checkSignature, grblVersion
+from GCodePreprocessor import prepareLines
+
+
+def openAnalysisCache():
+    # the cache is optional: loading works even if the cache directory cannot be used
+    if not pycnc_config.ANALYSIS_CACHE_DIR:
+        return None
+    try:
+        return AnalysisCache(pycnc_config.ANALYSIS_CACHE_DIR, pycnc_config.ANALYSIS_CACHE_SIZE)
+    except (OSError, IOError):
+        print "Cannot use the analysis cache in", pycnc_config.ANALYSIS_CACHE_DIR
+        return None
+
+def openCheckRegistry():
+    # like the analysis cache, the registry is optional
+    if not pycnc_config.CHECK_REGISTRY_FILE:
+        return None
+    try:
+        return CheckRegistry(pycnc_config.CHECK_REGISTRY_FILE)
+    except Exception:
+        print "Cannot use the check registry", pycnc_config.CHECK_REGISTRY_FILE
+        return None
+
+def getCheckResult(contentHash, grblConfig):
+    # CheckResult of the last check of a file with the current grbl settings, or None if it was never checked
+    registry = openCheckRegistry()
+    if registry is None:
+        return None
+    try:
+        return registry.get(contentHash, checkSignature(grblConfig, pycnc_config.SUPPRESS_GCODE))
+    except Exception:
+        print "Cannot read the check registry"
+        return None
+    finally:
+        registry.close()
+
+def putCheckResult(contentHash, grblConfig, errors):
+    registry = openCheckRegistry()
+    if registry is None:
+        return
+    try:
+        registry.put(contentHash, checkSignature(grblConfig, pycnc_config.SUPPRESS_GCODE), errors, grblVersion(grblConfig))
+    except Exception:
+        print "Cannot write the check registry"
+    finally:
+        registry.close()
+
+def loadGCodeFile(fileName, g0_feed, grblConfig = None):
+    # returns a GCodeAnalysis with the lines, the cumulative times and the bounding box of the file,
+    # the commands prepared for grbl (commands) and the hash of the content (contentHash)
+    # large files are not kept in memory: the lines are read from the file and prepared when needed
+    size = os.path.getsize(fileName)
+    lowMemory = size >= pycnc_config.LOADER_INDEX_SIZE
+    if not pycnc_config.ESTIMATE_ACCELERATION:
+        grblConfig = None
+    result = None
+    cache = openAnalysisCache()
+    if cache is not None:
+        signature = analysisSignature(g0_feed, grblConfig)
+        result = cache.get(fileName, signature, lowMemory)
+    if result is None:
+        if size >= pycnc_config.PARALLEL_LOAD_SIZE and multiprocessing.cpu_count() > 1:
+            result = analyzeFileParallel(fileName, g0_feed, grblConfig, lowMemory, pycnc_config.PARALLEL_LOAD_PROCESSES)
+        else:
+            result = analyzeFile(fileName, g0_feed, grblConfig, lowMemory)
+        if cache is not None:
+            try:
+                cache.put(fileName, signature, result)
+            except (OSError, IOError):
+                print "Cannot write the analysis cache"
+    result.commands = prepareLines(result.gcode)
+    result.contentHash = cache.contentHash(fileName) if cache is not None else fileHash(fileName)
+    return result
@@ -42,6 +42,13 @@ def euclidean_distance(start, end):
     return math.sqrt(sum([(e - s) ** 2 for (s, e) in zip(start, end)]))
 
 
+def euclidean_distance3(x0, y0, z0, x1, y1, z1):
+    dx = x1 - x0
+    dy = y1 - y0
+    dz = z1 - z0
+    return math.sqrt(dx*dx + dy*dy + dz*dz)
+
+
 def arc_distance(center, start, end, ccw):
     startRel = (start[0] - center[0], start[1] - center[1])
     endRel = (end[0] - center[0], end[1] - center[1])
@@ -53,7 +60,32 @@ def arc_distance(center, start, end, ccw):
     travelAngle = travelAngle % (2 * math.pi)  # if angle is negative, it actually means that it's 360 - angle
     return travelAngle * radius
 
-class MovementGCode:
+def arcPoints(start, end, center, ccw, maxDistance, tolerance):
+    # generator of the end points of the chords of an arc in the XY plane (possibly helical)
+    radius = math.hypot(start[0] - center[0], start[1] - center[1])
+    startAngle = math.atan2(start[1] - center[1], start[0] - center[0])
+    endAngle = math.atan2(end[1] - center[1], end[0] - center[0])
+    travelAngle = (endAngle - startAngle) if ccw else (startAngle - endAngle)
+    travelAngle = travelAngle % (2 * math.pi)
+    if travelAngle < 1e-9:
+        travelAngle = 2 * math.pi # same start and end point: full circle
+
+    nSegments = 1
+    if tolerance < radius:
+        maxAngle = 2 * math.acos(1 - tolerance / radius) # chord whose distance from the arc is the tolerance
+        nSegments = int(math.ceil(travelAngle / maxAngle))
+    nSegments = max(nSegments, int(math.ceil(travelAngle * radius / maxDistance)))
+
+    sign = 1.0 if ccw else -1.0
+    for k in xrange(1, nSegments):
+        t = float(k) / nSegments
+        angle = startAngle + sign * travelAngle * t
+        yield (center[0] + radius * math.cos(angle), center[1] + radius * math.sin(angle), start[2] + (end[2] - start[2]) * t)
+    yield end
+
+class MovementGCode(object):
+    __slots__ = ('g', 'x', 'y', 'i', 'j', 'z', 'e', 'f', 'startX', 'startY', 'startZ')
+
     def __init__(self, g):
         self.g = g
         self.x = None
@@ -81,61 +113,32 @@ class MovementGCode:
         if self.f is not None: cmd += " F%.4f" % (self.f)
         return cmd
 
-    def splitMovement(self, maxDistance):
-#        print "Splitting movement",(self.startX, self.startY, self.startZ), (self.x, self.y, self.z)
-#        print "Original G", self.getCommand()
+    def splitPoints(self, maxDistance, arcTolerance = None):
+        # generator of the end points of evenly spaced segments, no longer than maxDistance, that make up the move.
+        # Arcs are split into chords that deviate from the arc by at most arcTolerance (if None, arcs are not split)
         if (self.startX is None or
             self.startY is None or
             self.startZ is None or
             self.e is not None or
-            self.isArc()): # arc will not be split
-            return [self]
-
-        myDistance = euclidean_distance( (self.startX, self.startY, self.startZ), (self.x, self.y, self.z) )
-        #print "My distance:", myDistance
-        if myDistance <= maxDistance:
-            return [self]
-
-        midpointX = (self.startX + self.x) / 2
-        midpointY = (self.startY + self.y) / 2
-        midpointZ = (self.startZ + self.z) / 2
-
-#        print "mid point: ", midpointX, midpointY, midpointZ
-
-        # now split the movement in the middle
-        firstMovement = MovementGCode(self.g)
-
-        firstMovement.f = self.f
-
-        firstMovement.startX = self.startX
-        firstMovement.startY = self.startY
-        firstMovement.startZ = self.startZ
-
-        firstMovement.x = midpointX
-        firstMovement.y = midpointY
-        firstMovement.z = midpointZ
-
-#        print "first movement", firstMovement
-
-        secondMovement = MovementGCode(self.g)
-
-        secondMovement.f = self.f
-
-        secondMovement.startX = midpointX
-        secondMovement.startY = midpointY
-        secondMovement.startZ = midpointZ
-
-        secondMovement.x = self.x
-        secondMovement.y = self.y
-        secondMovement.z = self.z
-
-#        print "second movement", secondMovement
-
-        outList = [] # recursively split movements
-        outList.extend(firstMovement.splitMovement(maxDistance))
-        outList.extend(secondMovement.splitMovement(maxDistance))
-
-        return outList
+            (self.isArc() and arcTolerance is None)):
+            yield (self.x, self.y, self.z)
+            return
+
+        if self.isArc():
+            for point in arcPoints((self.startX, self.startY, self.startZ), (self.x, self.y, self.z),
+                                   (self.startX + (self.i or 0), self.startY + (self.j or 0)), self.g == 3,
+                                   maxDistance, arcTolerance):
+                yield point
+            return
+
+        nSegments = int(math.ceil(euclidean_distance3(self.startX, self.startY, self.startZ, self.x, self.y, self.z) / maxDistance))
+        dx = self.x - self.startX
+        dy = self.y - self.startY
+        dz = self.z - self.startZ
+        for k in xrange(1, nSegments):
+            t = float(k) / nSegments
+            yield (self.startX + dx * t, self.startY + dy * t, self.startZ + dz * t)
+        yield (self.x, self.y, self.z)
 
     def __repr__(self):
         return self.getCommand()
@@ -144,6 +147,16 @@ class MovementGCode:
         return self.g == 2 or self.g == 3
 
 
+# codes after which the grbl planner runs empty
+SYNC_GCODES = [10, 28, 30, 38.2, 38.3, 38.4, 38.5, 92, 161]
+SYNC_MCODES = [0, 1, 2, 3, 4, 5, 30]
+
+# attributes that are carried from one line to the next (the bounding box, travel and time are accumulated instead)
+STATE_ATTRIBUTES = ['x', 'y', 'z', 'e', 'lastX', 'lastY', 'lastZ', 'lastE', 'f',
+                    'xOffset', 'yOffset', 'zOffset', 'eOffset', 'relative', 'eRelative', 'metric',
+                    'hasHomeX', 'hasHomeY', 'hasHomeZ', 'moveInMachineCoords']
+
+
 def safeInt(val):
     try:
         return int(val)
@@ -158,14 +171,21 @@ def safeFloat(val):
         return 0
 
 
-# find a code in a gstring line
-def findCode(gcode, codeStr):
-    pattern = re.compile(codeStr + "\\s*(-?[\d.]*)", re.I)
-    m = re.search(pattern, gcode)
-    if m == None:
-        return None
-    else:
-        return m.group(1)
+# a gcode word: a letter followed by a (possibly empty) number
+wordPattern = re.compile("([A-Z])\\s*(-?[\\d.]*)")
+
+# split a line (without comments) into blocks, one for each G or M word.
+# Every block is returned as (first letter, {letter: value string}); only the first occurrence of a letter is kept
+def tokenizeLine(gcode):
+    blocks = []
+    words = None
+    for letter, value in wordPattern.findall(gcode.upper()):
+        if words is None or letter == 'G' or letter == 'M':
+            words = {}
+            blocks.append((letter, words))
+        if letter not in words:
+            words[letter] = value
+    return blocks
 
 
 
@@ -175,6 +195,8 @@ class GCodeAnalyzer():
         self.Reset()
         self.converter = GCodeConverter()
         self.calculateTravel = calculateTravel
+        self.planner = None # optional PlannerTimeEstimator that receives all the moves
+        self.trackMovements = True # create lastMovementGCode for every move. Not needed when only analyzing a file
 
     def Reset(self):
         self.x = 0
@@ -242,26 +264,35 @@ class GCodeAnalyzer():
         if gcode.find("$") >= 0:
             gcode = gcode[:gcode.find("$")]  # ignore configuration/jog commands
 
-        tokens = ['']
-        # convert multiple G commands on one line
-        tokens.extend(re.split('([GM][^GM]+)', gcode, re.I))
-        for line in tokens:
-            if line.strip() != "":
-                # print "Analyze ", line
-                self.AnalyzeLine(self.converter.convert(line))  # handles grbl-style code
+        if gcode.lstrip().startswith("@"):
+            # code is a host command
+            self.lastMovementGCode = None
+        else:
+            # single pass over the line; multiple G commands on one line are split into blocks
+            for first, words in tokenizeLine(gcode):
+                self.AnalyzeWords(self.converter.convertWords(first, words))  # handles grbl-style code
 
         self.moveInMachineCoords = False # this flag gets reset at the end of the gcode line
+        if self.planner is not None:
+            self.planner.endLine()
 
     def AnalyzeLine(self, gcode):
-        self.lastMovementGCode = None  # by default, the move was not a g[0-3]; set it differently in case of actual movement gcode
-
         gcode = gcode.lstrip();
-        if gcode.startswith("@"): return  # code is a host command
+        if gcode.startswith("@"):  # code is a host command
+            self.lastMovementGCode = None
+            return
+
+        for first, words in tokenizeLine(gcode):
+            if '$H' in gcode:
+                words['G'] = str(28) # this is a homing command equivalent to g28
+            self.AnalyzeWords(words)
+
+    def AnalyzeWords(self, words):
+        # words is a dictionary {letter: value string} of a single gcode block
+        self.lastMovementGCode = None  # by default, the move was not a g[0-3]; set it differently in case of actual movement gcode
 
-        code_g = findCode(gcode, "G")
-        if '$H' in gcode:
-            code_g = str(28) # this is a homing command equivalent to g28
-        code_m = findCode(gcode, "M")
+        code_g = words.get("G")
+        code_m = words.get("M")
         # we have a g_code
         if code_g != None:
             if '.' in code_g: # codes like 38.2 were considered G0!
@@ -281,14 +312,14 @@ class GCodeAnalyzer():
                 self.lastZ = self.z
                 self.lastE = self.e
                 eChanged = False;
-                code_f = findCode(gcode, "F")
+                code_f = words.get("F")
                 if code_f != None:
                     self.f = safeFloat(code_f) * metricConv
 
-                code_x = findCode(gcode, "X")
-                code_y = findCode(gcode, "Y")
-                code_z = findCode(gcode, "Z")
-                code_e = findCode(gcode, "E")
+                code_x = words.get("X")
+                code_y = words.get("Y")
+                code_z = words.get("Z")
+                code_e = words.get("E")
 
                 if self.moveInMachineCoords: # convert the machine coords move to work coords
                     print "Move is in machine coords!"
@@ -302,25 +333,26 @@ class GCodeAnalyzer():
                         code_z = safeFloat(code_z) + self.zOffset
 
 
-                code_i = findCode(gcode, "I")
-                code_j = findCode(gcode, "J")
+                code_i = words.get("I")
+                code_j = words.get("J")
 
-                self.lastMovementGCode = MovementGCode(code_g)
-                self.lastMovementGCode.startX = self.lastX/metricConv
-                self.lastMovementGCode.startY = self.lastY/metricConv
-                self.lastMovementGCode.startZ = self.lastZ/metricConv
-                self.lastMovementGCode.x = safeFloat(code_x or self.lastX/metricConv)
-                self.lastMovementGCode.y = safeFloat(code_y or self.lastY/metricConv)
-                self.lastMovementGCode.z = safeFloat(code_z or self.lastZ/metricConv)
-                if code_g == 2 or code_g == 3:
-                    self.lastMovementGCode.i = safeFloat(code_i)
-                    self.lastMovementGCode.j = safeFloat(code_j)
+                if self.trackMovements:
+                    self.lastMovementGCode = MovementGCode(code_g)
+                    self.lastMovementGCode.startX = self.lastX/metricConv
+                    self.lastMovementGCode.startY = self.lastY/metricConv
+                    self.lastMovementGCode.startZ = self.lastZ/metricConv
+                    self.lastMovementGCode.x = safeFloat(code_x or self.lastX/metricConv)
+                    self.lastMovementGCode.y = safeFloat(code_y or self.lastY/metricConv)
+                    self.lastMovementGCode.z = safeFloat(code_z or self.lastZ/metricConv)
+                    if code_g == 2 or code_g == 3:
+                        self.lastMovementGCode.i = safeFloat(code_i)
+                        self.lastMovementGCode.j = safeFloat(code_j)
 
-                if code_e:
-                    self.lastMovementGCode.e = safeFloat(code_e)
+                    if code_e:
+                        self.lastMovementGCode.e = safeFloat(code_e)
 
-                if code_f:
-                    self.lastMovementGCode.f = safeFloat(code_f)
+                    if code_f:
+                        self.lastMovementGCode.f = safeFloat(code_f)
 
 
                 if self.relative:
@@ -362,7 +394,7 @@ class GCodeAnalyzer():
                 # calculate travelled distance. Quite time consuming, so only do it if needed.
                 if self.calculateTravel:
                     if code_g == 0 or code_g == 1:
-                        travel_len = euclidean_distance((self.lastX, self.lastY, self.lastZ), (self.x, self.y, self.z))
+                        travel_len = euclidean_distance3(self.lastX, self.lastY, self.lastZ, self.x, self.y, self.z)
                         if code_g == 0:
                             travel_time = travel_len / self.fastf
                         else:
@@ -378,7 +410,19 @@ class GCodeAnalyzer():
                 self.travel += travel_len
                 self.time += travel_time
 
+                if self.planner is not None:
+                    if code_g == 0:
+                        self.planner.addLine((self.lastX, self.lastY, self.lastZ), (self.x, self.y, self.z), None)
+                    elif code_g == 1:
+                        self.planner.addLine((self.lastX, self.lastY, self.lastZ), (self.x, self.y, self.z), self.f)
+                    else:
+                        center = (self.lastX + safeFloat(code_i) * metricConv, self.lastY + safeFloat(code_j) * metricConv)
+                        self.planner.addArc((self.lastX, self.lastY, self.lastZ), (self.x, self.y, self.z), center, code_g == 3, self.f)
+
                 # Repetier has a bunch of limit-checking code here and time calculations: we are leaving them for now
+            elif code_g == 4:
+                if self.planner is not None:
+                    self.planner.addStop(safeFloat(words.get("P"))) # dwell in seconds
             elif code_g == 20:
                 self.metric = False
             elif code_g == 21:
@@ -388,10 +432,10 @@ class GCodeAnalyzer():
                 self.lastY = self.y
                 self.lastZ = self.z
                 self.lastE = self.e
-                code_x = findCode(gcode, "X")
-                code_y = findCode(gcode, "Y")
-                code_z = findCode(gcode, "Z")
-                code_e = findCode(gcode, "E")
+                code_x = words.get("X")
+                code_y = words.get("Y")
+                code_z = words.get("Z")
+                code_e = words.get("E")
                 homeAll = False
                 if code_x == None and code_y == None and code_z == None: homeAll = True
                 if code_x != None or homeAll:
@@ -414,9 +458,9 @@ class GCodeAnalyzer():
             #     self.lastY = self.y
             #     self.lastZ = self.z
             #     self.lastE = self.e
-            #     code_x = findCode(gcode, "X")
-            #     code_y = findCode(gcode, "Y")
-            #     code_z = findCode(gcode, "Z")
+            #     code_x = words.get("X")
+            #     code_y = words.get("Y")
+            #     code_z = words.get("Z")
             #     homeAll = False
             #     if code_x == None and code_y == None and code_z == None: homeAll = True
             #     if code_x != None or homeAll:
@@ -438,10 +482,10 @@ class GCodeAnalyzer():
             elif code_g == 91:
                 self.relative = True
             elif code_g == 92 or code_g == 10:
-                code_x = findCode(gcode, "X")
-                code_y = findCode(gcode, "Y")
-                code_z = findCode(gcode, "Z")
-                code_e = findCode(gcode, "E")
+                code_x = words.get("X")
+                code_y = words.get("Y")
+                code_z = words.get("Z")
+                code_e = words.get("E")
 
                 current_machine_coords = self.getMachineXYZ()
 
@@ -477,8 +521,12 @@ class GCodeAnalyzer():
                 # if code_e != None:
                 #   self.eOffset = self.e - safeFloat(code_e)
                 #   self.e = self.eOffset
+            if self.planner is not None and code_g in SYNC_GCODES:
+                self.planner.addStop()
         if code_m != None:
             code_m = safeInt(code_m)
+            if self.planner is not None and code_m in SYNC_MCODES:
+                self.planner.addStop()
             if code_m == 82:
                 self.eRelative = False
             elif code_m == 83:
@@ -486,6 +534,22 @@ class GCodeAnalyzer():
 
     #    self.print_status()
 
+    # state of the analyzer between two lines. Two analyzers with the same state produce the same results for the following lines
+    def getState(self):
+        state = [getattr(self, name) for name in STATE_ATTRIBUTES]
+        state += [self.converter.motionG, self.converter.wordX, self.converter.wordY]
+        if self.planner is not None:
+            state.append(self.planner.stopPending)
+        return tuple(state)
+
+    def setState(self, state):
+        for name, value in zip(STATE_ATTRIBUTES, state):
+            setattr(self, name, value)
+        n = len(STATE_ATTRIBUTES)
+        self.converter.motionG, self.converter.wordX, self.converter.wordY = state[n:n+3]
+        if self.planner is not None:
+            self.planner.stopPending = state[n+3]
+
     def getMachineXYZ(self):
         return self.x - self.xOffset, self.y - self.yOffset, self.z - self.zOffset
 
@@ -496,7 +560,7 @@ class GCodeAnalyzer():
         if grblWorkStatus is None:
             # we only have one status report. Update the correct coordinates
             if grblMachineStatus['type'] == 'Work':
-                self.x, self.y, self.z = grblWorkStatus['position']
+                self.x, self.y, self.z = grblMachineStatus['position']
             else:
                 self.x = grblMachineStatus['position'][0] + self.xOffset
                 self.y = grblMachineStatus['position'][1] + self.yOffset
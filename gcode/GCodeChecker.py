@@ -0,0 +1,121 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Check of a gcode job in the grbl check mode ($C), independent of the user interface. The prepared commands are
+# streamed like a real job (the receive buffer of grbl is kept full), and the errors are collected as the responses
+# come back, instead of waiting for the response of each line.
+
+import sys
+import threading
+
+import pycnc_config
+from gcode.Events import Event
+from gcode.GCodePreprocessor import PAUSE_COMMAND
+from gcode.RateLimiter import RateLimiter
+
+
+class GCodeChecker(object):
+
+    def __init__(self):
+        self.progress_event = Event() # emitted with (lines sent, total lines), at most PROGRESS_UPDATE_RATE times per second
+        self.end_event = Event() # emitted with the list of errors (line number, error message) when all the lines are checked
+        self.stop_event = Event() # the check was stopped
+        self.error_event = Event()
+        self.grblWriter = None
+        self.commands = None
+        self.errors = [] # the line number is None for an error that does not belong to a checked line (e.g. an alarm)
+        self.stopFlag = False
+        self.progressLimiter = RateLimiter(pycnc_config.PROGRESS_UPDATE_RATE)
+        self.wakeEvent = threading.Event()
+
+    def setGrbl(self, grblWriter):
+        self.grblWriter = grblWriter
+
+    def setCommands(self, commands):
+        # prepared commands of the job (GCodePreprocessor)
+        self.commands = commands
+
+    def stop(self):
+        # from any thread
+        self.stopFlag = True
+        self.wakeup()
+
+    def wakeup(self):
+        self.wakeEvent.set()
+
+    def run(self):
+        if self.grblWriter is None or self.commands is None: return
+
+        self.errors = []
+        self.stopFlag = False
+        self.grblWriter.line_received.connect(self.wakeup)
+        try:
+            self.grblWriter.set_check_mode(True)
+            self.checkGCode()
+        except:
+            self.error_event.emit("%s" % sys.exc_info()[0])
+            return
+        finally:
+            self.grblWriter.line_received.disconnect(self.wakeup)
+            self.grblWriter.set_check_mode(False) # get out of check mode
+
+        if self.stopFlag:
+            self.stop_event.emit()
+        else:
+            self.end_event.emit(self.errors)
+
+    def checkGCode(self):
+        writer = self.grblWriter
+        totLines = len(self.commands)
+        currentLine = 0
+        command = None # next command to be sent
+        sending = True
+        self.progressLimiter.reset()
+
+        # after a stop, the lines already in the buffer of grbl are still acknowledged: the responses must be read
+        while (sending and currentLine < totLines and not self.stopFlag) or writer.waitAck > 0:
+            # cleared before reading the responses: anything that arrives later wakes up the loop
+            self.wakeEvent.clear()
+
+            received, lineNumber, error = writer.stream_response()
+            if received:
+                if error is not None:
+                    self.errors.append((lineNumber, error))
+                    if 'ALARM' in error:
+                        sending = False # grbl is locked: the next lines would only return errors
+                continue
+
+            if sending and currentLine < totLines and not self.stopFlag:
+                if command is None:
+                    command = self.commands[currentLine]
+                if not command or command == PAUSE_COMMAND:
+                    command = None
+                    currentLine += 1
+                    continue
+                if writer.has_buffer_space(command):
+                    writer.stream_line(command, currentLine)
+                    command = None
+                    currentLine += 1
+                    if self.progressLimiter.ready():
+                        self.progress_event.emit(currentLine, totLines)
+                    continue
+
+            # nothing to do until a response arrives. The timeout protects from a lost response
+            self.wakeEvent.wait(1.0)
+
+        self.progress_event.emit(currentLine, totLines)
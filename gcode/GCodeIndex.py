@@ -0,0 +1,126 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Loading and analysis of gcode files, without Qt.
+#
+# Small files are kept in memory as a list of lines. For large files only an index of the line offsets
+# is stored, and the lines are read on demand from the file while the job is streamed. The lines are read with
+# seek and read, not through mmap: if the file is truncated or its USB stick is removed, a read raises an IOError
+# that the streamer reports, where an access to a mapping would kill the program with SIGBUS.
+
+import threading
+from array import array
+
+from GCodeAnalyzer import GCodeAnalyzer
+from PlannerTimeEstimator import PlannerTimeEstimator
+
+
+class GCodeLines(object):
+    # read-only sequence of the lines of a file, backed by an index of line offsets
+
+    def __init__(self, fileName, offsets, stripped = False):
+        self.fileName = fileName
+        self.offsets = offsets # offsets[i] is the start of line i, offsets[-1] is the end of the last line
+        self.stripped = stripped # the lines are returned without their newline (prepared commands)
+        self.file = open(fileName, 'rb')
+        self.lock = threading.Lock() # the lines are read by the streamer and by the user interface
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("line index out of range")
+        start = self.offsets[index]
+        length = self.offsets[index+1] - start
+        with self.lock:
+            self.file.seek(start)
+            line = self.file.read(length)
+        if len(line) != length:
+            raise IOError("%s was changed or removed" % self.fileName)
+        return line.rstrip('\n') if self.stripped else line
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def close(self):
+        self.file.close()
+
+
+class GCodeAnalysis(object):
+    # result of the analysis of a file
+
+    def __init__(self):
+        self.gcode = None # list of lines, or GCodeLines
+        self.times = None # cumulative time (s) at the end of each line
+        self.bBox = None
+        self.totalTime = 0
+        self.travel = 0
+        self.offsets = None # start offset of each line, and end of the file
+
+
+def readLines(fileName, offsets, lowMemory):
+    # the lines of a file whose line offsets are known
+    if lowMemory:
+        return GCodeLines(fileName, offsets)
+    with open(fileName, 'rb') as f:
+        return f.readlines()
+
+
+def analyzeFile(fileName, g0_feed, grblConfig = None, lowMemory = False):
+    # analyze a gcode file. If grblConfig contains the acceleration settings, the acceleration-aware
+    # time estimation is used. In lowMemory mode only the line offsets are stored.
+    analyzer = GCodeAnalyzer()
+    analyzer.fastf = g0_feed
+    analyzer.trackMovements = False
+    timeTypecode = 'f' if lowMemory else 'd' # single precision is more than enough for the display
+    if PlannerTimeEstimator.isSupported(grblConfig):
+        analyzer.planner = PlannerTimeEstimator(grblConfig, timeTypecode)
+
+    times = array(timeTypecode)
+    offsets = array('L', [0])
+    offset = 0
+    if not lowMemory:
+        gcode = []
+
+    with open(fileName, 'rb') as f:
+        for line in f:
+            analyzer.Analyze(line)
+            offset += len(line)
+            offsets.append(offset)
+            if not lowMemory:
+                gcode.append(line)
+            if analyzer.planner is None:
+                times.append(analyzer.getTravelTime()*60) # time returned is in minutes: convert to seconds
+
+    if analyzer.planner is not None:
+        times = analyzer.planner.computeLineTimes()
+
+    result = GCodeAnalysis()
+    result.gcode = GCodeLines(fileName, offsets) if lowMemory else gcode
+    result.times = times
+    result.totalTime = times[-1] if len(times) > 0 else 0
+    result.bBox = analyzer.getBoundingBox()
+    result.travel = analyzer.getTravelLen()
+    result.offsets = offsets
+    return result
@@ -17,11 +17,12 @@
 # along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
 
 from PySide import QtCore
-from GCodeAnalyzer import GCodeAnalyzer
+from FileLoader import loadGCodeFile
 import sys
 import pycnc_config
 
 class GCodeLoader(QtCore.QThread):
+    # Qt adapter of loadGCodeFile: the file is loaded in this thread
 
     load_finished = QtCore.Signal()
     load_error = QtCore.Signal(object)
@@ -37,42 +38,36 @@ class GCodeLoader(QtCore.QThread):
         self.totalTime = 0
         self.busy = False
         self.g0_feed = pycnc_config.G0_FEED
+        self.grblConfig = None # grbl settings, used for the acceleration-aware time estimation
 
     def run(self):
         self.loaded = False
         self.gcode = []
+        self.commands = []
+        self.contentHash = None
         self.times = []
         self.bBox = None
         self.totalTime = 0
         self.busy = True
 
-        analyzer = GCodeAnalyzer()
-        analyzer.fastf = self.g0_feed
-
         try:
-            with open(self.file) as f:
-                for line in f:
-                    analyzer.Analyze(line)
-                    self.gcode.append(line)
-                    self.times.append(analyzer.getTravelTime()*60) # time returned is in minutes: convert to seconds
+            result = loadGCodeFile(self.file, self.g0_feed, self.grblConfig)
         except:
             self.busy = False
             e = sys.exc_info()[0]
             self.load_error.emit("%s" % e)
             return
 
+        self.gcode = result.gcode
+        self.commands = result.commands
+        self.contentHash = result.contentHash
+        self.times = result.times
         self.busy = False
         self.loaded = True
-        self.totalTime = self.times[-1]
-        self.bBox = analyzer.getBoundingBox()
+        self.totalTime = result.totalTime
+        self.bBox = result.bBox
         self.load_finished.emit()
 
     def load(self, file):
         self.file = file
         self.start()
-
-
-
-
-
-
@@ -0,0 +1,110 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Preparation of the gcode lines for grbl, done once when a file is loaded: the numbers are truncated to 4 decimals,
+# the comments and the unsupported codes (SUPPRESS_GCODE) are removed, and the @pause host commands are recognized.
+# While streaming, the prepared commands are just written to the port.
+
+import os
+import re
+import tempfile
+from array import array
+
+import pycnc_config
+from gcode.GCodeIndex import GCodeLines
+
+PAUSE_COMMAND = '@pause' # prepared command of the lines with a @pause host command
+
+truncatePattern = re.compile(r"(\.[0-9]{4})[0-9]+")
+commentPattern = re.compile(r"\([^)]*\)|;.*")
+suppressPatterns = {} # combined pattern for each list of codes to suppress
+
+def truncateGCode(gcode):
+    # numbers are truncated to 4 decimals
+    return truncatePattern.sub(r"\1", gcode)
+
+def suppressPattern(codes):
+    codes = tuple(codes)
+    pattern = suppressPatterns.get(codes)
+    if pattern is None:
+        # suppress M6 but not M66, even when it's M6G0, for example
+        pattern = re.compile('(?:' + '|'.join(codes) + ')(?![0-9.])[^MG]*', re.I)
+        suppressPatterns[codes] = pattern
+    return pattern
+
+def suppressAllInvalidGCodes(gcodeLine, codes = None):
+    if codes is None:
+        codes = pycnc_config.SUPPRESS_GCODE
+    if not codes:
+        return gcodeLine
+    return suppressPattern(codes).sub('', gcodeLine)
+
+def prepareGCode(line, codes = None):
+    # returns the command to send to grbl for a line of a file, '' if there is nothing to send, or PAUSE_COMMAND
+    if '@pause' in line:
+        return PAUSE_COMMAND
+    if '(' in line or ';' in line:
+        line = commentPattern.sub('', line)
+    if '.' in line:
+        line = truncateGCode(line)
+    return suppressAllInvalidGCodes(line.strip(), codes).strip()
+
+
+class PreparedLines(object):
+    # prepared commands of a sequence of lines, computed when they are accessed (for the files that are not kept in memory)
+
+    def __init__(self, gcode):
+        self.gcode = gcode
+
+    def __len__(self):
+        return len(self.gcode)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [prepareGCode(line) for line in self.gcode[index]]
+        return prepareGCode(self.gcode[index])
+
+    def __iter__(self):
+        for line in self.gcode:
+            yield prepareGCode(line)
+
+
+def prepareLines(gcode):
+    # the commands of all the lines, prepared now: kept in memory for a list of lines, written to a temporary file
+    # for the lines read from a file (GCodeLines), which are not kept in memory
+    codes = pycnc_config.SUPPRESS_GCODE
+    if isinstance(gcode, list):
+        return [prepareGCode(line, codes) for line in gcode]
+    return prepareFile(gcode, codes)
+
+def prepareFile(gcode, codes = None):
+    # returns the prepared commands as GCodeLines of a temporary file. The file is removed as soon as it is open:
+    # its space is freed when the lines are closed or garbage collected
+    fd, fileName = tempfile.mkstemp(suffix='.nc', prefix='raspycnc-prepared-')
+    offsets = array('L', [0])
+    offset = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for line in gcode:
+                command = prepareGCode(line, codes) + '\n'
+                f.write(command)
+                offset += len(command)
+                offsets.append(offset)
+        return GCodeLines(fileName, offsets, True)
+    finally:
+        os.remove(fileName)
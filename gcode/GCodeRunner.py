@@ -17,23 +17,14 @@
 # along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
 
 from PySide.QtCore import QThread, Signal
-import re
-import sys
-import time
-from PySide.QtGui import QApplication, QMessageBox
 
-from gcode.GrblWriter import showGrblErrorMessageBox
+from gcode.GCodeStreamer import GCodeStreamer
+from gcode.GCodeChecker import GCodeChecker
+from gcode.GrblWriterQt import showGrblErrorMessageBox
 
 
-def truncateGCode(gcode):
-  def replace(match):
-	match = match.group(2)
-	return "." + match[0:4]
-
-  pattern = re.compile(r"([.])([0-9]+)")
-  return re.sub(pattern, replace, gcode)
-
 class GCodeRunner(QThread):
+    # Qt adapter of the GCodeStreamer: the job is streamed in this thread, and the events are Qt signals
 
     error_event = Signal(object)
     progress_event = Signal(object)
@@ -44,125 +35,69 @@ class GCodeRunner(QThread):
 
     def __init__(self):
         QThread.__init__(self)
-        self.grblWriter = None
-        self.gcode = None
-        self.stopFlag = False
-        self.pauseFlag = False
-        self.currentLine = 0
-        self.waitForPause = False
-        self.errorStatus = False
+        self.streamer = GCodeStreamer()
+        self.streamer.error_event = self.error_event
+        self.streamer.progress_event = self.progress_event
+        self.streamer.stop_event = self.stop_event
+        self.streamer.pause_event = self.pause_event
+        self.streamer.end_event = self.end_event
+        self.streamer.errorHandler = lambda lnum, line, err: showGrblErrorMessageBox(None, lnum, line, err)
 
     def setGrbl(self, grblWriter):
-        self.grblWriter = grblWriter
-        self.grblWriter.grbl_error.connect(self.grblError)
+        self.streamer.grblWriter = grblWriter
+        self.streamer.errorsHandled = grblWriter.errorCount
+        # connected to this object, so that the error dialog is shown in the GUI thread
+        grblWriter.grbl_error.connect(self.grblError)
 
     def grblError(self, errorMsg):
-        self.errorStatus = True
-        if not showGrblErrorMessageBox(None, self.currentLine, self.gcode[self.currentLine], errorMsg):
-            self.stopFlag = True
-        self.errorStatus = False
+        self.streamer.grblError(errorMsg)
 
+    def setGcode(self, gcode, zCompensated = False, commands = None, source = None):
+        self.streamer.setGcode(gcode, zCompensated, commands, source)
 
-    def setGcode(self, gcode):
-        self.gcode = gcode
-        self.currentLine = 0
+    def setBBox(self, bBox):
+        self.streamer.setBBox(bBox)
 
-    def resume(self):
-        if not self.pauseFlag:
-            return
+    def setTimes(self, times, totalTime):
+        self.streamer.setTimes(times, totalTime)
 
-        self.pauseFlag = False
-        self.waitForPause = False
-        self.grblWriter.resume_pos()
-        self.pause_event.emit(False)
+    def resume(self):
+        self.streamer.resume()
 
     def pause(self):
-        if self.waitForPause or self.pauseFlag:
-            return
-
-        self.pauseFlag = True
-        self.waitForPause = True # this flag is on when pause was requested, but grbl hasn't cleared the queue yet
+        self.streamer.pause()
 
     def stop(self):
-        self.stopFlag = True
+        self.streamer.stop()
 
     def run(self):
-        totLines = len(self.gcode)
-
-        if self.grblWriter == None or self.gcode == None: return
-        self.pauseFlag = False
-        self.stopFlag = False
-
-        # make sure we are in absolute positioning when we start. Should be necessary because the gcode file should do it already.
-        self.grblWriter.do_command("G90")
-        self.grblWriter.do_command("G21")
-
-        errorStatus = False
-
-        while self.currentLine < totLines:
-
-            QApplication.processEvents()
-
-            if (self.stopFlag):
-                self.grblWriter.close()
-                self.stop_event.emit()
-                return
-
-            ack, lineIn = self.grblWriter.ack_received()
-
-            if self.errorStatus or (lineIn is not None and ('ALARM' in lineIn or 'error' in lineIn)):
-                time.sleep(0.01)
-                # this will be handled by the event
-                continue
-
-            if not ack:
-                time.sleep(0.01)
-                continue
-
-            # check for pause is after check for ack, so we are sure that GRBL is in sync
-            if (self.pauseFlag):
-                if self.waitForPause:
-                    self.waitForPause = False # now pause code is being processed
-                    # emit an event when the gcode has picked up with the pause
-                    self.grblWriter.store_pos()
-                    self.pause_event.emit(True)
-                # idle loop during pause
-                time.sleep(0.1)
-                continue
-
-            line = truncateGCode(self.gcode[self.currentLine])
-            if "@pause" in line:
-                self.currentLine += 1
-                self.pause()
-                continue
-
-            try:
-                self.grblWriter.do_command_nonblock(line)
-                self.currentLine += 1
-                self.progress_event.emit(self.currentLine)
-            except:
-                e = sys.exc_info()[0]
-                self.error_event.emit("%s" % e)
-
-        print "File finished. Waiting for last ack"
-        # wait for the last ack
-        while True:
-            ack, lineIn = self.grblWriter.ack_received()
-            if ack:
-                break
-            time.sleep(0.01)
-
-        print "Waiting for motion to finish"
-        #self.grblWriter.wait_motion()
-        self.grblWriter.wait_motion_nonblock()
-        while True:
-            ack, lineIn = self.grblWriter.ack_received()
-            if ack:
-                break
-            if self.stopFlag:
-                self.grblWriter.reset()
-                self.stop_event.emit()
-                return
-            time.sleep(0.1)
-        self.end_event.emit()
+        self.streamer.run()
+
+
+class GCodeCheckRunner(QThread):
+    # Qt adapter of the GCodeChecker: the job is checked in this thread, while the interface stays usable
+
+    progress_event = Signal(object, object)
+    end_event = Signal(object)
+    stop_event = Signal()
+    error_event = Signal(object)
 
+    def __init__(self):
+        QThread.__init__(self)
+        self.checker = GCodeChecker()
+        self.checker.progress_event = self.progress_event
+        self.checker.end_event = self.end_event
+        self.checker.stop_event = self.stop_event
+        self.checker.error_event = self.error_event
+
+    def setGrbl(self, grblWriter):
+        self.checker.setGrbl(grblWriter)
+
+    def setCommands(self, commands):
+        self.checker.setCommands(commands)
+
+    def stop(self):
+        self.checker.stop()
+
+    def run(self):
+        self.checker.run()
@@ -0,0 +1,308 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Streaming of a gcode job to grbl, independent of the user interface.
+
+import sys
+import time
+import Queue
+import threading
+
+import pycnc_config
+from gcode.Events import Event
+from gcode.GCodePreprocessor import prepareLines, PAUSE_COMMAND
+from gcode.RateLimiter import RateLimiter
+
+
+class Progress(object):
+    # state of the job sent with the progress_event
+
+    def __init__(self, line, totalLines, elapsed, remaining, rate):
+        self.line = line # lines sent
+        self.totalLines = totalLines
+        self.elapsed = elapsed # seconds since the start of the job
+        self.remaining = remaining # estimated seconds to the end of the job (None without the time estimates)
+        self.rate = rate # lines per second since the previous update
+
+
+class GCodeStreamer(object):
+    # streams a job to grbl in the calling thread. Does not depend on Qt: the graphical interface uses the
+    # GCodeRunner adapter, which runs the streamer in a QThread.
+    # The streaming loop sleeps until something happens: a response from grbl (line_received of the GrblWriter)
+    # or a command (pause, resume, stop) from another thread.
+
+    def __init__(self):
+        self.error_event = Event()
+        self.progress_event = Event()
+        self.stop_event = Event()
+        self.pause_event = Event()
+        self.end_event = Event()
+        self.errorHandler = None # called with (line number, line, error message) when grbl returns an error. Returns True to continue the job
+        self.grblWriter = None
+        self.gcode = None
+        self.commands = None # prepared commands of the lines (GCodePreprocessor)
+        self.times = None # estimated cumulative time of each line
+        self.totalTime = 0
+        self.zCompensated = False # the Z compensation is already applied to the gcode
+        self.source = None # CompiledJob the lines come from, used to report the errors on the original lines
+        self.safeZ = None # highest Z of the job: the tool is raised to it before going back to the position of a pause
+        self.stopFlag = False
+        self.pauseFlag = False
+        self.currentLine = 0
+        self.waitForPause = False
+        self.errorsHandled = 0 # errors processed by grblError, compared with the errorCount of the GrblWriter
+        self.linesPerSecond = 0
+        self.progressLimiter = RateLimiter(pycnc_config.PROGRESS_UPDATE_RATE)
+        self.startTime = 0
+        self.lastProgress = (0, 0) # time and line of the last progress update
+        self.commandQueue = Queue.Queue() # commands from other threads: 'pause', 'resume', 'stop'
+        self.wakeEvent = threading.Event()
+
+    def setGrbl(self, grblWriter):
+        self.grblWriter = grblWriter
+        self.errorsHandled = grblWriter.errorCount
+        self.grblWriter.grbl_error.connect(self.grblError)
+
+    def grblError(self, errorMsg):
+        try:
+            if self.gcode is None:
+                return # not streaming a job (e.g. an error of a jog command)
+            # with character counting, the error refers to a line that was sent earlier
+            errorLine = self.grblWriter.errorLineNumber
+            if errorLine is None or errorLine >= len(self.gcode):
+                errorLine = min(self.currentLine, len(self.gcode)-1)
+            line = self.gcode[errorLine]
+            if self.source is not None:
+                errorLine, line = self.source.sourceLine(errorLine)
+            if self.errorHandler is None or not self.errorHandler(errorLine, line, errorMsg):
+                self.stop()
+        finally:
+            # counted even if the handler fails: the streaming loop waits until all the errors are handled
+            self.errorsHandled += 1
+            self.wakeup()
+
+
+    def setGcode(self, gcode, zCompensated = False, commands = None, source = None):
+        # commands are the prepared lines (prepareLines). If they are not given, the lines are prepared now.
+        # source is the CompiledJob the lines come from, if any: the errors are reported on the original lines
+        self.gcode = gcode
+        self.commands = commands if commands is not None else prepareLines(gcode)
+        self.zCompensated = zCompensated
+        self.source = source
+        self.currentLine = 0
+
+    def setBBox(self, bBox):
+        # bounding box of the job, for the safe Z of the pauses
+        self.safeZ = bBox[1][2] if bBox is not None else None
+
+    def setTimes(self, times, totalTime):
+        # time estimates of the lines, used for the remaining time of the progress updates
+        self.times = times
+        self.totalTime = totalTime
+
+    # --- commands, from any thread ---
+
+    def resume(self):
+        self.sendCommand('resume')
+
+    def pause(self):
+        self.sendCommand('pause')
+
+    def stop(self):
+        self.sendCommand('stop')
+
+    def sendCommand(self, command):
+        self.commandQueue.put(command)
+        self.wakeup()
+
+    def wakeup(self):
+        self.wakeEvent.set()
+
+    def wait(self, timeout = None):
+        # sleep until a response or a command arrives
+        self.wakeEvent.wait(timeout)
+
+    def processCommands(self):
+        while True:
+            try:
+                command = self.commandQueue.get_nowait()
+            except Queue.Empty:
+                return
+            if command == 'stop':
+                self.stopFlag = True
+            elif command == 'pause':
+                self._pause()
+            elif command == 'resume':
+                self._resume()
+
+    def _resume(self):
+        if not self.pauseFlag:
+            return
+
+        self.pauseFlag = False
+        self.waitForPause = False
+        self.grblWriter.resume_pos()
+        self.pause_event.emit(False)
+
+    def _pause(self):
+        if self.waitForPause or self.pauseFlag:
+            return
+
+        self.pauseFlag = True
+        self.waitForPause = True # this flag is on when pause was requested, but grbl hasn't cleared the queue yet
+
+    # --- streaming ---
+
+    def run(self):
+        if self.grblWriter == None or self.gcode == None: return
+
+        # a compiled job must not be compensated again while streaming
+        wasZComp = self.grblWriter.doZCompensation
+        if self.zCompensated:
+            self.grblWriter.compensate_z(False)
+        self.grblWriter.line_received.connect(self.wakeup)
+        try:
+            self.streamGCode()
+        finally:
+            self.grblWriter.line_received.disconnect(self.wakeup)
+            self.grblWriter.compensate_z(wasZComp)
+
+    def streamGCode(self):
+        totLines = len(self.gcode)
+        self.pauseFlag = False
+        self.stopFlag = False
+        self.waitForPause = False
+        while not self.commandQueue.empty(): # commands sent while the job was not running
+            self.commandQueue.get_nowait()
+
+        # make sure we are in absolute positioning when we start. Should be necessary because the gcode file should do it already.
+        self.grblWriter.do_command("G90")
+        self.grblWriter.do_command("G21")
+
+        line = None # next line to be sent
+        startLine = self.currentLine
+        startTime = self.startTime = time.time()
+        self.lastProgress = (startTime, startLine)
+        self.progressLimiter.reset()
+
+        while self.currentLine < totLines:
+            # cleared before looking at the responses and the commands: anything that arrives later wakes up the loop
+            self.wakeEvent.clear()
+            self.processCommands()
+
+            if (self.stopFlag):
+                self.grblWriter.close()
+                self.stop_event.emit()
+                return
+
+            ack, lineIn = self.grblWriter.ack_received()
+
+            if self.errorsHandled < self.grblWriter.errorCount:
+                # every error emitted by the writer reaches grblError once. An error is still being handled
+                # (e.g. waiting for the user in the GUI thread): wait for it
+                self.wait()
+                continue
+
+            # check for pause is after check for ack, so we are sure that GRBL is in sync
+            if (self.pauseFlag):
+                if not ack:
+                    if lineIn is None:
+                        self.wait()
+                    continue
+                if self.waitForPause:
+                    self.waitForPause = False # now pause code is being processed
+                    # emit an event when the gcode has picked up with the pause
+                    self.grblWriter.store_pos(self.safeZ)
+                    self.grblWriter.publish_position() # the last throttled position update may have been dropped
+                    self.publishProgress()
+                    self.pause_event.emit(True)
+                # wait for resume or stop
+                self.wait()
+                continue
+
+            if line is None:
+                try:
+                    line = self.commands[self.currentLine]
+                except IOError as e:
+                    # a large file is read while streaming: it can be removed (USB stick) or changed
+                    self.error_event.emit("%s" % e)
+                    self.stop()
+                    continue
+            if line == PAUSE_COMMAND:
+                line = None
+                self.currentLine += 1
+                self._pause()
+                continue
+
+            if not self.grblWriter.has_buffer_space(line):
+                if lineIn is None: # nothing was received: wait for the next response
+                    self.wait()
+                continue
+
+            try:
+                self.grblWriter.send_nonblock(line, self.currentLine)
+                line = None
+                self.currentLine += 1
+                if self.progressLimiter.ready():
+                    self.publishProgress()
+            except:
+                e = sys.exc_info()[0]
+                self.error_event.emit("%s" % e)
+
+        self.publishProgress()
+        elapsed = time.time() - startTime
+        if elapsed > 0:
+            self.linesPerSecond = (self.currentLine - startLine) / elapsed
+        print "File finished: %d lines in %.1f s (%.1f lines/s). Waiting for last ack" % (self.currentLine - startLine, elapsed, self.linesPerSecond)
+        # wait for the last ack
+        while not self.waitAck():
+            pass
+
+        print "Waiting for motion to finish"
+        #self.grblWriter.wait_motion()
+        self.grblWriter.wait_motion_nonblock()
+        while not self.waitAck():
+            self.processCommands()
+            if self.stopFlag:
+                self.grblWriter.reset()
+                self.stop_event.emit()
+                return
+        self.grblWriter.sync_analyzer() # the next commands use the modal state and the position left by the job
+        self.grblWriter.publish_position()
+        self.end_event.emit()
+
+    def publishProgress(self):
+        # the updates of the streamed lines are throttled (PROGRESS_UPDATE_RATE), like their position updates (GrblWriter)
+        now = time.time()
+        lastTime, lastLine = self.lastProgress
+        rate = (self.currentLine - lastLine) / (now - lastTime) if now > lastTime else 0
+        self.lastProgress = (now, self.currentLine)
+        remaining = None
+        if self.times is not None and len(self.times) > 0:
+            remaining = self.totalTime - self.times[self.currentLine - 1] if self.currentLine > 0 else self.totalTime
+        self.progress_event.emit(Progress(self.currentLine, len(self.gcode), now - self.startTime, remaining, rate))
+
+    def waitAck(self):
+        # True when all the lines are acknowledged and their errors handled, otherwise wait for a response or a command
+        self.wakeEvent.clear()
+        ack, lineIn = self.grblWriter.ack_received()
+        if ack and self.errorsHandled >= self.grblWriter.errorCount:
+            return True
+        if lineIn is None:
+            self.wait()
+        return False
@@ -1,3 +1,5 @@
+import re
+
 GrblErrorDict = {
     1:      'G-code words consist of a letter and a value. Letter was not found.',
     2: 	    'Numeric value format is not valid or missing an expected value.',
@@ -34,4 +36,21 @@ GrblErrorDict = {
     35: 	'A G2 or G3 arc, traced with the offset definition, is missing the IJK offset word in the selected plane to trace the arc.',
     36: 	'There are unused, leftover G-code words that aren\'t used by any command in the block.',
     37: 	'The G43.1 dynamic tool length offset command cannot apply an offset to an axis other than its configured axis. The Grbl default axis is the Z-axis.'
-}
\ No newline at end of file
+}
+
+def lineLabel(lnum):
+    # label of a 0-based line number. None is an error that could not be assigned to a line
+    return '#%d' % (lnum + 1) if lnum is not None else 'unknown line'
+
+def formatGrblError(lnum, line, err):
+    # description of an error returned by grbl for a gcode line (lnum is 0-based, or None with line None)
+    if lnum is None:
+        message = "Error in GCode at an unknown line\n%s" % err.strip()
+    else:
+        message = "Error in GCode at line\n#%d: %s\n%s" % (lnum + 1, line.strip(), err.strip())
+    m = re.search('error:\s*([0-9]+)', err)
+    if m is not None:
+        errno = int(m.group(1))
+        if errno in GrblErrorDict:
+            message += '\n' + GrblErrorDict[errno]
+    return message
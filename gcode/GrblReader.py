@@ -0,0 +1,173 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Background thread that owns all the reads from the Grbl serial port.
+# Every received line is classified and pushed onto a queue, so that the consumers
+# (command responses, status reports, probing) never touch the port themselves.
+
+import threading
+import Queue
+import re
+
+import pycnc_config
+from gcode.GrblStatus import StatusPoller
+
+# kinds of received lines
+LINE_OK = 'ok'
+LINE_ERROR = 'error'
+LINE_ALARM = 'alarm'
+LINE_STATUS = 'status'
+LINE_PROBE = 'probe'
+LINE_BANNER = 'banner'
+LINE_SETTING = 'setting'
+LINE_MESSAGE = 'message'
+
+STATUS_QUEUE_SIZE = 16
+
+settingPattern = re.compile('\$[0-9]+\s*=')
+
+def classifyLine(line):
+    if line == 'ok':
+        return LINE_OK
+    if line.startswith('error'):
+        return LINE_ERROR
+    if line.startswith('ALARM'):
+        return LINE_ALARM
+    if line.startswith('<'):
+        return LINE_STATUS
+    if line.startswith('[PRB:'):
+        return LINE_PROBE
+    if line.startswith('Grbl'):
+        return LINE_BANNER
+    if settingPattern.match(line):
+        return LINE_SETTING
+    return LINE_MESSAGE
+
+
+class GrblReader(threading.Thread):
+
+    def __init__(self, serialPort):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.serial = serialPort
+        self.killMe = False
+        self.lines = Queue.Queue() # responses to commands: (kind, line)
+        self.statuses = Queue.Queue(STATUS_QUEUE_SIZE) # status reports. Only the most recent ones are kept
+        self.probes = Queue.Queue() # probe results
+        self.statusCallback = None # called from the reader thread for each status report
+        self.lineCallback = None # called from the reader thread after each line is queued
+        self.statusPoller = None
+
+    def run(self):
+        buf = ''
+        while not self.killMe:
+            try:
+                # read everything that is available, or wait (with the serial timeout) for one byte
+                data = self.serial.read(self.serial.inWaiting() or 1)
+            except:
+                # the port was closed
+                return
+
+            if not data:
+                continue
+
+            buf += data
+            while '\n' in buf:
+                line, buf = buf.split('\n', 1)
+                line = line.strip()
+                if line:
+                    self.dispatch(line)
+
+    def dispatch(self, line):
+        if pycnc_config.SERIAL_DEBUG:
+            print "Serial RX:", line
+
+        kind = classifyLine(line)
+        if kind == LINE_STATUS:
+            if self.statusCallback is not None:
+                self.statusCallback(line)
+            try:
+                self.statuses.put_nowait(line)
+            except Queue.Full:
+                # nobody is reading the reports (e.g. they come from the poller): drop the oldest one
+                self.clear(self.statuses)
+                self.statuses.put_nowait(line)
+        elif kind == LINE_PROBE:
+            self.probes.put(line)
+        else:
+            self.lines.put((kind, line))
+            if self.lineCallback is not None:
+                self.lineCallback()
+
+    def startPolling(self, rate):
+        # request status reports at the given rate (Hz)
+        self.statusPoller = StatusPoller(self.serial, rate)
+        self.statusPoller.start()
+
+    def stop(self):
+        if self.statusPoller is not None:
+            self.statusPoller.stop()
+            self.statusPoller = None
+        self.killMe = True
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(1.0)
+
+    def get_line(self, timeout = None):
+        # returns (kind, line) or (None, None) if nothing was received within the timeout
+        try:
+            return self.lines.get(True, timeout)
+        except Queue.Empty:
+            return None, None
+
+    def get_line_nowait(self):
+        try:
+            return self.lines.get_nowait()
+        except Queue.Empty:
+            return None, None
+
+    def get_status(self, timeout):
+        try:
+            return self.statuses.get(True, timeout)
+        except Queue.Empty:
+            return None
+
+    def get_probe(self, timeout):
+        try:
+            return self.probes.get(True, timeout)
+        except Queue.Empty:
+            return None
+
+    def wait_banner(self, timeout):
+        # wait for the grbl welcome message, discarding everything else
+        while True:
+            kind, line = self.get_line(timeout)
+            if kind is None:
+                return None
+            if kind == LINE_BANNER:
+                return line
+
+    def clear(self, *queues):
+        # discard everything that was received so far (in the given queues, or in all of them)
+        if not queues:
+            queues = (self.lines, self.statuses, self.probes)
+        for q in queues:
+            while True:
+                try:
+                    q.get_nowait()
+                except Queue.Empty:
+                    break
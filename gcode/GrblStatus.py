@@ -0,0 +1,158 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Parsing of the Grbl real-time status reports, and a poller that periodically requests them.
+#
+# Grbl 0.9: <Idle,MPos:10.000,-5.000,2.000,WPos:0.000,0.000,0.000,Buf:0,RX:0>
+# Grbl 1.1: <Idle|MPos:10.000,-5.000,2.000|Bf:15,128|FS:0,0|Ov:100,100,100|WCO:10.000,-5.000,2.000|Pn:XZ>
+# Grbl 1.1 reports either MPos or WPos, and only sends WCO (work coordinate offset) every few reports,
+# so the last known offset is kept in the state to compute the missing position.
+# A MachineState is not modified once it is published: each report creates a new state, so that the other threads
+# always read the fields of a single report.
+
+import re
+import threading
+import time
+
+coordsPattern = '([-.0-9]+),([-.0-9]+),([-.0-9]+)'
+statePattern = re.compile('<([A-Za-z]+)')
+mposPattern = re.compile('MPos:' + coordsPattern)
+wposPattern = re.compile('WPos:' + coordsPattern)
+wcoPattern = re.compile('WCO:' + coordsPattern)
+bufPattern = re.compile('Bf:([0-9]+),([0-9]+)') # 1.1: free planner blocks, free RX bytes
+buf09Pattern = re.compile('Buf:([0-9]+)') # 0.9: used planner blocks
+rx09Pattern = re.compile('RX:([0-9]+)') # 0.9: used RX bytes
+feedPattern = re.compile('(?:FS|F):([.0-9]+)(?:,([.0-9]+))?')
+ovPattern = re.compile('Ov:([0-9]+),([0-9]+),([0-9]+)')
+pinPattern = re.compile('Pn:([A-Za-z]+)')
+
+def _coords(m):
+    return (float(m.group(1)), float(m.group(2)), float(m.group(3)))
+
+
+class MachineState(object):
+
+    __slots__ = ('state', 'mpos', 'wpos', 'wco', 'plannerFree', 'rxFree', 'plannerUsed', 'rxUsed',
+                 'feed', 'spindle', 'overrides', 'pins', 'timestamp')
+
+    def __init__(self):
+        self.state = None
+        self.mpos = None
+        self.wpos = None
+        self.wco = (0.0, 0.0, 0.0)
+        self.plannerFree = None
+        self.rxFree = None
+        self.plannerUsed = None
+        self.rxUsed = None
+        self.feed = None
+        self.spindle = None
+        self.overrides = None
+        self.pins = ''
+        self.timestamp = 0
+
+    def parse(self, report):
+        # new state with the values of a status report, and the values of this state that the report does not
+        # contain. Returns None if the report could not be parsed
+        m = statePattern.match(report)
+        if m is None:
+            return None
+        state = MachineState()
+        for name in MachineState.__slots__:
+            setattr(state, name, getattr(self, name))
+        state._update(m.group(1), report)
+        return state
+
+    def _update(self, stateName, report):
+        self.state = stateName
+
+        mpos = mposPattern.search(report)
+        wpos = wposPattern.search(report)
+        wco = wcoPattern.search(report)
+        if wco is not None:
+            self.wco = _coords(wco)
+
+        if mpos is not None and wpos is not None:
+            # grbl 0.9 sends both
+            self.mpos = _coords(mpos)
+            self.wpos = _coords(wpos)
+            self.wco = tuple(m - w for m, w in zip(self.mpos, self.wpos))
+        elif mpos is not None:
+            self.mpos = _coords(mpos)
+            self.wpos = tuple(m - o for m, o in zip(self.mpos, self.wco))
+        elif wpos is not None:
+            self.wpos = _coords(wpos)
+            self.mpos = tuple(w + o for w, o in zip(self.wpos, self.wco))
+
+        m = bufPattern.search(report)
+        if m is not None:
+            self.plannerFree = int(m.group(1))
+            self.rxFree = int(m.group(2))
+        m = buf09Pattern.search(report)
+        if m is not None:
+            self.plannerUsed = int(m.group(1))
+        m = rx09Pattern.search(report)
+        if m is not None:
+            self.rxUsed = int(m.group(1))
+
+        m = feedPattern.search(report)
+        if m is not None:
+            self.feed = float(m.group(1))
+            if m.group(2) is not None:
+                self.spindle = float(m.group(2))
+
+        m = ovPattern.search(report)
+        if m is not None:
+            self.overrides = (int(m.group(1)), int(m.group(2)), int(m.group(3)))
+
+        # pins are only reported when active
+        m = pinPattern.search(report)
+        self.pins = m.group(1) if m is not None else ''
+
+        self.timestamp = time.time()
+
+    def getWorkPosition(self):
+        return self.wpos
+
+    def getMachinePosition(self):
+        return self.mpos
+
+    def isIdle(self):
+        return self.state == 'Idle'
+
+
+class StatusPoller(threading.Thread):
+    # sends the real-time status request '?' at a fixed rate. The reports are received by the GrblReader
+
+    def __init__(self, serialPort, rate):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.serial = serialPort
+        self.interval = 1.0/rate
+        self.stopEvent = threading.Event()
+
+    def run(self):
+        while not self.stopEvent.wait(self.interval):
+            try:
+                self.serial.write('?') # real-time command: no newline, does not use the RX buffer
+            except:
+                return # the port was closed
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(1.0)
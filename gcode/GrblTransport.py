@@ -0,0 +1,267 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Single-thread transport for the Grbl serial port: one loop waits (with poll) on the port and on a wakeup pipe,
+# reads and dispatches the received lines, writes the queued lines when the grbl RX buffer has room and sends the
+# status requests, without sleeps and without other threads.
+#
+# It has the interface of the GrblReader (queues of received lines), so that the GrblWriter can use it instead of
+# the GrblReader and the StatusPoller (SERIAL_TRANSPORT = 'select'), and operations that return a Future:
+#  - send_line(line): resolved with the response (ok or error) of the line. Lines are queued and sent with
+#    character counting. A line lost by a reset of grbl, or when the transport stops, is resolved with None
+#  - wait_ack(): resolved when all the lines sent with send_line are acknowledged
+#  - query_status(): resolved with the next status report
+#  - realtime_byte(byte): written immediately
+# With this transport the GrblWriter sends all its lines with send_line and takes their responses from the Futures:
+# streaming, jogging and the commands share the same loop. The other lines (banner, messages, settings) are still
+# queued. Python 2 has no asyncio: the results are Futures that can be waited for from any thread, or given
+# callbacks that are called in the transport thread.
+
+import os
+import time
+import errno
+import select
+import threading
+from collections import deque
+
+import pycnc_config
+from gcode.GrblReader import GrblReader, classifyLine, LINE_OK, LINE_ERROR, LINE_STATUS, LINE_BANNER
+
+
+class Future(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.value = None
+        self.callbacks = []
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+            self.event.set()
+            callbacks = self.callbacks
+            self.callbacks = []
+        for callback in callbacks:
+            callback(value)
+
+    def done(self):
+        return self.event.is_set()
+
+    def wait(self, timeout = None):
+        # returns the result, or None if it is not available within the timeout
+        self.event.wait(timeout)
+        return self.value
+
+    def addCallback(self, callback):
+        # called with the result, immediately if it is already available
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self.value)
+
+
+class GrblTransport(GrblReader):
+
+    def __init__(self, serialPort, rxBufferSize = None):
+        GrblReader.__init__(self, serialPort)
+        self.rxBufferSize = rxBufferSize if rxBufferSize is not None else pycnc_config.GRBL_RX_BUFFER_SIZE
+        self.lock = threading.Lock()
+        self.outgoing = deque() # (line, future) waiting for room in the grbl RX buffer
+        self.pending = deque() # (length, future) sent and not acknowledged
+        self.pendingChars = 0
+        self.ackFutures = [] # futures of wait_ack
+        self.statusFuture = None
+        self.pollInterval = None
+        self.nextPoll = None
+        self.wakeLock = threading.Lock() # the pipe is closed by the loop while other threads may still wake it up
+        self.wakeRead, self.wakeWrite = os.pipe()
+
+    # --- operations, callable from any thread ---
+
+    def send_line(self, line):
+        future = Future()
+        line = line.strip() + '\n'
+        with self.lock:
+            if not self.outgoing and (not self.pending or self.pendingChars + len(line) <= self.rxBufferSize):
+                # there is room in the grbl RX buffer: written now, without waking up the loop
+                self.pending.append((len(line), future))
+                self.pendingChars += len(line)
+                self.serial.write(line)
+                return future
+            self.outgoing.append((line, future))
+        if not self.wakeup():
+            self.dropLines() # the loop has ended: the line will never be sent
+        return future
+
+    def wait_ack(self):
+        future = Future()
+        with self.lock:
+            if self.outgoing or self.pending:
+                self.ackFutures.append(future)
+            else:
+                future.set(True)
+        return future
+
+    def query_status(self):
+        with self.lock:
+            if self.statusFuture is not None:
+                return self.statusFuture # a request is already on its way
+            future = self.statusFuture = Future()
+        self.realtime_byte('?')
+        return future
+
+    def realtime_byte(self, byte):
+        # real-time commands do not use the RX buffer: they are written immediately
+        self.serial.write(byte)
+
+    def startPolling(self, rate):
+        # status reports are requested by the transport loop
+        self.pollInterval = 1.0 / rate
+        self.nextPoll = time.time()
+        self.wakeup()
+
+    def wakeup(self):
+        # returns False if the loop has ended
+        with self.wakeLock:
+            if self.wakeWrite is None:
+                return False
+            try:
+                os.write(self.wakeWrite, 'x')
+            except OSError:
+                pass # the pipe is full: the loop will wake up anyway
+            return True
+
+    def stop(self):
+        self.killMe = True
+        self.wakeup()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(1.0)
+
+    # --- transport loop ---
+
+    def run(self):
+        fd = self.serial.fileno()
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        poller.register(self.wakeRead, select.POLLIN)
+        buf = ''
+        try:
+            while not self.killMe:
+                self.sendLines()
+                timeout = None
+                if self.pollInterval is not None:
+                    now = time.time()
+                    if now >= self.nextPoll:
+                        self.realtime_byte('?')
+                        self.nextPoll = max(self.nextPoll + self.pollInterval, now)
+                    timeout = max(0, int((self.nextPoll - now) * 1000)) + 1
+
+                for readyFd, event in poller.poll(timeout):
+                    if readyFd == self.wakeRead:
+                        os.read(self.wakeRead, 4096)
+                        continue
+                    try:
+                        data = os.read(fd, 4096)
+                    except OSError as e:
+                        if e.errno == errno.EAGAIN:
+                            continue
+                        raise
+                    if not data:
+                        return # the port was closed
+                    buf += data
+                    while '\n' in buf:
+                        line, buf = buf.split('\n', 1)
+                        line = line.strip()
+                        if line:
+                            self.dispatch(line)
+        except (OSError, IOError, select.error, ValueError):
+            return # the port was closed
+        finally:
+            with self.wakeLock:
+                # no wakeup can write to the pipe after this, even if its file descriptors are reused
+                wakeRead, wakeWrite = self.wakeRead, self.wakeWrite
+                self.wakeRead = self.wakeWrite = None
+            os.close(wakeRead)
+            os.close(wakeWrite)
+            self.dropLines() # nobody waits forever for the lines that will never be answered
+
+    def sendLines(self):
+        # write the queued lines that fit in the grbl RX buffer. Written under the lock, like in send_line, so
+        # that the lines are written in the order of the pending responses
+        with self.lock:
+            while self.outgoing:
+                line, future = self.outgoing[0]
+                if self.pending and self.pendingChars + len(line) > self.rxBufferSize:
+                    return
+                self.outgoing.popleft()
+                self.pending.append((len(line), future))
+                self.pendingChars += len(line)
+                self.serial.write(line)
+
+    def dropLines(self):
+        # the lines in the grbl RX buffer and the queued ones will not be answered: they (and the other waiters)
+        # are resolved with None
+        with self.lock:
+            futures = [future for length, future in self.pending] + [future for line, future in self.outgoing]
+            futures += self.ackFutures
+            if self.statusFuture is not None:
+                futures.append(self.statusFuture)
+            self.pending.clear()
+            self.outgoing.clear()
+            self.pendingChars = 0
+            self.ackFutures = []
+            self.statusFuture = None
+        for future in futures:
+            future.set(None)
+        if futures and self.lineCallback is not None:
+            self.lineCallback()
+
+    def dispatch(self, line):
+        kind = classifyLine(line)
+        if kind == LINE_OK or kind == LINE_ERROR:
+            with self.lock:
+                future = None
+                ackFutures = []
+                if self.pending:
+                    length, future = self.pending.popleft()
+                    self.pendingChars -= length
+                    if not self.pending and not self.outgoing:
+                        ackFutures = self.ackFutures
+                        self.ackFutures = []
+            if future is not None:
+                # response to a line of send_line: it is not queued
+                if pycnc_config.SERIAL_DEBUG:
+                    print "Serial RX:", line
+                future.set(line)
+                for ackFuture in ackFutures:
+                    ackFuture.set(True)
+                if self.lineCallback is not None:
+                    self.lineCallback()
+                return
+        elif kind == LINE_STATUS:
+            with self.lock:
+                future = self.statusFuture
+                self.statusFuture = None
+            if future is not None:
+                future.set(line)
+        GrblReader.dispatch(self, line)
+        if kind == LINE_BANNER:
+            # grbl was reset: the banner is queued first, so that the waiters see it before their lost lines
+            self.dropLines()
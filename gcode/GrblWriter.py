@@ -32,43 +32,25 @@
 # The above copyright notice and this permission notice shall be
 # included in all copies or substantial portions of the Software.
 
-from PySide.QtCore import *
-from PySide.QtGui import QApplication, QMessageBox
-from GCodeAnalyzer import GCodeAnalyzer
+from GCodeAnalyzer import GCodeAnalyzer, safeFloat
 import serial
 import time
+import threading
 import glob
 import re
 import math
-from bisect import bisect_left, bisect_right
+from collections import deque
 import types
 
 import pycnc_config
-from gcode.GrblErrors import GrblErrorDict
-
-
-def suppressGCode(gcodeLine, toSuppress):
-    gcodefinder = re.compile(toSuppress + '(?![0-9.])[^MG]*', re.I) # suppress M6 but not M66, even when it's M6G0, for example
-    return gcodefinder.sub('', gcodeLine)
-
-def suppressAllInvalidGCodes(gcodeline):
-    for gcode in pycnc_config.SUPPRESS_GCODE:
-        gcodeline = suppressGCode(gcodeline, gcode)
-    return gcodeline
-
-def showGrblErrorMessageBox(widget, lnum, line, err):
-    message = "Error in GCode at line\n#%d: %s\n%s" % (lnum + 1, line.strip(), err.strip())
-    m = re.search('error:\s*([0-9]+)', err)
-    if m is not None:
-        errno = int(m.group(1))
-        if errno in GrblErrorDict:
-            errmsg = GrblErrorDict[errno]
-            message += '\n' + errmsg
-    res = QMessageBox.critical(widget, "GCode error", message, QMessageBox.Abort | QMessageBox.Ignore)
-    if res == QMessageBox.Ignore:
-        return True
-    else:
-        return False
+from gcode.Events import Event
+from gcode.GCodePreprocessor import suppressAllInvalidGCodes, prepareGCode, PAUSE_COMMAND
+from gcode.GrblReader import GrblReader, classifyLine, LINE_OK, LINE_ERROR, LINE_ALARM, LINE_BANNER
+from gcode.GrblStatus import MachineState
+from gcode.GrblTransport import GrblTransport
+from gcode.RateLimiter import RateLimiter
+from gcode.ZCompensation import ZCompensation
+
 
 def redefineSerialRW(serialInstance):
     oldWrite = serialInstance.write
@@ -78,15 +60,7 @@ def redefineSerialRW(serialInstance):
         oldWrite(data)
 
     serialInstance.write = types.MethodType(newWrite, serialInstance)
-
-    oldReadline = serialInstance.readline
-
-    def newReadline(self):
-        data = oldReadline()
-        print "Serial RX:", data.strip()
-        return data
-
-    serialInstance.readline = types.MethodType(newReadline, serialInstance)
+    # received lines are printed by the GrblReader
 
 def readConfigLine(line):
     # a config line is $key=value (comment)
@@ -95,120 +69,20 @@ def readConfigLine(line):
         return int(match.group(1)), float(match.group(2))
     return None, None
 
-# class to compensate for Z offsets after a grid probe
-class ZCompensation:
-
-    def __init__(self, xRangeOrSize, yRangeOrSize, spacing):
-        # predefines the grid. Inputs can be ranges (tuple) or sizes
-        try:
-            self.xrange = (xRangeOrSize[0], xRangeOrSize[1])
-        except:
-            # it must be a number, not a range
-            self.xrange = (0.0, float(xRangeOrSize))
-
-        try:
-            self.yrange = (yRangeOrSize[0], yRangeOrSize[1])
-        except:
-            # it must be a number, not a range
-            self.yrange = (0.0, float(yRangeOrSize))
 
-        self.spacing = spacing
-
-        if self.xrange[0] > self.xrange[1]: self.xrange = (self.xrange[1], self.xrange[0])
-        if self.yrange[0] > self.yrange[1]: self.yrange = (self.yrange[1], self.yrange[0])
-
-        self.nPointsX = int(math.ceil((self.xrange[1] - self.xrange[0]) / float(spacing)))+1
-        self.nPointsY = int(math.ceil((self.yrange[1] - self.yrange[0]) / float(spacing)))+1
-
-        print "Ranges: ", self.xrange, self.yrange
-
-        self.xPoints = [(i*spacing + self.xrange[0]) for i in range(self.nPointsX)]
-        self.yPoints = [(i*spacing + self.yrange[0]) for i in range(self.nPointsY)]
-
-        print "Points X:", self.xPoints
-        print "Points Y:", self.yPoints
-
-        self.zValues = [[None for y in range(self.nPointsY)] for x in range(self.nPointsX)]
-
-        # construct point list
-        direction = +1
-        self.probePointList = []
-        self.probePointIndices = []
-        for yInd in range(len(self.yPoints)):
-            if direction == 1:
-                xIter = range(len(self.xPoints))
-            else:
-                xIter = range(len(self.xPoints)-1, -1, -1)
-            for xInd in xIter:
-                self.probePointList.append((self.xPoints[xInd],self.yPoints[yInd]))
-                self.probePointIndices.append((xInd,yInd))
-            direction = -direction
-
-
-    def getProbePoints(self):
-        # returns a list of all the X,Y coordinates to probe
-        return self.probePointList
-
-    def setZValue(self, index, z, zOffset = 0):
-        # sets a z value
-        print "Setting Z(",self.probePointIndices[index][0],self.probePointIndices[index][1], "):", z+zOffset
-        self.zValues[self.probePointIndices[index][0]][self.probePointIndices[index][1]] = z + zOffset
-
-    def isValid(self):
-        # check if all the values have been filled
-        for zVec in self.zValues:
-            if any(zVec is None):
-                return False
-        return True
-
-    def _findInterpolationIndices(self, val, vec):
-        #print "Finding ", val, " in ", vec
-        if val <= vec[0]:
-            weights = (1,0)
-            indices = (0,0)
-            return indices, weights
-        if val >= vec[-1]:
-            weights = (1,0)
-            indices = (len(vec)-1, len(vec)-1)
-            return indices, weights
-
-        indexAfter = bisect_right(vec, val)
-        indexBefore = indexAfter - 1
-        #print "Bisect returned ", indexAfter
-        weightBefore = (vec[indexAfter] - val)/(vec[indexAfter] - vec[indexBefore]) # the further the point is from the index before, the higher the weight
-        weightAfter = 1.0 - weightBefore
-        weights = (weightBefore, weightAfter)
-        indices = (indexBefore, indexAfter)
-        return indices, weights
-
-
-    def getZValue(self, x, y):
-        # this is where the magic happens: return an interpolated ZValue
-        # find X
-        #print "Getting Z value"
-        xInd, xWeight = self._findInterpolationIndices(x, self.xPoints)
-        #print "XInd,weight: ", xInd, xWeight
-        yInd, yWeight = self._findInterpolationIndices(y, self.yPoints)
-        #print "YInd,weight: ", yInd, yWeight
-        z = (self.zValues[xInd[0]][yInd[0]]*xWeight[0]*yWeight[0] +
-            self.zValues[xInd[0]][yInd[1]] * xWeight[0] * yWeight[1] +
-            self.zValues[xInd[1]][yInd[0]] * xWeight[1] * yWeight[0] +
-            self.zValues[xInd[1]][yInd[1]] * xWeight[1] * yWeight[1])
-
-        return z
-
-
-
-class GrblWriter(QObject):
-
-    position_updated = Signal(object)
-    probe_error = Signal()
-    grbl_error = Signal(object)
+class GrblWriter(object):
+    # does not depend on Qt: the graphical interface uses the QtGrblWriter adapter (GrblWriterQt.py)
 
     def __init__(self):
-        QObject.__init__(self)
+        self.position_updated = Event()
+        self.probe_error = Event()
+        self.grbl_error = Event()
+        self.line_received = Event() # emitted from the reader thread when a response is received, to wake up the consumers
+        self.idleCallback = None # called while waiting for grbl, e.g. to keep an interface responsive
+        self.confirmCallback = None # called with (title, message) to ask the user a yes/no question
         self.analyzer = GCodeAnalyzer(False)
         self.serial = None
+        self.reader = None
         self.config = {}
         self.g0_feed = pycnc_config.G0_FEED
         self.waitAck = 0
@@ -218,10 +92,25 @@ class GrblWriter(QObject):
         self.restoreWorkCoords = False
         self.checkMode = False
         self.resetting = False
+        # character-counting streaming: keep track of the lines that were sent but not acknowledged
+        self.charCounting = (pycnc_config.STREAMING_PROTOCOL == 'charcount')
+        self.pendingLines = deque() # (line number, length in bytes, Future of the response) for each line in the grbl RX buffer
+        self.transport = None # GrblTransport (SERIAL_TRANSPORT = 'select'): the lines are sent with send_line, and their responses are Futures
+        self.pendingChars = 0
+        self.errorLineNumber = None # line number of the last line that returned an error
+        self.errorCount = 0 # errors emitted with grbl_error since the start, counted before the emit
+        # real machine state, replaced by each status report (GrblStatus.MachineState)
+        self.machineState = MachineState()
+        self.pollingStatus = False
+        self.analyzerStale = False # streamed lines were not analyzed (the position is polled): see sync_analyzer
+        self.lastPublishedPosition = None
+        self.positionLimiter = RateLimiter(pycnc_config.PROGRESS_UPDATE_RATE) # position updates of the streamed lines
 
     # this will actually connect to Grbl
     def open(self):
         self.waitAck = 0
+        self.pendingLines.clear()
+        self.pendingChars = 0
         grbl_paths = glob.glob(pycnc_config.SERIAL_PATTERN)
         if not grbl_paths:
             return False # Device not existing
@@ -229,24 +118,32 @@ class GrblWriter(QObject):
         self.checkMode = False
 
         try:
-            self.serial = serial.Serial(grbl_paths[0], pycnc_config.BAUD, timeout=5, dsrdtr=True)
+            # short timeout: the reader thread must be able to notice when it has to stop
+            self.serial = serial.Serial(grbl_paths[0], pycnc_config.BAUD, timeout=0.1, dsrdtr=True)
             if pycnc_config.SERIAL_DEBUG:
                 redefineSerialRW(self.serial) # this is to debug communication!
             self.serial.flushInput()
+            if pycnc_config.SERIAL_TRANSPORT == 'select':
+                self.reader = self.transport = GrblTransport(self.serial)
+            else:
+                self.reader = GrblReader(self.serial)
+                self.transport = None
+            self.reader.statusCallback = self.status_received
+            self.reader.lineCallback = self.line_received.emit
+            self.reader.start()
             time.sleep(0.1)
             self.serial.write("\r\n")
             time.sleep(0.1)
             self.serial.write("\x18")
-            time.sleep(0.1)
-            grblLine = self.serial.readline()
-            while 'Grbl' not in grblLine:
-                grblLine = self.serial.readline()
-                time.sleep(0.1)
+            grblLine = self.reader.wait_banner(10)
+            if grblLine is None:
+                raise IOError("Grbl did not respond")
             time.sleep(0.5)
-            self.serial.flushInput()
+            self.reader.clear()
             self.load_config(grblLine)
         except:
             # serial port could not be opened
+            self.close_port()
             return False
 
         if self.config[22] == 1: # homing is enabled. A homing cycle needs to be performed.
@@ -254,12 +151,45 @@ class GrblWriter(QObject):
         else:
             self.analyzer.Reset()
             self.analyzer.fastf = self.g0_feed
+        self.analyzerStale = False
+
+        if pycnc_config.STATUS_POLL_RATE > 0:
+            self.lastPublishedPosition = None
+            self.reader.startPolling(pycnc_config.STATUS_POLL_RATE)
+            self.pollingStatus = True
         # everything OK
         return True
 
+    def status_received(self, report):
+        # called by the reader thread for each status report
+        state = self.machineState.parse(report)
+        if state is None:
+            return
+        self.machineState = state # replaced as a whole: the other threads never see a partly updated state
+        if not self.pollingStatus:
+            return # the displayed position comes from the analyzer
+        position = state.getWorkPosition()
+        if position is not None and position != self.lastPublishedPosition:
+            self.lastPublishedPosition = position
+            self.position_updated.emit(position)
+
+    def publish_position(self, throttled = False):
+        # publish the simulated position, unless the real one is being polled
+        # throttled updates (streamed lines) are sent at most PROGRESS_UPDATE_RATE times per second
+        if self.pollingStatus:
+            return
+        if throttled and not self.positionLimiter.ready():
+            return
+        self.position_updated.emit(self.analyzer.getPosition())
+
+    def confirm(self, title, message, default):
+        # ask the user. Without a confirmCallback, the default answer is used
+        if self.confirmCallback is None:
+            return default
+        return self.confirmCallback(title, message)
+
     def do_homing(self):
-        res = QMessageBox.information(None, "Homing", "Press OK to start the homing cycle", QMessageBox.Ok)
-        if res != QMessageBox.Ok:
+        if not self.confirm("Homing", "Start the homing cycle?", True):
             return
 
         oldMachineCoords = self.analyzer.getMachineXYZ()
@@ -273,13 +203,12 @@ class GrblWriter(QObject):
         self.analyzer.syncStatusWithGrbl(machinePos, workPos) # read the actual positions from grbl
 
         if any([coord != 0 for coord in oldMachineCoords]):
-            res = QMessageBox.information(None, "Restore coords", "Move tool to previous position?", QMessageBox.Yes | QMessageBox.No)
-            if res == QMessageBox.Yes:
+            if self.confirm("Restore coords", "Move tool to previous position?", False):
                 self.do_command("G53 G0 X%.3f Y%.3f" % (oldMachineCoords[0], oldMachineCoords[1]))
                 self.do_command("G53 G0 Z%.3f" % (oldMachineCoords[2]))
                 self.do_command("G10 P0 L20 X%.3f Y%.3f Z%.3f" % oldWorkCoords)
 
-        self.position_updated.emit(self.analyzer.getPosition())
+        self.publish_position()
 
 
 
@@ -288,34 +217,79 @@ class GrblWriter(QObject):
             self.do_command('$C')
             self.checkMode = checkMode
             time.sleep(0.5)
-            self.serial.flushInput()
+            self.reader.clear()
 
-    def check_gcode_line(self, line):
-        line = suppressAllInvalidGCodes(line)
-        if not self.checkMode:
-            self.set_check_mode(True)
-
-        self.serial.flushInput()
-        self.serial.write(line + '\n')
-        while True:
-            res = self.serial.readline()
-            r = res.lower()
-            if 'ok' in r:
-                return True, None
-            if 'error' in r or 'alarm' in r:
-                return False, res
+    def stream_line(self, command, lineNumber = None):
+        # stream a command that does not go through the analyzer: lines in check mode (GCodeChecker) and jog
+        # commands (JogEngine), which do not change the modal state of grbl.
+        # The command must not be empty: an empty line would get its own ok, and the responses would be out of sync
+        self.waitAck += 1
+        self.pendingLines.append((lineNumber, len(command) + 1, self.write_line(command)))
+        self.pendingChars += len(command) + 1
+
+    def write_line(self, command):
+        # send a line to grbl. Returns the Future of its response with the GrblTransport, None otherwise
+        # (the response is then read from the queue of received lines)
+        if self.transport is not None:
+            return self.transport.send_line(command)
+        self.serial.write(command + '\n')
+        return None
+
+    def write_realtime(self, byte):
+        # real-time commands are written immediately, without a newline
+        if self.transport is not None:
+            self.transport.realtime_byte(byte)
+        else:
+            self.serial.write(byte)
+
+    def next_ack_line(self):
+        # next received line for the streamed lines, without waiting: (kind, line), or (None, None).
+        # With the GrblTransport the response of the oldest streamed line is its Future, the other lines are queued
+        kind, line = self.reader.get_line_nowait()
+        if kind is not None or self.transport is None:
+            return kind, line
+        if not self.pendingLines or not self.pendingLines[0][2].done():
+            return None, None
+        line = self.pendingLines[0][2].value
+        if line is None:
+            return LINE_OK, 'ok' # the line was lost in a reset of grbl: it will never be acknowledged, count it as done
+        return classifyLine(line), line
+
+    def stream_response(self):
+        # response to the lines sent with stream_line: returns (received, line number, error message)
+        # line number is the line that was acknowledged, error message is None if it was ok
+        kind, line = self.next_ack_line()
+        if kind is None:
+            return False, None, None
+        if kind == LINE_OK:
+            return True, self._pop_pending_line(), None
+        if kind == LINE_ERROR or kind == LINE_ALARM:
+            return True, self._pop_pending_line(), line
+        return True, None, None
+
+    def close_port(self):
+        self.pollingStatus = False
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+        if self.serial is None:
+            return
+        try:
+            self.serial.close()
+        except:
+            pass
+        self.serial = None
 
     def close(self):
         if self.serial is None:
             return
-        self.serial.close()
-        self.serial = None
+        self.close_port()
         self.position_updated.emit([0, 0, 0])
 
     def reset(self):
         self.resetting = True
         try:
-            self.serial.write("\x18")
+            self.write_realtime("\x18")
         except:
             pass
         print "Resetting!"
@@ -324,26 +298,40 @@ class GrblWriter(QObject):
         self.resetting = False
         return res
 
-    def read_response(self, until="ok", ignoreInitialize = False):
+    def read_response(self, until="ok", ignoreInitialize = False, future = None):
         """
             read lines from the grbl until the expected matching line appears
             (usually "ok"), or just the first line if until is None.
+            future is the response of the command with the GrblTransport (write_line)
         """
         result = []
 
         while True:
-            while not self.serial.inWaiting > 0:
-                QApplication.processEvents()
-            line = self.serial.readline().strip()
-            #print "Received line:", line
-            if pycnc_config.SERIAL_DEBUG:
-                if line == "": self.serial.write("\n")
-            if line.startswith("error:") or line.startswith("ALARM:"):
+            if future is None:
+                kind, line = self.reader.get_line(0.05)
+            else:
+                # the lines received before the response of the command are queued before its Future is resolved
+                kind, line = self.reader.get_line_nowait()
+                if kind is None and future.done():
+                    if future.value is None:
+                        break # the command was lost in a reset of grbl, or the port was closed
+                    kind, line = classifyLine(future.value), future.value
+                    future = None # the next lines come from the queue
+                elif kind is None:
+                    future.wait(0.05)
+            if kind is None:
+                # nothing received yet: keep the interface alive
+                if self.idleCallback is not None:
+                    self.idleCallback()
+                continue
+
+            if kind == LINE_ERROR or kind == LINE_ALARM:
                 self.analyzer.undo()
+                self.errorCount += 1
                 self.grbl_error.emit(line)
                 break
 
-            if not ignoreInitialize and line.startswith("Grbl"):
+            if not ignoreInitialize and kind == LINE_BANNER:
                 # a spontaneous reset is detected?
                 # restore work coordinates
                 self.do_command("G10 P0 L20 X%.4f Y%.4f Z%.4f" % (self.analyzer.x, self.analyzer.y, self.analyzer.z))
@@ -352,27 +340,13 @@ class GrblWriter(QObject):
             result.append(line)
             if line == until or until == None:
                 break
-            time.sleep(0.1)
 
         return '\n'.join(result)
 
     def do_compensated_move(self, lastMoveCommand):
-        if lastMoveCommand.isArc():  # arcs don't have a z movement: add one in the end
-            lastMoveCommand.z += self.zCompensation.getZValue(lastMoveCommand.x, lastMoveCommand.y)
-            self.serial.write(lastMoveCommand.getCommand() + '\n')
-            self.read_response()  # wait for previous command to be acknowledged
-            self.serial.write("G1 Z%.4f F100" % (lastMoveCommand.z))
-            response = self.read_response()
-        else:
-            #print "Z compensation: original command ", lastMoveCommand.getCommand()
-            for splitted_cmd in lastMoveCommand.splitMovement(self.zCompensation.spacing):
-                #print "Z compensation: splitted command ", splitted_cmd.getCommand()
-                #print "Z compensation: ",  self.zCompensation.getZValue(splitted_cmd.x, splitted_cmd.y)
-                #print "Z compensation: ",  self.zCompensation.getZValue(splitted_cmd.x, splitted_cmd.y)
-                splitted_cmd.z += self.zCompensation.getZValue(splitted_cmd.x, splitted_cmd.y)
-                #print "Z compensation:      new command ", splitted_cmd.getCommand()
-                self.serial.write(splitted_cmd.getCommand() + '\n')
-                response = self.read_response()
+        for command in self.zCompensation.compensateMove(lastMoveCommand):
+            future = self.write_line(command)
+            response = self.read_response(future=future) # wait for previous command to be acknowledged
         return response
 
     def do_command(self, gcode, wait=False, initCommand=False):
@@ -393,6 +367,8 @@ class GrblWriter(QObject):
                 not self.analyzer.relative and
                 lastMoveCommand is not None): # z compensation only works in absolute coords
             response = self.do_compensated_move(lastMoveCommand)
+        elif self.transport is not None:
+            response = self.read_response(ignoreInitialize=initCommand, future=self.transport.send_line(command))
         else: #business as usual
             self.serial.write(command)
             if pycnc_config.SERIAL_DEBUG:
@@ -402,61 +378,118 @@ class GrblWriter(QObject):
         if wait:
             self.wait_motion()
 
-        self.position_updated.emit(self.analyzer.getPosition())
+        self.publish_position()
 
         return response
 
-    def do_command_nonblock(self, gcode):
-        # run a command but don't wait
-        command = suppressAllInvalidGCodes(gcode.strip())
-        if not command or command[0] == '(':
+    def prepare_command(self, gcode):
+        # returns the command as it will be sent to grbl (see GCodePreprocessor)
+        return prepareGCode(gcode)
+
+    def has_buffer_space(self, command):
+        # check if a (prepared) command can be sent without waiting for an ack
+        if self.waitAck == 0:
+            return True
+        if not self.charCounting:
+            return False # simple protocol: one line at a time
+        return self.pendingChars + len(command) + 1 <= pycnc_config.GRBL_RX_BUFFER_SIZE
+
+    def do_command_nonblock(self, gcode, lineNumber = None):
+        # run a command but don't wait. lineNumber is used to report errors on the right line
+        self.send_nonblock(suppressAllInvalidGCodes(gcode.strip()), lineNumber)
+
+    def send_nonblock(self, command, lineNumber = None):
+        # same as do_command_nonblock, for a command that is already prepared (prepare_command)
+        if not command or command[0] == '(' or command == PAUSE_COMMAND:
             return
-        self.waitAck += 1
-        self.analyzer.Analyze(command)
 
-        lastMoveCommand = self.analyzer.lastMovementGCode
+        compensating = self.doZCompensation and self.zCompensation
+        if compensating:
+            # a compensated move is blocking and reads its own responses: all the streamed lines must be acknowledged first
+            self.wait_pending()
+            self.sync_analyzer() # the move is compensated from the current position
 
-        if (self.doZCompensation and
-                self.zCompensation and
+        self.waitAck += 1
+        if self.pollingStatus and not compensating:
+            # the position comes from the status reports: the line is just written, and the analyzer is synced
+            # from grbl when it is needed again (sync_analyzer)
+            self.analyzerStale = True
+            lastMoveCommand = None
+        else:
+            self.analyzer.Analyze(command)
+            lastMoveCommand = self.analyzer.lastMovementGCode
+
+        if (compensating and
                 not self.analyzer.relative and
                 lastMoveCommand is not None): # z compensation only works in absolute coords
             self.do_compensated_move(lastMoveCommand)
             self.waitAck -= 1 # the do_compensated_move is blocking because it has to execute multiple commands. So remove the waitack.
         else: #business as usual
-            self.serial.write(command + '\n')
-        self.position_updated.emit(self.analyzer.getPosition())
+            self.pendingLines.append((lineNumber, len(command) + 1, self.write_line(command))) # the newline is also in the buffer
+            self.pendingChars += len(command) + 1
+        self.publish_position(True)
         #print "Nonblock: wait ack status", self.waitAck
 
+    def _pop_pending_line(self):
+        # an ok or error was received: it refers to the oldest line in the buffer
+        self.waitAck -= 1
+        if not self.pendingLines:
+            return None
+        lineNumber, length, future = self.pendingLines.popleft()
+        self.pendingChars -= length
+        return lineNumber
+
+    def wait_pending(self):
+        # wait until all the streamed lines have been acknowledged. Sleeps until the reader receives a response
+        received = threading.Event()
+        self.line_received.connect(received.set)
+        try:
+            while True:
+                # cleared before looking at the responses: a response that arrives later wakes up the wait
+                received.clear()
+                ack, line = self.ack_received()
+                if ack:
+                    return
+                if line is None:
+                    received.wait()
+        finally:
+            self.line_received.disconnect(received.set)
+
     def ack_received(self):
         if self.waitAck == 0: # waitAck is an integer because there can be more commands in the queue to be executed. TODO: test!
             return True, None # if waitAck is 0 it means that there are no commands in the pipeline. Can we send more than one command before ack? Maybe not...
 
+        kind, line = self.next_ack_line()
+
         # there is no serial to be received, return false
-        if not self.serial.inWaiting() > 0:
+        if kind is None:
             return False, None
 
-        line = self.serial.readline().strip()
-
-        if line.startswith("Grbl"):
+        if kind == LINE_BANNER:
             # coordinates were reset
             self.restoreWorkCoords = True
             return False, line
 
-        if line.startswith("error:") or line.startswith("ALARM:"):
-            self.analyzer.undo()
+        if kind == LINE_ERROR or kind == LINE_ALARM:
+            if not self.analyzerStale:
+                self.analyzer.undo()
+            self.errorLineNumber = self._pop_pending_line()
+            self.errorCount += 1
             self.grbl_error.emit(line)
-            self.waitAck -= 1
             if self.waitAck == 0:
                 return True, line
             else:
                 return False, line
 
-        if line == "ok":
-            self.waitAck -= 1
+        if kind == LINE_OK:
+            self._pop_pending_line()
             if self.waitAck == 0:
                 if self.restoreWorkCoords: # coordinates need to be restored
                     print "Restoring work coordinates"
-                    self.do_command("G10 P0 L20 X%.4f Y%.4f Z%.4f" % (self.analyzer.x, self.analyzer.y, self.analyzer.z))
+                    position = self.analyzer.getPosition()
+                    if self.analyzerStale and self.lastPublishedPosition is not None:
+                        position = self.lastPublishedPosition # last polled position: the WCO of the reports before the reset
+                    self.do_command("G10 P0 L20 X%.4f Y%.4f Z%.4f" % tuple(position))
                     self.restoreWorkCoords = False
 
                 return True, line
@@ -474,7 +507,7 @@ class GrblWriter(QObject):
         # the gcode dwell command as implemented by grbl includes a
         # stepper-motor sync prior to beginning the dwell countdown.
         # use it to force a pause-until-caught-up.
-        self.serial.flushInput()
+        self.reader.clear()
         self.do_command("G4 P0")
 
 
@@ -505,8 +538,36 @@ class GrblWriter(QObject):
         except:
             pass # if it's not there, it's ok
 
-    def store_pos(self):
+    def sync_analyzer(self):
+        # the streamed lines were not analyzed: wait until the motion is complete, then read the position and the
+        # modal state (G90/G91, G20/G21, F) from grbl. Must be called when all the streamed lines are acknowledged
+        if not self.analyzerStale:
+            return
+        self.wait_motion()
+        self.read_modal_state()
+        self.update_position()
+        self.analyzerStale = False
+
+    def read_modal_state(self):
+        # written directly, not with do_command: "$G" must not be analyzed (it would repeat the last move under Z compensation)
+        m = re.search(r'\[(?:GC:)?([^\]]*)\]', self.read_response(future=self.write_line("$G")))
+        if m is None:
+            return
+        words = m.group(1).split()
+        if 'G91' in words or 'G90' in words:
+            self.analyzer.relative = 'G91' in words
+        if 'G20' in words or 'G21' in words:
+            self.analyzer.metric = 'G21' in words
+        for word in words:
+            if word.startswith('F') and safeFloat(word[1:]) > 0:
+                # the analyzer stores mm/min; grbl reports inches only with $13=1, whatever the G20/G21 mode
+                self.analyzer.f = safeFloat(word[1:]) * (25.4 if self.config.get(13) == 1 else 1.0)
+
+    def store_pos(self, safeZ = None):
+        # safeZ is the height the tool is raised to before going back to the position (default: the highest Z analyzed)
+        self.sync_analyzer()
         self.storedPos={}
+        self.storedPos['safeZ'] = safeZ if safeZ is not None else self.analyzer.maxZ
         self.storedPos['Position'] = self.analyzer.getPosition()
         self.storedPos['f'] = self.analyzer.f
         self.storedPos['relative'] = self.analyzer.relative
@@ -514,7 +575,7 @@ class GrblWriter(QObject):
 
     def resume_pos(self):
         # go back to the stored position
-        safeZ = self.analyzer.maxZ
+        safeZ = self.storedPos['safeZ']
         xyz = self.storedPos['Position']
         self.do_command("G90") # go to abs positioning
         self.do_command("G21") # go to metric
@@ -530,8 +591,14 @@ class GrblWriter(QObject):
             self.do_command("G20")
 
     def get_status(self, getBothStatuses = False):
-        self.serial.write('?') # no newline needed
-        res = self.read_response(None) # read one line
+        if self.transport is not None:
+            res = self.transport.query_status().wait(5)
+        else:
+            self.reader.clear(self.reader.statuses) # discard old reports
+            self.serial.write('?') # no newline needed
+            res = self.reader.get_status(5)
+        if res is None:
+            return (None, None) if getBothStatuses else None
         # status is: <Idle,MPos:10.000,-5.000,2.000,WPos:0.000,0.000,0.000,Buf:0,RX:0,Ln:0,F:0.>
         #get machine and work pos
         # Grbl 1.1 only gives either machine or work pos!
@@ -593,10 +660,13 @@ class GrblWriter(QObject):
 
     def do_probe(self):
         initial_status = self.get_status()
+        self.reader.clear(self.reader.probes)
         probeResponse = self.do_command("G38.2 Z%.3f F%.3f" % (-math.fabs(pycnc_config.PROBING_DISTANCE),
                                                                pycnc_config.PROBING_FEED))  # probe z
 
-        if 'ALARM' in probeResponse:
+        # the probe report is [PRB:x,y,z:1] if the probe touched, [PRB:x,y,z:0] if it did not
+        probeReport = self.reader.get_probe(1)
+        if 'ALARM' in probeResponse or (probeReport is not None and probeReport.endswith(':0]')):
             self.probe_error.emit()
             return None, None, None
 
@@ -637,7 +707,7 @@ class GrblWriter(QObject):
         return z
 
     def probe_grid(self, xRange, yRange, spacing):
-        self.zCompensation = ZCompensation(xRange, yRange, spacing)
+        self.zCompensation = ZCompensation(xRange, yRange, spacing, pycnc_config.ZCOMP_ARC_TOLERANCE)
         self.do_command("G90")
         probePoints = self.zCompensation.getProbePoints()
         self.do_command("G0 X" + str(probePoints[0][0]) + " Y" + str(probePoints[0][1])) # move to first probe point
@@ -665,5 +735,15 @@ class GrblWriter(QObject):
         self.analyzer.syncStatusWithGrbl(pos)
         self.position_updated.emit(self.analyzer.getPosition())
 
+    def sync_polled_position(self, since):
+        # sync the analyzer with the last polled status report, without a status request, if the report was received
+        # after since and the machine is idle. Returns False if there is no such report yet.
+        # The displayed position already comes from the reports: it is not published again
+        state = self.machineState
+        if not self.pollingStatus or state.timestamp < since or not state.isIdle() or state.mpos is None:
+            return False
+        self.analyzer.syncStatusWithGrbl({'type': 'Machine', 'position': state.mpos})
+        return True
+
     def cancelJog(self):
-        self.serial.write('\x85')
+        self.write_realtime('\x85')
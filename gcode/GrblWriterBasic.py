@@ -30,6 +30,7 @@ class GrblWriterBasic(QObject):
         self.analyzer = GCodeAnalyzer()
         self.g0_feed = 5000
         self.config = {}
+        self.errorLineNumber = None
 
     # this will actually connect to Grbl
     def open(self):
@@ -48,7 +49,18 @@ class GrblWriterBasic(QObject):
     def wait_motion(self):
         pass
 
-    def do_command_nonblock(self, gcode):
+    def prepare_command(self, gcode):
+        return gcode.strip()
+
+    def has_buffer_space(self, command):
+        return True
+
+    def send_nonblock(self, command, lineNumber = None):
+        if not command or command == '@pause':
+            return
+        self.do_command_nonblock(command, lineNumber)
+
+    def do_command_nonblock(self, gcode, lineNumber = None):
         print gcode
         self.analyzer.Analyze(gcode)
         self.position_updated.emit(self.analyzer.getPosition())
@@ -0,0 +1,63 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Qt adapter of the GrblWriter, and the dialogs shown for grbl errors.
+
+from PySide.QtCore import QObject, QThread, Signal
+from PySide.QtGui import QApplication, QMessageBox
+
+from gcode.GrblErrors import formatGrblError
+from gcode.GrblWriter import GrblWriter
+
+
+def showGrblErrorMessageBox(widget, lnum, line, err):
+    res = QMessageBox.critical(widget, "GCode error", formatGrblError(lnum, line, err), QMessageBox.Abort | QMessageBox.Ignore)
+    if res == QMessageBox.Ignore:
+        return True
+    else:
+        return False
+
+def processGuiEvents():
+    # keeps the interface alive while waiting for grbl. The runner and the checker wait in their own threads
+    if QThread.currentThread() == QApplication.instance().thread():
+        QApplication.processEvents()
+
+def askConfirmation(title, message):
+    res = QMessageBox.question(None, title, message, QMessageBox.Yes | QMessageBox.No)
+    return res == QMessageBox.Yes
+
+
+class GrblWriterSignals(QObject):
+
+    position_updated = Signal(object)
+    probe_error = Signal()
+    grbl_error = Signal(object)
+
+
+class QtGrblWriter(GrblWriter):
+    # the events are replaced by Qt signals, so that the connected widgets are updated in the GUI thread
+    # even when the events are emitted by the runner or by the reader thread
+
+    def __init__(self):
+        GrblWriter.__init__(self)
+        self.signals = GrblWriterSignals()
+        self.position_updated = self.signals.position_updated
+        self.probe_error = self.signals.probe_error
+        self.grbl_error = self.signals.grbl_error
+        self.idleCallback = processGuiEvents
+        self.confirmCallback = askConfirmation
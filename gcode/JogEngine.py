@@ -0,0 +1,252 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Continuous jogging for Grbl 1.1, independent of the user interface.
+#
+# While a jog is requested, a thread keeps a few short $J= segments queued in grbl, so that the motion is smooth and a
+# change of direction or speed takes effect within JOG_LATENCY. The segment duration follows the Grbl jogging
+# guidelines: dt = v^2 / (2 a (N-1)), with v the jog speed, a the acceleration and N the planner blocks, so that grbl
+# can keep the speed between segments; it is limited to JOG_MIN_SEGMENT_TIME and half the latency.
+# Grbl only keeps a speed if it can stop within the queued motion, v^2 / (2 a): above 2 a JOG_LATENCY, more motion
+# is queued (v / (2 a) seconds) instead of limiting the speed, so fast jogs react later. The time lost accelerating
+# and at the changes of direction is added to the estimate of the queued motion, so that the queue does not grow.
+# A large change of direction cancels the queued motion and starts again from the stop, instead of running out the
+# queue first: the jog cancel makes grbl slow down at its full deceleration.
+# A stop sends the jog cancel (0x85) immediately, from the calling thread.
+
+import sys
+import math
+import time
+import threading
+
+import pycnc_config
+from gcode.Events import Event
+
+MAX_LINES_IN_FLIGHT = 2 # jog lines sent but not acknowledged. Lines still in the serial buffer of grbl are not canceled
+REDIRECT_COSINE = 0.9 # changes of direction larger than about 25 degrees cancel the queued motion
+
+
+def jogSegment(direction, feed, grblConfig):
+    # speed (mm/min), duration (s), acceleration (mm/s^2, None if unknown) and latency (s of motion to keep queued) of
+    # the segments of a jog in direction (unit vector), limited by the grbl settings of the moving axes: max rate
+    # ($110-$112) and acceleration ($120-$122)
+    accel = None
+    for axis, component in enumerate(direction):
+        if component == 0:
+            continue
+        maxRate = grblConfig.get(110 + axis)
+        if maxRate:
+            feed = min(feed, maxRate / abs(component))
+        axisAccel = grblConfig.get(120 + axis)
+        if axisAccel:
+            accel = min(accel, axisAccel / abs(component)) if accel is not None else axisAccel / abs(component)
+
+    dt = pycnc_config.JOG_MIN_SEGMENT_TIME
+    latency = pycnc_config.JOG_LATENCY
+    if accel:
+        v = feed / 60.0
+        latency = max(latency, v / (2 * accel)) # time to run the stopping distance
+        dt = v ** 2 / (2 * accel * (pycnc_config.GRBL_PLANNER_BLOCKS - 1))
+    dt = max(pycnc_config.JOG_MIN_SEGMENT_TIME, min(dt, latency / 2))
+    return feed, dt, accel, latency
+
+def junctionDelay(lastSegment, direction, feed, accel):
+    # time lost slowing down at the junction with the previous segment ((direction, feed), None when stopped) and
+    # accelerating again. Approximation: the speed at the junction is scaled by the cosine of the angle
+    if not accel:
+        return 0.0
+    v = feed / 60.0
+    if lastSegment is None:
+        return v / (2 * accel)
+    lastDirection, lastFeed = lastSegment
+    lastV = lastFeed / 60.0
+    cosine = max(0.0, sum(a * b for a, b in zip(lastDirection, direction)))
+    junction = min(v, lastV) * cosine
+    return (lastV - junction) / (2 * accel) + (v - junction) / (2 * accel)
+
+
+class JogEngine(object):
+
+    def __init__(self):
+        self.error_event = Event() # emitted with the error message when grbl refuses a jog segment
+        self.grblWriter = None
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock) # notified when a stop is complete
+        self.wakeEvent = threading.Event()
+        self.thread = None
+        self.running = False
+        self.jogRequest = None # (direction, feed) requested by the jogger, None to stop
+        self.lastRequest = 0 # time of the last request, for the watchdog
+        self.stopRequested = False
+        self.stopping = False # a stop is being completed: waiting for the acks and the end of the motion
+        self.cancelAgain = False # jog lines were in flight when the jog was canceled
+        self.queuedUntil = 0 # estimated time at which the queued segments are executed
+        self.segments = 0 # segments sent since the start
+        self.lastSegment = None # (direction, feed) of the last segment sent
+
+    def setGrbl(self, grblWriter):
+        self.grblWriter = grblWriter
+
+    def start(self):
+        if self.thread is not None: return
+        self.running = True
+        self.thread = threading.Thread(target = self.run, name = "JogEngine")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def shutdown(self):
+        if self.thread is None: return
+        self.stop()
+        self.running = False
+        self.wakeup()
+        self.thread.join()
+        self.thread = None
+
+    def wakeup(self):
+        self.wakeEvent.set()
+
+    # --- requests, from any thread ---
+
+    def jog(self, xyz, feed):
+        # jog in the direction of xyz (only the direction is used) at feed mm/min, until stop() or until the
+        # request is not repeated within JOG_WATCHDOG
+        length = math.sqrt(sum(c ** 2 for c in xyz))
+        if length == 0 or feed <= 0:
+            self.stop()
+            return
+        with self.lock:
+            self.jogRequest = (tuple(c / length for c in xyz), float(feed))
+            self.lastRequest = time.time()
+        self.wakeup()
+
+    def stop(self):
+        with self.lock:
+            wasJogging = self.jogRequest is not None or self.segments > 0
+            self.jogRequest = None
+            if wasJogging:
+                self.stopRequested = True
+        if wasJogging and self.grblWriter is not None:
+            self.grblWriter.cancelJog() # immediately: the real-time command does not wait for the thread
+        self.wakeup()
+
+    def isBusy(self):
+        return self.jogRequest is not None or self.stopRequested or self.stopping or self.segments > 0
+
+    def waitIdle(self, timeout = 5.0):
+        # wait until a stop is complete (the machine stopped and the position was read). Returns False if the
+        # engine is still busy after the timeout
+        end = time.time() + timeout
+        with self.idle:
+            while self.isBusy():
+                remaining = end - time.time()
+                if remaining <= 0:
+                    return False
+                self.idle.wait(remaining)
+        return True
+
+    # --- jog thread ---
+
+    def run(self):
+        writer = self.grblWriter
+        writer.line_received.connect(self.wakeup)
+        try:
+            while self.running:
+                self.wakeEvent.clear()
+                if self.segments > 0:
+                    # only while jogging: otherwise the responses belong to the other users of the writer
+                    self.readResponses()
+                timeout = self.step()
+                if timeout is None or timeout > 0:
+                    self.wakeEvent.wait(timeout)
+        finally:
+            writer.line_received.disconnect(self.wakeup)
+
+    def readResponses(self):
+        while True:
+            received, lineNumber, error = self.grblWriter.stream_response()
+            if not received:
+                return
+            if error is not None:
+                self.error_event.emit(error)
+                self.stop()
+
+    def step(self):
+        # one iteration of the jog thread: returns how long it can sleep (None: until woken up)
+        writer = self.grblWriter
+        now = time.time()
+        with self.lock:
+            request = self.jogRequest
+            if request is not None and now - self.lastRequest > pycnc_config.JOG_WATCHDOG:
+                request = None # the jogger stopped confirming the jog
+            if self.stopRequested:
+                self.stopRequested = False
+                self.stopping = True
+                self.cancelAgain = writer.waitAck > 0
+                self.queuedUntil = 0
+
+        if request is None and self.segments > 0 and not self.stopping:
+            self.stop() # watchdog
+            return 0
+
+        if self.stopping:
+            if writer.waitAck > 0:
+                return 0.05 # wait for the acks of the lines in flight (the timeout protects from a lost ack)
+            self.finishStop()
+            return 0
+
+        if request is None:
+            return None
+
+        if writer.waitAck >= MAX_LINES_IN_FLIGHT:
+            return 0.05
+        direction, feed = request
+        feed, dt, accel, latency = jogSegment(direction, feed, writer.config)
+        if self.queuedUntil < now:
+            self.lastSegment = None # the queue ran empty: grbl stopped
+        if self.lastSegment is not None and sum(a * b for a, b in zip(self.lastSegment[0], direction)) < REDIRECT_COSINE:
+            # change of direction: cancel the queued segments, the jog continues after the stop
+            with self.lock:
+                self.stopRequested = True
+            writer.cancelJog()
+            return 0
+        delay = junctionDelay(self.lastSegment, direction, feed, accel) if self.lastSegment != (direction, feed) else 0.0
+        if self.queuedUntil > now and self.queuedUntil - now + dt + delay > latency:
+            # the queue is full: wait until the next segment fits in the latency
+            return self.queuedUntil + dt + delay - latency - now
+        distance = feed / 60.0 * dt
+        command = "$J=G91 G21" + ''.join(" %s%.3f" % (axis, c * distance) for axis, c in zip("XYZ", direction) if c != 0)
+        writer.stream_line(command + " F%d" % feed)
+        self.segments += 1
+        self.lastSegment = (direction, feed)
+        self.queuedUntil = max(self.queuedUntil, now) + dt + delay
+        return 0
+
+    def finishStop(self):
+        writer = self.grblWriter
+        if self.cancelAgain:
+            writer.cancelJog() # the lines that were in the serial buffer of grbl were executed after the cancel
+        self.segments = 0
+        self.lastSegment = None
+        try:
+            writer.wait_motion()
+            writer.update_position()
+        except:
+            self.error_event.emit("%s" % sys.exc_info()[0])
+        with self.idle:
+            self.stopping = False # only now: the engine is busy until the position is read
+            self.idle.notifyAll()
@@ -17,92 +17,65 @@
 # along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
 
 from PySide.QtCore import *
-import sys
 import pycnc_config
-import math
+from gcode.JogEngine import JogEngine
+from gcode.CommandWorker import CommandWorker
 
-# run commands in a thread, so we can refuse or accept events while machine is busy
-class JogThread(QThread):
-
-    error_event = Signal(object)
-
-    def __init__(self):
-        QThread.__init__(self)
-        self.cmd = ""
-        self.grblWriter = None
-        self.busy = False
-
-    def run(self):
-        if self.cmd == "" or self.grblWriter is None:
-            return
-
-        self.busy = True
-
-        try:
-            self.grblWriter.do_command(self.cmd, self.cncWait)
-        except:
-            self.busy = False
-            e = sys.exc_info()[0]
-            self.error_event.emit(e)
-
-        self.grblWriter.update_position()
-
-        self.cmd = ""
-        self.busy = False
-
-    def do_command(self, cmd, cncWait = False):
-        self.cmd = cmd
-        self.cncWait = cncWait
-        self.start()
+def printTiming(timing):
+    print "jog command %s: %.1f ms (%.1f ms queued)" % (timing.command, timing.latency() * 1000, timing.wait * 1000)
 
 
+# the commands run in a CommandWorker, so we can refuse or accept events while machine is busy
 class JogHelper(QObject):
 
     error_event = Signal(object)
 
     def __init__(self, grbl = None):
         QObject.__init__(self)
-        self.busy = False
-        self.grblWriter = grbl
-        self.jogThread = JogThread()
-        self.jogThread.grblWriter = self.grblWriter
-        self.jogThread.error_event.connect(lambda e: self.error_event.emit(e))
-        self.cncWait = False
+        self.grblWriter = None
+        self.worker = CommandWorker()
+        self.worker.error_event = self.error_event
+        if pycnc_config.SERIAL_DEBUG:
+            self.worker.done_event.connect(printTiming)
+        if grbl is not None:
+            self.setGrbl(grbl)
 
     def setGrbl(self, grbl):
         self.grblWriter = grbl
-        self.jogThread.grblWriter = self.grblWriter
+        self.worker.setGrbl(grbl)
+        self.worker.start()
 
-    def run_command(self, cmd, cncWait = False):
+    def run_command(self, cmd, cncWait = False, relative = None, metric = False):
+        # relative, metric: the distance mode and units needed by the command (see CommandWorker.submit)
         if self.grblWriter is None or self.isBusy():
             return
 
-        self.jogThread.do_command(cmd, cncWait)
+        self.worker.submit(cmd, cncWait, relative, metric)
 
     def waitThread(self):
-        self.jogThread.wait()
+        return self.worker.waitIdle()
 
     def isBusy(self):
-        return self.jogThread.busy
+        return self.worker.isBusy()
+
+    def shutdown(self):
+        self.worker.shutdown()
+
+    def stop(self):
+        # stop the jog and wait until the machine is ready for other commands. Returns False if a command is still
+        # running: nothing else must be sent to grbl
+        return self.waitThread()
 
     def relative_move(self, xyz, feed = None):
         if self.grblWriter is None: return
+        if all([pos == 0 for pos in xyz]): return # a jog stop: the moves are not continuous
 
         if feed is None or feed < 0:
             cmd = "G0 X%.1f Y%.1f Z%.1f" % ( xyz[0], xyz[1], xyz[2])
         else:
             cmd = "G1 X%.1f Y%.1f Z%.1f F%d" % (xyz[0], xyz[1], xyz[2], feed)
 
-        # if grbl is absolute, make relative
-        if not self.grblWriter.analyzer.relative:
-            self.run_command("G91")
-            self.waitThread()
-
-        if not self.grblWriter.analyzer.metric:
-            self.run_command("G21")
-            self.waitThread()
-
-        self.run_command(cmd, True)
+        self.run_command(cmd, True, relative = True, metric = True)
 
     def absolute_move(self, xyz, feed = None):
         if self.grblWriter is None: return
@@ -112,16 +85,7 @@ class JogHelper(QObject):
         else:
             cmd = "G1 X%.1f Y%.1f Z%.1f F%d" % (xyz[0], xyz[1], xyz[2], feed)
 
-        # if grbl is relative, make absolute
-        if self.grblWriter.analyzer.relative:
-            self.run_command("G90")
-            self.waitThread()
-
-        if not self.grblWriter.analyzer.metric:
-            self.run_command("G21")
-            self.waitThread()
-
-        self.run_command(cmd, True)
+        self.run_command(cmd, True, relative = False, metric = True)
 
     def home_update(self, xyz):
         if self.grblWriter is None: return
@@ -137,28 +101,43 @@ class JogHelper(QObject):
 
 
 class JogHelper1_1(JogHelper):
+    # relative moves with a feed are continuous jogs (JogEngine): the move gives the direction, and the jog continues
+    # while the jogger repeats it, until a move of (0, 0, 0). Moves without a feed (e.g. the shuttle dial) are steps
 
     def __init__(self):
         JogHelper.__init__(self)
+        self.jogEngine = JogEngine()
+        self.jogEngine.error_event = self.error_event
+
+    def setGrbl(self, grbl):
+        JogHelper.setGrbl(self, grbl)
+        self.jogEngine.setGrbl(grbl)
+        self.jogEngine.start()
+
+    def shutdown(self):
+        self.jogEngine.shutdown()
+        JogHelper.shutdown(self)
+
+    def stop(self):
+        self.jogEngine.stop()
+        return self.jogEngine.waitIdle() and JogHelper.stop(self)
+
+    def isBusy(self):
+        return self.worker.isBusy() or self.jogEngine.isBusy()
 
     def relative_move(self, xyz, feed = None):
-        print "Relative move received"
         if self.grblWriter is None: return
 
         # this is a jog stop
         if all([pos == 0 for pos in xyz]):
-            print "Cancelling jog"
-            self.grblWriter.cancelJog()
-            self.grblWriter.wait_motion()
-            self.grblWriter.update_position()
+            self.jogEngine.stop()
             return
 
-        travelDistance = pycnc_config.BTN_REPEAT * float(feed)/60/1000 # distance to travel in the space of a btn_repeat
-
-        plannedDistance = math.sqrt(xyz[0]**2 + xyz[1]**2 + xyz[2]**2)
-
-        factor = travelDistance/plannedDistance
-
-        cmd = "$J=G91 X%.1f Y%.1f Z%.1f F%d" % (xyz[0]*factor, xyz[1]*factor, xyz[2]*factor, feed)
+        if feed is None or feed <= 0:
+            if self.isBusy(): return
+            feed = pycnc_config.MAX_FEED_Z if xyz[2] != 0 else pycnc_config.MAX_FEED
+            self.run_command("$J=G91 G21 X%.3f Y%.3f Z%.3f F%d" % (xyz[0], xyz[1], xyz[2], feed))
+            return
 
-        self.run_command(cmd, False)
+        if self.worker.isBusy(): return # a command is running
+        self.jogEngine.jog(xyz, feed)
@@ -0,0 +1,223 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Analysis of large gcode files on multiple cores.
+#
+# The file is split into chunks that are analyzed by a pool of processes. The state of the analyzer at the
+# start of a chunk (position, modal codes, feed, offsets...) is not known until the previous chunks are
+# analyzed, so every worker starts from a guess: it first analyzes the end of the previous chunk (lead-in)
+# and keeps the state it finds. The worker records its state after each of the first lines of the chunk.
+# When merging, the lines of the chunk are analyzed again with the real state until it is the same as the state
+# of the worker: from that line on, the results of the worker are exactly those of a sequential analysis.
+# If the states do not converge (e.g. relative moves), the whole chunk is analyzed again sequentially.
+
+import multiprocessing
+from array import array
+
+from GCodeAnalyzer import GCodeAnalyzer
+from GCodeIndex import GCodeAnalysis, GCodeLines
+from PlannerTimeEstimator import PlannerTimeEstimator
+
+LEAD_IN_SIZE = 64*1024 # bytes of the previous chunk analyzed to guess the starting state
+SNAPSHOT_LINES = 2000 # number of lines at the start of the chunk for which the state is recorded
+CHUNKS_PER_PROCESS = 4
+MIN_CHUNK_SIZE = 1024*1024
+
+INF = float('inf')
+
+
+def splitLines(data):
+    # split a string into lines exactly like iterating over a file does (lines end with \n only)
+    if not data:
+        return []
+    lines = [line + '\n' for line in data.split('\n')]
+    if data.endswith('\n'):
+        lines.pop()
+    else:
+        lines[-1] = lines[-1][:-1]
+    return lines
+
+
+def chunkOffsets(fileName, nChunks):
+    # offsets of the chunk boundaries, at the start of a line
+    with open(fileName, 'rb') as f:
+        f.seek(0, 2)
+        size = f.tell()
+        boundaries = [0]
+        for k in range(1, nChunks):
+            f.seek(k * size / nChunks)
+            f.readline()
+            offset = f.tell()
+            if boundaries[-1] < offset < size:
+                boundaries.append(offset)
+        boundaries.append(size)
+    return boundaries
+
+
+def newAnalyzer(g0_feed, grblConfig, timeTypecode):
+    analyzer = GCodeAnalyzer()
+    analyzer.fastf = g0_feed
+    analyzer.trackMovements = False
+    if PlannerTimeEstimator.isSupported(grblConfig):
+        analyzer.planner = PlannerTimeEstimator(grblConfig, timeTypecode)
+    return analyzer
+
+
+def resetBoundingBox(analyzer):
+    analyzer.minX = analyzer.minY = analyzer.minZ = INF
+    analyzer.maxX = analyzer.maxY = analyzer.maxZ = -INF
+
+
+class ChunkResult:
+    # results of the speculative analysis of a chunk
+
+    def __init__(self):
+        self.states = [] # state before the first line, then after each of the first SNAPSHOT_LINES lines
+        self.boxes = [] # bounding box of each of the first SNAPSHOT_LINES lines
+        self.restBox = None # bounding box of the remaining lines
+        self.lineTime = array('d') # time (in minutes) of each line
+        self.lineTravel = array('d') # travel of each line
+        self.planner = None # planner blocks of the chunk
+        self.endState = None
+
+
+def analyzeChunk(args):
+    # runs in the worker processes
+    fileName, leadInStart, start, end, g0_feed, grblConfig, timeTypecode = args
+    with open(fileName, 'rb') as f:
+        f.seek(leadInStart)
+        data = f.read(end - leadInStart)
+
+    analyzer = newAnalyzer(g0_feed, grblConfig, timeTypecode)
+    leadIn = splitLines(data[:start - leadInStart])
+    if leadInStart > 0:
+        leadIn = leadIn[1:] # the first line is incomplete
+    for line in leadIn:
+        analyzer.Analyze(line)
+
+    # only the state found with the lead-in is kept
+    if analyzer.planner is not None:
+        stopPending = analyzer.planner.stopPending
+        analyzer.planner = PlannerTimeEstimator(grblConfig, timeTypecode)
+        analyzer.planner.autoPlan = False
+        analyzer.planner.stopPending = stopPending
+
+    result = ChunkResult()
+    result.states.append(analyzer.getState())
+    for index, line in enumerate(splitLines(data[start - leadInStart:])):
+        if index <= SNAPSHOT_LINES:
+            resetBoundingBox(analyzer)
+        analyzer.time = 0
+        analyzer.travel = 0
+        analyzer.Analyze(line)
+        result.lineTime.append(analyzer.time)
+        result.lineTravel.append(analyzer.travel)
+        if index < SNAPSHOT_LINES:
+            result.states.append(analyzer.getState())
+            result.boxes.append(analyzer.getBoundingBox())
+    result.restBox = analyzer.getBoundingBox()
+    result.planner = analyzer.planner
+    result.endState = analyzer.getState()
+    return result
+
+
+def mergeBoundingBox(analyzer, box):
+    (minX, minY, minZ), (maxX, maxY, maxZ) = box
+    analyzer.minX = min(analyzer.minX, minX)
+    analyzer.minY = min(analyzer.minY, minY)
+    analyzer.minZ = min(analyzer.minZ, minZ)
+    analyzer.maxX = max(analyzer.maxX, maxX)
+    analyzer.maxY = max(analyzer.maxY, maxY)
+    analyzer.maxZ = max(analyzer.maxZ, maxZ)
+
+
+def analyzeFileParallel(fileName, g0_feed, grblConfig = None, lowMemory = False, processes = None):
+    # same as GCodeIndex.analyzeFile, using a pool of processes
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    timeTypecode = 'f' if lowMemory else 'd'
+    with open(fileName, 'rb') as f:
+        f.seek(0, 2)
+        size = f.tell()
+    nChunks = max(1, min(processes * CHUNKS_PER_PROCESS, size / MIN_CHUNK_SIZE))
+    boundaries = chunkOffsets(fileName, nChunks)
+    tasks = [(fileName, max(0, start - LEAD_IN_SIZE), start, end, g0_feed, grblConfig, timeTypecode)
+             for start, end in zip(boundaries[:-1], boundaries[1:])]
+
+    analyzer = newAnalyzer(g0_feed, grblConfig, timeTypecode)
+    times = array(timeTypecode)
+    offsets = array('L', [0])
+    offset = 0
+    gcode = []
+    useLineTimes = analyzer.planner is None
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        with open(fileName, 'rb') as f:
+            # results are merged in order, while the next chunks are being analyzed
+            for task, chunk in zip(tasks, pool.imap(analyzeChunk, tasks)):
+                lines = splitLines(f.read(task[3] - task[2]))
+                for line in lines:
+                    offset += len(line)
+                    offsets.append(offset)
+                if not lowMemory:
+                    gcode.extend(lines)
+
+                # analyze the lines again until the state is the same as in the worker
+                index = 0
+                while index < len(lines) and (index >= len(chunk.states) or analyzer.getState() != chunk.states[index]):
+                    analyzer.Analyze(lines[index])
+                    if useLineTimes:
+                        times.append(analyzer.getTravelTime()*60)
+                    index += 1
+                if index == len(lines):
+                    continue
+
+                # the worker results are valid from line index on
+                for box in chunk.boxes[index:]:
+                    mergeBoundingBox(analyzer, box)
+                mergeBoundingBox(analyzer, chunk.restBox)
+                for travel in chunk.lineTravel[index:]:
+                    analyzer.travel += travel
+                if useLineTimes:
+                    totalTime = analyzer.time
+                    for lineTime in chunk.lineTime[index:]:
+                        totalTime += lineTime
+                        times.append(totalTime*60)
+                    analyzer.time = totalTime
+                else:
+                    analyzer.planner.appendBlocks(chunk.planner, index)
+                analyzer.setState(chunk.endState)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    if analyzer.planner is not None:
+        times = analyzer.planner.computeLineTimes()
+
+    result = GCodeAnalysis()
+    result.gcode = GCodeLines(fileName, offsets) if lowMemory else gcode
+    result.times = times
+    result.totalTime = times[-1] if len(times) > 0 else 0
+    result.bBox = analyzer.getBoundingBox()
+    result.travel = analyzer.getTravelLen()
+    result.offsets = offsets
+    return result
@@ -0,0 +1,293 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Job time estimation that models the Grbl motion planner.
+#
+# The simple estimate (length / feed) ignores acceleration, which makes jobs with many short segments
+# look much faster than they are. This estimator collects the moves found by the GCodeAnalyzer and runs
+# the same kind of look-ahead planning as Grbl: junction speeds are limited by the junction deviation ($11),
+# block speeds by the per-axis max rates ($110-$112), and every block follows a trapezoidal velocity
+# profile with the per-axis accelerations ($120-$122). NumPy is used, if available, for the vectorizable parts.
+
+import math
+import bisect
+from array import array
+
+numpy_available = True
+try:
+    import numpy
+except:
+    numpy_available = False
+
+# grbl settings needed by the estimator
+REQUIRED_SETTINGS = [110, 111, 112, 120, 121, 122]
+
+MINIMUM_JUNCTION_COS = 0.999999 # above this, the junction is a full reversal and the speed is 0
+
+# the blocks are planned in chunks, so that memory does not grow with the file size.
+# The last PLAN_OVERLAP blocks of a chunk are planned again with the next one (Grbl itself only looks 16 blocks ahead)
+PLAN_CHUNK_SIZE = 65536
+PLAN_OVERLAP = 256
+
+
+class PlannerTimeEstimator:
+
+    def __init__(self, grblConfig, timeTypecode = 'd'):
+        self.maxRate = [grblConfig[110] / 60.0, grblConfig[111] / 60.0, grblConfig[112] / 60.0] # mm/s
+        self.maxAccel = [grblConfig[120], grblConfig[121], grblConfig[122]] # mm/s^2
+        self.junctionDeviation = grblConfig.get(11, 0.01)
+        self.arcTolerance = grblConfig.get(12, 0.002)
+
+        # one entry per planner block
+        self.length = array('d')
+        self.nominalSpeed = array('d')
+        self.accel = array('d')
+        self.entryDir = [array('d'), array('d'), array('d')] # unit vector at the start of the block
+        self.exitDir = [array('d'), array('d'), array('d')] # unit vector at the end of the block (differs for arcs)
+        self.stopBefore = array('b') # the machine stops before this block
+        self.line = array('l')
+
+        self.lineCount = 0
+        self.lineTimes = array(timeTypecode, [0.0]) # time of each line; the last element is the line being analyzed
+        self.stopPending = True # the machine starts from rest
+        self.carriedEntry = 0.0 # entry speed of the first block, as planned with the previous chunk
+        self.autoPlan = True # if False, the blocks are only collected, to be added to another estimator with appendBlocks
+
+    @staticmethod
+    def isSupported(grblConfig):
+        if not grblConfig:
+            return False
+        return all(key in grblConfig for key in REQUIRED_SETTINGS)
+
+    def _axisLimits(self, direction):
+        # max speed and acceleration along a unit vector: no axis can exceed its own limits
+        speed = float('inf')
+        accel = float('inf')
+        for u, axisRate, axisAccel in zip(direction, self.maxRate, self.maxAccel):
+            u = math.fabs(u)
+            if u > 1e-9:
+                speed = min(speed, axisRate / u)
+                accel = min(accel, axisAccel / u)
+        return speed, accel
+
+    def _addBlock(self, length, speed, accel, entryDir, exitDir):
+        self.length.append(length)
+        self.nominalSpeed.append(speed)
+        self.accel.append(accel)
+        for axis in range(3):
+            self.entryDir[axis].append(entryDir[axis])
+            self.exitDir[axis].append(exitDir[axis])
+        self.stopBefore.append(1 if self.stopPending else 0)
+        self.line.append(self.lineCount)
+        self.stopPending = False
+        if self.autoPlan and len(self.length) >= PLAN_CHUNK_SIZE + PLAN_OVERLAP:
+            self._plan(False)
+
+    def addLine(self, start, end, feed):
+        # linear move. feed in mm/min, None for a rapid (G0) move
+        delta = [e - s for s, e in zip(start, end)]
+        length = math.sqrt(delta[0]**2 + delta[1]**2 + delta[2]**2)
+        if length < 1e-9:
+            return
+        direction = [d / length for d in delta]
+        speed, accel = self._axisLimits(direction)
+        if feed is not None and feed > 0:
+            speed = min(speed, feed / 60.0)
+        self._addBlock(length, speed, accel, direction, direction)
+
+    def addArc(self, start, end, center, ccw, feed):
+        # arc in the XY plane (possibly helical). Grbl splits it in segments within the arc tolerance:
+        # the junctions between the segments limit the speed
+        radius = math.sqrt((start[0] - center[0])**2 + (start[1] - center[1])**2)
+        if radius < 1e-9:
+            self.addLine(start, end, feed)
+            return
+        startAngle = math.atan2(start[1] - center[1], start[0] - center[0])
+        endAngle = math.atan2(end[1] - center[1], end[0] - center[0])
+        travelAngle = (endAngle - startAngle) if ccw else (startAngle - endAngle)
+        travelAngle = travelAngle % (2 * math.pi)
+        if travelAngle < 1e-9:
+            travelAngle = 2 * math.pi # same start and end point: full circle
+
+        planarLength = travelAngle * radius
+        length = math.sqrt(planarLength**2 + (end[2] - start[2])**2)
+
+        sign = 1.0 if ccw else -1.0
+        entryDir = (-sign * math.sin(startAngle), sign * math.cos(startAngle), 0.0)
+        exitDir = (-sign * math.sin(endAngle), sign * math.cos(endAngle), 0.0)
+
+        speed = min(self.maxRate[0], self.maxRate[1])
+        accel = min(self.maxAccel[0], self.maxAccel[1])
+        if feed is not None and feed > 0:
+            speed = min(speed, feed / 60.0)
+
+        if self.arcTolerance < radius:
+            segments = int(math.floor(0.5 * planarLength / math.sqrt(self.arcTolerance * (2 * radius - self.arcTolerance))))
+            if segments > 1:
+                halfCos = math.cos(0.5 * travelAngle / segments)
+                if halfCos < 1.0:
+                    speed = min(speed, math.sqrt(accel * self.junctionDeviation * halfCos / (1.0 - halfCos)))
+
+        self._addBlock(length, speed, accel, entryDir, exitDir)
+
+    def addStop(self, dwell = 0):
+        # a command that empties the planner (dwell, spindle change, coordinate change...)
+        self.stopPending = True
+        if dwell > 0:
+            self.lineTimes[self.lineCount] += dwell
+
+    def endLine(self):
+        self.lineCount += 1
+        self.lineTimes.append(0.0)
+
+    def appendBlocks(self, other, firstLine):
+        # continue with the blocks and dwells that another estimator collected, starting from its line firstLine.
+        # Used by the parallel analysis, where the chunks of a file are analyzed by different processes
+        lineOffset = self.lineCount - firstLine
+        self.lineTimes[self.lineCount] += other.lineTimes[firstLine] # dwells
+        self.lineTimes.extend(array(self.lineTimes.typecode, other.lineTimes[firstLine+1:]))
+        self.lineCount += other.lineCount - firstLine
+        self.stopPending = other.stopPending
+
+        start = bisect.bisect_left(other.line, firstLine)
+        n = len(other.length)
+        while start < n:
+            # plan in the same chunks as if the blocks were added one by one
+            end = min(n, start + PLAN_CHUNK_SIZE + PLAN_OVERLAP - len(self.length))
+            for blockArray, otherArray in zip([self.length, self.nominalSpeed, self.accel, self.stopBefore] + self.entryDir + self.exitDir,
+                                              [other.length, other.nominalSpeed, other.accel, other.stopBefore] + other.entryDir + other.exitDir):
+                blockArray.extend(otherArray[start:end])
+            self.line.extend(array('l', [line + lineOffset for line in other.line[start:end]]))
+            if len(self.length) >= PLAN_CHUNK_SIZE + PLAN_OVERLAP:
+                self._plan(False)
+            start = end
+
+    def _junctionSpeeds(self):
+        # max entry speed of each block, from the angle with the previous block
+        n = len(self.length)
+        if numpy_available:
+            nominal = numpy.frombuffer(self.nominalSpeed, dtype=numpy.float64)
+            accel = numpy.frombuffer(self.accel, dtype=numpy.float64)
+            cosTheta = numpy.zeros(n)
+            for axis in range(3):
+                prevExit = numpy.frombuffer(self.exitDir[axis], dtype=numpy.float64)
+                entry = numpy.frombuffer(self.entryDir[axis], dtype=numpy.float64)
+                cosTheta[1:] -= prevExit[:-1] * entry[1:]
+            cosTheta = numpy.clip(cosTheta, -1.0, 1.0)
+            sinHalf = numpy.sqrt(0.5 * (1.0 - cosTheta))
+            junctionAccel = accel.copy()
+            junctionAccel[1:] = numpy.minimum(accel[1:], accel[:-1])
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                vj = numpy.sqrt(junctionAccel * self.junctionDeviation * sinHalf / (1.0 - sinHalf))
+            vj[cosTheta < -MINIMUM_JUNCTION_COS] = numpy.inf # straight line
+            vj[cosTheta > MINIMUM_JUNCTION_COS] = 0.0 # reversal
+            vj[1:] = numpy.minimum(vj[1:], numpy.minimum(nominal[1:], nominal[:-1]))
+            vj[numpy.frombuffer(self.stopBefore, dtype=numpy.int8) != 0] = 0.0
+            vj[0] = self.carriedEntry
+            return vj.tolist()
+
+        vj = [0.0] * n
+        vj[0] = self.carriedEntry
+        for k in range(1, n):
+            if self.stopBefore[k]:
+                continue
+            cosTheta = -sum(self.exitDir[axis][k-1] * self.entryDir[axis][k] for axis in range(3))
+            if cosTheta > MINIMUM_JUNCTION_COS:
+                continue
+            vmax = min(self.nominalSpeed[k], self.nominalSpeed[k-1])
+            if cosTheta >= -MINIMUM_JUNCTION_COS:
+                sinHalf = math.sqrt(0.5 * (1.0 - max(-1.0, cosTheta)))
+                junctionAccel = min(self.accel[k], self.accel[k-1])
+                vmax = min(vmax, math.sqrt(junctionAccel * self.junctionDeviation * sinHalf / (1.0 - sinHalf)))
+            vj[k] = vmax
+        return vj
+
+    def _blockTimes(self, entry, exit):
+        # time of each block with a trapezoidal (or triangular) velocity profile
+        if numpy_available:
+            L = numpy.frombuffer(self.length, dtype=numpy.float64)
+            vn = numpy.frombuffer(self.nominalSpeed, dtype=numpy.float64)
+            a = numpy.frombuffer(self.accel, dtype=numpy.float64)
+            vi = numpy.array(entry)
+            vo = numpy.array(exit)
+            accelDist = (vn**2 - vi**2) / (2 * a)
+            decelDist = (vn**2 - vo**2) / (2 * a)
+            cruise = L - accelDist - decelDist
+            vPeak = numpy.sqrt(numpy.maximum((2 * a * L + vi**2 + vo**2) / 2, 0.0))
+            trapezoid = (vn - vi) / a + (vn - vo) / a + numpy.maximum(cruise, 0.0) / vn
+            triangle = (vPeak - vi) / a + (vPeak - vo) / a
+            return numpy.where(cruise >= 0, trapezoid, triangle)
+
+        times = []
+        for L, vn, a, vi, vo in zip(self.length, self.nominalSpeed, self.accel, entry, exit):
+            accelDist = (vn*vn - vi*vi) / (2 * a)
+            decelDist = (vn*vn - vo*vo) / (2 * a)
+            cruise = L - accelDist - decelDist
+            if cruise >= 0:
+                times.append((vn - vi) / a + (vn - vo) / a + cruise / vn)
+            else:
+                vPeak = math.sqrt(max((2 * a * L + vi*vi + vo*vo) / 2, 0.0))
+                times.append((vPeak - vi) / a + (vPeak - vo) / a)
+        return times
+
+    def _plan(self, final):
+        # plan the stored blocks and add their times to the lines. Unless this is the final call,
+        # the last PLAN_OVERLAP blocks are kept, and the end of the chunk is treated as a stop, as Grbl does with its buffer
+        n = len(self.length)
+        if n == 0:
+            return
+        keep = 0 if final else min(n - 1, PLAN_OVERLAP)
+        entry = self._junctionSpeeds()
+
+        # backward pass: every block must be able to decelerate to the entry speed of the next one
+        nextEntry = 0.0
+        for k in range(n-1, -1, -1):
+            reachable = math.sqrt(nextEntry * nextEntry + 2 * self.accel[k] * self.length[k])
+            if reachable < entry[k]:
+                entry[k] = reachable
+            nextEntry = entry[k]
+
+        # forward pass: every block must be reachable by accelerating from the entry speed of the previous one
+        for k in range(1, n):
+            reachable = math.sqrt(entry[k-1] * entry[k-1] + 2 * self.accel[k-1] * self.length[k-1])
+            if reachable < entry[k]:
+                entry[k] = reachable
+
+        exit = entry[1:] + [0.0] # a stop before a block already has an entry speed of 0
+        blockTimes = self._blockTimes(entry, exit)
+
+        done = n - keep
+        lineTimes = self.lineTimes
+        for k in range(done):
+            lineTimes[self.line[k]] += blockTimes[k]
+
+        self.carriedEntry = entry[done] if keep > 0 else 0.0
+        for blockArray in [self.length, self.nominalSpeed, self.accel, self.stopBefore, self.line] + self.entryDir + self.exitDir:
+            del blockArray[:done]
+
+    def computeLineTimes(self):
+        # returns the cumulative time (in seconds) at the end of each analyzed line.
+        # Call this only once, after the last line
+        self._plan(True)
+        times = self.lineTimes
+        times.pop() # the line after the last one
+        total = 0.0
+        for lineIndex in xrange(len(times)):
+            total += times[lineIndex]
+            times[lineIndex] = total
+        return times
@@ -0,0 +1,42 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Limit of the rate of the updates sent to the user interface. The updates that come too early are dropped: the state
+# is read again for the next update, so it always carries the latest values.
+
+import time
+
+
+class RateLimiter(object):
+
+    def __init__(self, rate):
+        # rate: maximum number of updates per second. 0 lets all the updates through
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.last = None
+
+    def ready(self):
+        # True if an update can be sent now
+        now = time.time()
+        if self.last is not None and now - self.last < self.interval:
+            return False
+        self.last = now
+        return True
+
+    def reset(self):
+        # the next update is sent immediately
+        self.last = None
@@ -0,0 +1,182 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Z compensation from a grid of probed heights: the Z offset at any point is interpolated bilinearly.
+# NumPy is used, if available, to compute the offsets of many points at once (getZValues).
+
+import math
+from bisect import bisect_right
+
+numpy_available = True
+try:
+    import numpy
+except:
+    numpy_available = False
+
+
+# class to compensate for Z offsets after a grid probe
+class ZCompensation:
+
+    def __init__(self, xRangeOrSize, yRangeOrSize, spacing, arcTolerance = 0.01):
+        # predefines the grid. Inputs can be ranges (tuple) or sizes.
+        # Arcs are compensated by splitting them into chords within arcTolerance
+        try:
+            self.xrange = (xRangeOrSize[0], xRangeOrSize[1])
+        except:
+            # it must be a number, not a range
+            self.xrange = (0.0, float(xRangeOrSize))
+
+        try:
+            self.yrange = (yRangeOrSize[0], yRangeOrSize[1])
+        except:
+            # it must be a number, not a range
+            self.yrange = (0.0, float(yRangeOrSize))
+
+        self.spacing = spacing
+        self.arcTolerance = arcTolerance
+
+        if self.xrange[0] > self.xrange[1]: self.xrange = (self.xrange[1], self.xrange[0])
+        if self.yrange[0] > self.yrange[1]: self.yrange = (self.yrange[1], self.yrange[0])
+
+        self.nPointsX = int(math.ceil((self.xrange[1] - self.xrange[0]) / float(spacing)))+1
+        self.nPointsY = int(math.ceil((self.yrange[1] - self.yrange[0]) / float(spacing)))+1
+
+        print "Ranges: ", self.xrange, self.yrange
+
+        self.xPoints = [(i*spacing + self.xrange[0]) for i in range(self.nPointsX)]
+        self.yPoints = [(i*spacing + self.yrange[0]) for i in range(self.nPointsY)]
+
+        print "Points X:", self.xPoints
+        print "Points Y:", self.yPoints
+
+        if numpy_available:
+            # values that were not probed yet are NaN
+            self.zValues = numpy.full((self.nPointsX, self.nPointsY), numpy.nan)
+            self.xPointsArray = numpy.array(self.xPoints)
+            self.yPointsArray = numpy.array(self.yPoints)
+        else:
+            self.zValues = [[None for y in range(self.nPointsY)] for x in range(self.nPointsX)]
+
+        # construct point list
+        direction = +1
+        self.probePointList = []
+        self.probePointIndices = []
+        for yInd in range(len(self.yPoints)):
+            if direction == 1:
+                xIter = range(len(self.xPoints))
+            else:
+                xIter = range(len(self.xPoints)-1, -1, -1)
+            for xInd in xIter:
+                self.probePointList.append((self.xPoints[xInd],self.yPoints[yInd]))
+                self.probePointIndices.append((xInd,yInd))
+            direction = -direction
+
+
+    def getProbePoints(self):
+        # returns a list of all the X,Y coordinates to probe
+        return self.probePointList
+
+    def setZValue(self, index, z, zOffset = 0):
+        # sets a z value
+        print "Setting Z(",self.probePointIndices[index][0],self.probePointIndices[index][1], "):", z+zOffset
+        self.zValues[self.probePointIndices[index][0]][self.probePointIndices[index][1]] = z + zOffset
+
+    def isValid(self):
+        # check if all the values have been filled
+        if numpy_available:
+            return not numpy.isnan(self.zValues).any()
+        for zVec in self.zValues:
+            if any(z is None for z in zVec):
+                return False
+        return True
+
+    def _findInterpolationIndices(self, val, vec):
+        #print "Finding ", val, " in ", vec
+        if val <= vec[0]:
+            weights = (1,0)
+            indices = (0,0)
+            return indices, weights
+        if val >= vec[-1]:
+            weights = (1,0)
+            indices = (len(vec)-1, len(vec)-1)
+            return indices, weights
+
+        indexAfter = bisect_right(vec, val)
+        indexBefore = indexAfter - 1
+        #print "Bisect returned ", indexAfter
+        weightBefore = (vec[indexAfter] - val)/(vec[indexAfter] - vec[indexBefore]) # the further the point is from the index before, the higher the weight
+        weightAfter = 1.0 - weightBefore
+        weights = (weightBefore, weightAfter)
+        indices = (indexBefore, indexAfter)
+        return indices, weights
+
+
+    def getZValue(self, x, y):
+        # this is where the magic happens: return an interpolated ZValue
+        # find X
+        #print "Getting Z value"
+        xInd, xWeight = self._findInterpolationIndices(x, self.xPoints)
+        #print "XInd,weight: ", xInd, xWeight
+        yInd, yWeight = self._findInterpolationIndices(y, self.yPoints)
+        #print "YInd,weight: ", yInd, yWeight
+        if numpy_available:
+            zValue = self.zValues.item # much faster than indexing for single elements
+            z00, z01 = zValue(xInd[0], yInd[0]), zValue(xInd[0], yInd[1])
+            z10, z11 = zValue(xInd[1], yInd[0]), zValue(xInd[1], yInd[1])
+        else:
+            z00, z01 = self.zValues[xInd[0]][yInd[0]], self.zValues[xInd[0]][yInd[1]]
+            z10, z11 = self.zValues[xInd[1]][yInd[0]], self.zValues[xInd[1]][yInd[1]]
+        z = (z00 * xWeight[0] * yWeight[0] +
+            z01 * xWeight[0] * yWeight[1] +
+            z10 * xWeight[1] * yWeight[0] +
+            z11 * xWeight[1] * yWeight[1])
+
+        return z
+
+    def _findInterpolationArrays(self, vals, vec):
+        # same as _findInterpolationIndices, for an array of values
+        vals = numpy.clip(vals, vec[0], vec[-1])
+        if len(vec) == 1:
+            indices = numpy.zeros(len(vals), dtype=numpy.intp)
+            return indices, indices, numpy.ones(len(vals))
+        indexAfter = numpy.clip(numpy.searchsorted(vec, vals, side='right'), 1, len(vec)-1)
+        indexBefore = indexAfter - 1
+        weightBefore = (vec[indexAfter] - vals) / (vec[indexAfter] - vec[indexBefore])
+        return indexBefore, indexAfter, weightBefore
+
+    def getZValues(self, xs, ys):
+        # interpolated Z values of many points at once
+        if not numpy_available:
+            return [self.getZValue(x, y) for x, y in zip(xs, ys)]
+        xBefore, xAfter, xWeight = self._findInterpolationArrays(numpy.asarray(xs, dtype=float), self.xPointsArray)
+        yBefore, yAfter, yWeight = self._findInterpolationArrays(numpy.asarray(ys, dtype=float), self.yPointsArray)
+        z = self.zValues
+        return ((z[xBefore, yBefore] * yWeight + z[xBefore, yAfter] * (1.0 - yWeight)) * xWeight +
+                (z[xAfter, yBefore] * yWeight + z[xAfter, yAfter] * (1.0 - yWeight)) * (1.0 - xWeight))
+
+    def compensateMove(self, move):
+        # commands that execute a move (MovementGCode, in absolute coordinates) following the probed surface.
+        # The move is split in segments no longer than the grid spacing; arcs are split into chords
+        if move.e is not None: # not split
+            move.z += self.getZValue(move.x, move.y)
+            return [move.getCommand()]
+        points = list(move.splitPoints(self.spacing, self.arcTolerance))
+        zOffsets = self.getZValues([point[0] for point in points], [point[1] for point in points])
+        g = 1 if move.isArc() else move.g
+        feed = (" F%.4f" % move.f) if move.f is not None else ""
+        return ["G%d X%.4f Y%.4f Z%.4f%s" % (g, x, y, z + float(zOffset), feed) for (x, y, z), zOffset in zip(points, zOffsets)]
@@ -26,7 +26,41 @@ class GCodeConverter:
     lastY = 'Y0'
 
     def __init__(self):
-        pass
+        # state for convertWords: last motion mode and last X and Y values
+        self.motionG = '0'
+        self.wordX = '0'
+        self.wordY = '0'
+
+    def convertWords(self, first, words):
+        # same as convert, for a tokenized block (first letter, {letter: value}). The dictionary is modified in place.
+        # Unlike convert, only motion codes (G0-G3) change the modal G used for lines without a G word.
+        if first == 'G':
+            try:
+                gcodeVal = int(words['G'])
+            except:  # gcode is not an int: return unmodified
+                return words
+            if gcodeVal not in [0, 1, 2, 3]:  # if it's not a movement gcode then don't modify
+                return words
+            self.motionG = words['G']
+        elif first == 'X' or first == 'Y' or first == 'Z':
+            words['G'] = self.motionG
+        else:
+            return words
+
+        x = words.get('X')
+        y = words.get('Y')
+        if x:
+            self.wordX = x
+        if y:
+            self.wordY = y
+
+        # there can't be an X without Y
+        if x and not y:
+            words['Y'] = self.wordY
+        elif y and not x:
+            words['X'] = self.wordX
+
+        return words
 
     def convert(self, line):
         line = line.strip().upper()
@@ -16,8 +16,6 @@
 # You should have received a copy of the GNU General Public License
 # along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
 
-import time
-
 from pyFileList.filelist import FileList
 #from pyJoy.JoyEventGenerator import JoyEventGenerator
 from pyJoy.JoyEvdev import JoyEvdevUIEventGenerator
@@ -111,7 +109,6 @@ class JoyFileList(FileList):
 
     def stopJoy(self):
         self.joyEventGen.stop()
-        time.sleep(0.1)
 
     def okClicked(self):
         self.stopJoy()
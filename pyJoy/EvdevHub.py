@@ -0,0 +1,232 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Input devices (joypad, shuttle, keypad...) read by a single thread, woken up by epoll when a device has events
+# instead of a thread per device blocked in read_loop or polling. The hub also runs the timers of the key repeats, so
+# that the repeats do not need threads either.
+#
+# The callbacks and the timers run in the hub thread: they must be short. The devices are opened once and shared,
+# so that several clients (e.g. the jogger and the file list) can use the same grabbed device.
+
+evdev_available = True
+try:
+    import evdev
+except:
+    evdev_available = False
+import os
+import sys
+import time
+import fcntl
+import errno
+import heapq
+import select
+import threading
+import traceback
+
+sharedDevices = {} # path: InputDevice
+sharedHub = None
+sharedLock = threading.Lock()
+
+
+def getHub():
+    global sharedHub
+    with sharedLock:
+        if sharedHub is None:
+            sharedHub = EvdevHub()
+        return sharedHub
+
+def findDevice(identifier):
+    # the evdev device whose name contains identifier, None if not found
+    if not evdev_available:
+        return None
+    with sharedLock:
+        for device in sharedDevices.values():
+            if identifier in device.name:
+                return device
+        for path in evdev.list_devices():
+            if path in sharedDevices:
+                continue
+            try:
+                device = evdev.InputDevice(path)
+            except:
+                continue
+            if identifier in device.name:
+                sharedDevices[path] = device
+                return device
+            device.close()
+    return None
+
+
+class HubTimer(object):
+    # a callback scheduled with EvdevHub.callLater
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EvdevHub(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.devices = {} # file descriptor: (device, callbacks, grabbed)
+        self.timers = [] # heap of (time, sequence, HubTimer)
+        self.sequence = 0
+        self.poller = select.epoll()
+        self.wakeRead, self.wakeWrite = os.pipe()
+        for fd in (self.wakeRead, self.wakeWrite):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.poller.register(self.wakeRead, select.EPOLLIN)
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None: return
+            self.thread = threading.Thread(target = self.run, name = "EvdevHub")
+            self.thread.daemon = True
+            self.thread.start()
+
+    # --- from any thread ---
+
+    def subscribe(self, device, callback, grab = True):
+        # call callback(event) for each event of the device. The device is grabbed while it has subscribers
+        fd = device.fileno()
+        with self.lock:
+            entry = self.devices.get(fd)
+            if entry is None:
+                if grab:
+                    try:
+                        device.grab()
+                    except IOError:
+                        grab = False
+                        print "Cannot grab %s" % device.name
+                self.devices[fd] = (device, [callback], grab)
+                self.poller.register(fd, select.EPOLLIN)
+            else:
+                self.devices[fd] = (device, entry[1] + [callback], entry[2])
+        self.start()
+
+    def unsubscribe(self, device, callback):
+        fd = device.fileno()
+        with self.lock:
+            entry = self.devices.get(fd)
+            if entry is None:
+                return
+            callbacks = [c for c in entry[1] if c != callback]
+            if callbacks:
+                self.devices[fd] = (device, callbacks, entry[2])
+                return
+            self.removeDevice(fd)
+
+    def callLater(self, delay, callback):
+        # run callback in the hub thread after delay seconds, unless the returned timer is canceled
+        timer = HubTimer(callback)
+        with self.lock:
+            self.sequence += 1
+            heapq.heappush(self.timers, (time.time() + delay, self.sequence, timer))
+        self.wakeup()
+        self.start()
+        return timer
+
+    def wakeup(self):
+        try:
+            os.write(self.wakeWrite, 'w')
+        except OSError:
+            pass # the pipe is full: the hub is already going to wake up
+
+    # --- hub thread ---
+
+    def removeDevice(self, fd):
+        # with the lock held
+        device, callbacks, grabbed = self.devices.pop(fd)
+        try:
+            self.poller.unregister(fd)
+        except (IOError, ValueError):
+            pass
+        if grabbed:
+            try:
+                device.ungrab()
+            except:
+                pass
+
+    def run(self):
+        while True:
+            timeout = self.runTimers()
+            try:
+                ready = self.poller.poll(timeout)
+            except IOError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            for fd, mask in ready:
+                if fd == self.wakeRead:
+                    try:
+                        while os.read(self.wakeRead, 4096):
+                            pass
+                    except OSError:
+                        pass
+                else:
+                    self.readDevice(fd)
+
+    def runTimers(self):
+        # run the expired timers. Returns the time until the next one (-1: none)
+        while True:
+            with self.lock:
+                if not self.timers:
+                    return -1
+                when, sequence, timer = self.timers[0]
+                delay = when - time.time()
+                if delay > 0:
+                    return delay
+                heapq.heappop(self.timers)
+            if not timer.cancelled:
+                self.call(timer.callback)
+
+    def readDevice(self, fd):
+        with self.lock:
+            entry = self.devices.get(fd)
+        if entry is None:
+            return
+        device, callbacks, grabbed = entry
+        try:
+            events = list(device.read())
+        except (IOError, OSError) as e:
+            if e.errno == errno.EAGAIN:
+                return
+            print "Input device %s disconnected" % device.name
+            with self.lock:
+                if fd in self.devices:
+                    self.removeDevice(fd)
+            with sharedLock:
+                for path, shared in sharedDevices.items():
+                    if shared is device:
+                        del sharedDevices[path] # it is opened again if it is reconnected
+            return
+        for event in events:
+            for callback in callbacks:
+                self.call(callback, event)
+
+    def call(self, callback, *args):
+        # an error in a client must not stop the other devices
+        try:
+            callback(*args)
+        except:
+            traceback.print_exc(file = sys.stdout)
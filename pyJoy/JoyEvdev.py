@@ -4,9 +4,9 @@ try:
 except:
     evdev_available = False
 import PySide.QtCore
-import math
-import time
 import pycnc_config
+from pyJoy.JoyVelocity import axisRangeFromAbsinfo
+from pyJoy.EvdevHub import getHub, findDevice
 #import traceback
 
 def findAxisTuple(code, codeDoubleList):
@@ -26,27 +26,35 @@ def findAxesAxisTuple(code):
 def isButton(code):
     return code in pycnc_config.JOY_BUTTONS
 
-class JoyEvdev(PySide.QtCore.QThread):
+# the events of the joystick are received from the EvdevHub, in the hub thread, between start and stop
+class JoyEvdev(PySide.QtCore.QObject):
 
     # values
     BUTTON_DOWN = 1
     BUTTON_UP = 0
 
     def __init__(self):
-        PySide.QtCore.QThread.__init__(self)
+        PySide.QtCore.QObject.__init__(self)
         self.joyDev = None
-        self.killMe = False
+        self.axisRanges = {}
+        self.running = False
         if not evdev_available:
             print "Evdev system not available!"
             return
-        devices = [evdev.InputDevice(fn) for fn in evdev.list_devices()]
-        for dev in devices:
-            if pycnc_config.JOY_IDENTIFIER in dev.name:
-                self.joyDev = dev
-                break
+        self.joyDev = findDevice(pycnc_config.JOY_IDENTIFIER)
 
         if self.joyDev is None:
             print "Joystick not found!"
+            return
+
+        # ranges of the analog axes, to normalize their values
+        self.axisRanges = {}
+        for axis in pycnc_config.JOY_AXES:
+            for code in axis:
+                try:
+                    self.axisRanges[code] = axisRangeFromAbsinfo(self.joyDev.absinfo(code))
+                except:
+                    print "Joystick axis %d not found!" % code
 
     # redefine these stubs to do something useful in subclasses
     def processButton(self, code, value):
@@ -55,6 +63,7 @@ class JoyEvdev(PySide.QtCore.QThread):
     def processHat(self, hatCode, value):
         pass
 
+    # value is normalized to [-1, 1] with the range of the axis reported by the device
     def processAxes(self, axesCode, value):
         pass
 
@@ -66,15 +75,16 @@ class JoyEvdev(PySide.QtCore.QThread):
         if self.joyDev is None:
             print "Cannot start Joystick"
             return
-
-        # traceback.print_stack()
-        self.joyDev.grab()
-        self.killMe = False
+        if self.running: return
 
         # initialize events
         self.eventBlock = None
-        PySide.QtCore.QThread.start(self)
-        time.sleep(0.1)
+        self.running = True
+        getHub().subscribe(self.joyDev, self.handleEvent)
+
+    def handleEvent(self, event):
+        self.eventBlock = event
+        self.process_events()
 
     def process_events(self):
         # process the event block
@@ -98,30 +108,15 @@ class JoyEvdev(PySide.QtCore.QThread):
             self.processHat(hatCode, self.eventBlock.value)
 
         axesCode = findAxesAxisTuple(self.eventBlock.code)
-        if axesCode is not None:
-            self.processAxes(axesCode, self.eventBlock.value)
+        if axesCode is not None and self.eventBlock.code in self.axisRanges:
+            self.processAxes(axesCode, self.axisRanges[self.eventBlock.code].normalize(self.eventBlock.value))
 
         self.eventBlock = None
 
-    def run(self):
-        if self.joyDev is None:
-            print "Cannot start Joystick"
-            return
-
-        for event in self.joyDev.read_loop():
-            if self.killMe:
-                return
-
-            self.eventBlock = event
-            self.process_events()
-
     def stop(self):
-        self.killMe = True
-        time.sleep(0.1)
-        try:
-            self.joyDev.ungrab()
-        except:
-            pass
+        if not self.running: return
+        self.running = False
+        getHub().unsubscribe(self.joyDev, self.handleEvent)
 
 
 
@@ -144,6 +139,7 @@ class JoyEvdevUIEventGenerator(JoyEvdev):
         self.BUTTON_OK = pycnc_config.JOY_BUTTONS[pycnc_config.BTN_OK]
         self.BUTTON_SELECT = pycnc_config.JOY_BUTTONS[pycnc_config.BTN_SELECT]
         self.BUTTON_CANCEL = pycnc_config.JOY_BUTTONS[pycnc_config.BTN_CANCEL]
+        self.repeatTimers = {} # hat code: repeat timer of the hat being held
 
     def processButton(self, btnCode, value):
         if value != self.BUTTON_DOWN:
@@ -157,23 +153,40 @@ class JoyEvdevUIEventGenerator(JoyEvdev):
             self.event_select.emit()
 
     def processHat(self, hatCode, value):
+        # a hat held down repeats its event every BTN_REPEAT
+        timer = self.repeatTimers.pop(hatCode, None)
+        if timer is not None:
+            timer.cancel()
 
+        signal = None
         if hatCode in pycnc_config.JOY_XAXIS_MAP['hats']:
             # this is a X hat movement
             direction = value * pycnc_config.JOY_XAXIS_MAP['hatsMult'][
                 pycnc_config.JOY_XAXIS_MAP['hats'].index(hatCode)]
             if direction > 0:
-                self.event_right.emit()
+                signal = self.event_right
             elif direction < 0:
-                self.event_left.emit()
+                signal = self.event_left
         elif hatCode in pycnc_config.JOY_YAXIS_MAP['hats']:
-            # this is a X hat movement
+            # this is a Y hat movement
             direction = value * pycnc_config.JOY_YAXIS_MAP['hatsMult'][
                 pycnc_config.JOY_YAXIS_MAP['hats'].index(hatCode)]
             if direction > 0:
-                self.event_down.emit()
+                signal = self.event_down
             elif direction < 0:
-                self.event_up.emit()
+                signal = self.event_up
 
+        if signal is not None:
+            self.repeatHat(hatCode, signal)
 
+    def repeatHat(self, hatCode, signal):
+        # called by the hub timer while the hat is held
+        signal.emit()
+        self.repeatTimers[hatCode] = getHub().callLater(pycnc_config.BTN_REPEAT / 1000.0,
+                                                        lambda: self.repeatHat(hatCode, signal))
 
+    def stop(self):
+        JoyEvdev.stop(self)
+        for timer in self.repeatTimers.values():
+            timer.cancel()
+        self.repeatTimers = {}
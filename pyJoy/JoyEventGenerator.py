@@ -16,10 +16,16 @@
 # You should have received a copy of the GNU General Public License
 # along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
 
-#import pygame
-import time
-from PySide.QtCore import QThread
+# Button and hat events of the joystick, repeated every BTN_REPEAT while held. The events come from the EvdevHub
+# (no polling) and the repeats are hub timers; hatEvent and btnEvent are called in the hub thread.
+# The hat events keep the pygame convention: 0: x+, 1: x-, 2: y+ (up), 3: y- (down)
+evdev_available = True
+try:
+  import evdev
+except:
+  evdev_available = False
 import pycnc_config
+from pyJoy.EvdevHub import getHub, findDevice
 
 
 def eAnd(list1, list2):
@@ -31,106 +37,76 @@ def eOr(list1, list2):
 def eMinus(list1, list2):
   return [ (x-y if (x>0 and y>0) else 0) for (x,y) in zip(list1, list2) ]
 
-class JoyEventGenerator(QThread):
+class JoyEventGenerator(object):
   def __init__(self):
-    QThread.__init__(self)
-    self.killMe = False
-    pygame.init()
-    pygame.joystick.init()
-    #print "Number of joysticks:", pygame.joystick.get_count()
-    if pygame.joystick.get_count() == 0:
+    self.running = False
+    self.hatValues = [ [0, 0] for hat in pycnc_config.JOY_HATS ] # pygame convention: y is +1 up
+    self.buttonValues = [ 0 for btn in pycnc_config.JOY_BUTTONS ]
+    self.repeatTimers = {} # ('hat', n) or ('btn', n): repeat timer
+    self.joystick = findDevice(pycnc_config.JOY_IDENTIFIER) if evdev_available else None
+    if self.joystick is None:
       print "No Joystick available"
-      self.joystick = None
-    else:
-      self.joystick = pygame.joystick.Joystick(0)
-      self.joystick.init()
-      
+
   def getHat(self, hat):
-    if not self.joystick: return 0      
-    if hat < self.joystick.get_numhats():
-      return self.joystick.get_hat(hat)
-    return 0
-  
+    if hat < len(self.hatValues):
+      return tuple(self.hatValues[hat])
+    return (0, 0)
+
   def getButton(self, btn):
-    if not self.joystick: return 0
-    if btn < self.joystick.get_numbuttons():
-      return self.joystick.get_button(btn)
+    if btn < len(self.buttonValues):
+      return self.buttonValues[btn]
     return 0
-  
-  # returns a list with 4 logical elements: x+, x-, y+, y-
-  def getHatTimes(self):
-    t = time.time()
-    hatVal = self.getHat(0)
-    hatStat = []
-    hatStat.append(t if (hatVal[0] == +1) else -1)
-    hatStat.append(t if (hatVal[0] == -1) else -1)
-    hatStat.append(t if (hatVal[1] == +1) else -1)
-    hatStat.append(t if (hatVal[1] == -1) else -1)
-    return hatStat
-  
-  def getButtonTimes(self):
-    buttonStat = []
-    t = time.time()
-    for b in range(0, self.joystick.get_numbuttons()):
-      buttonStat.append(t if (self.getButton(b) == 1) else -1)
-    return buttonStat
-  
+
   #reimplement these methods to do something useful
   def hatEvent(self, hEv):
     print "Hat event", hEv
-    
+
   def btnEvent(self, bEv):
     print "Button event", bEv
-  
-  def run(self):
-    if not self.joystick: return
-    pygame.init()
-    pygame.joystick.init()
-    #if pygame.joystick.get_count() == 0: return
-    self.joystick = pygame.joystick.Joystick(0)
-    self.joystick.init()
-    pygame.event.get()
-    oldButtonTimes = self.getButtonTimes()
-    oldHatTimes = self.getHatTimes()
-    self.killMe = False
-    while (not self.killMe):
-      pygame.event.get()
-      newButtonTimes = self.getButtonTimes()
-      newHatTimes = self.getHatTimes()
-      for btn in range(0, len(newButtonTimes)):
-        oldTime = oldButtonTimes[btn]
-        newTime = newButtonTimes[btn]
-        if (oldTime < 0 ) and (newTime >= 0):
-          # a button was clicked
-          oldButtonTimes[btn] = newTime # set old button time to the new time, because the button was clicked now
-          self.btnEvent(btn)
-        elif (oldTime >= 0) and (newTime >= 0):
-          if (newTime - oldTime)*1000 > pycnc_config.BTN_REPEAT:
-            # fire the event and reset the counter
-            oldButtonTimes[btn] = newTime # set old button time to the new time, because the event was fired
-            self.btnEvent(btn)
-        elif (newTime < 0):
-          oldButtonTimes[btn] = -1 # the button was released
-          
-      for hat in range(0, len(newHatTimes)):
-        oldTime = oldHatTimes[hat]
-        newTime = newHatTimes[hat]
-        if (oldTime < 0 ) and (newTime >= 0):
-          # a button was clicked
-          oldHatTimes[hat] = newTime # set old button time to the new time, because the button was clicked now
-          self.hatEvent(hat)
-        elif (oldTime >= 0) and (newTime >= 0):
-          if (newTime - oldTime)*1000 > pycnc_config.BTN_REPEAT:
-            # fire the event and reset the counter
-            oldHatTimes[hat] = newTime # set old button time to the new time, because the event was fired
-            self.hatEvent(hat)
-        elif (newTime < 0):
-          oldHatTimes[hat] = -1 # the button was released
-      
-      time.sleep(0.05) # sleep 5ms
+
+  def start(self):
+    if not self.joystick or self.running: return
+    self.running = True
+    getHub().subscribe(self.joystick, self.handleEvent)
+
+  def handleEvent(self, event):
+    if event.type == evdev.ecodes.EV_KEY and event.code in pycnc_config.JOY_BUTTONS:
+      btn = pycnc_config.JOY_BUTTONS.index(event.code)
+      if event.value == 2: return # the kernel autorepeat: the repeats are timed here
+      self.buttonValues[btn] = event.value
+      self.setRepeat(('btn', btn), event.value != 0, lambda: self.btnEvent(btn))
+      return
+
+    for hat, codes in enumerate(pycnc_config.JOY_HATS):
+      if event.code in codes:
+        axis = codes.index(event.code)
+        value = event.value if axis == 0 else -event.value # evdev is +1 down
+        self.hatValues[hat][axis] = value
+        # the hat direction that is held, if any
+        plus, minus = (0, 1) if axis == 0 else (2, 3)
+        self.setRepeat(('hat', plus), value > 0, lambda: self.hatEvent(plus))
+        self.setRepeat(('hat', minus), value < 0, lambda: self.hatEvent(minus))
+        return
+
+  def setRepeat(self, key, held, fire):
+    # fire now and every BTN_REPEAT while held
+    timer = self.repeatTimers.pop(key, None)
+    if timer is not None:
+      timer.cancel()
+    if not held:
+      return
+    def repeat():
+      fire()
+      self.repeatTimers[key] = getHub().callLater(pycnc_config.BTN_REPEAT / 1000.0, repeat)
+    repeat()
 
   def stop(self):
-    self.killMe = True
+    if not self.running: return
+    self.running = False
+    getHub().unsubscribe(self.joystick, self.handleEvent)
+    for timer in self.repeatTimers.values():
+      timer.cancel()
+    self.repeatTimers = {}
 
 
 if __name__ == "__main__":
@@ -139,6 +115,3 @@ if __name__ == "__main__":
   print "press return to exit"
   raw_input()
   joyEv.stop()
-   
-    
-
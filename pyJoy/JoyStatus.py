@@ -16,42 +16,66 @@
 # You should have received a copy of the GNU General Public License
 # along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
 
-#import pygame
+# Current state of the joystick axes, hats and buttons, kept up to date by the events of the EvdevHub, so that
+# reading it does not poll the device. The values follow the pygame convention: axes in [-1, 1], hats (x, y) with
+# y +1 up. An axis is either an index in the flattened JOY_AXES or an (axes, axis) tuple
+evdev_available = True
+try:
+  import evdev
+except:
+  evdev_available = False
 import time
-  
+
 import pycnc_config
-  
+from pyJoy.EvdevHub import getHub, findDevice
+from pyJoy.JoyVelocity import axisRangeFromAbsinfo
+
 class JoyStatus:
   def __init__(self):
-    # Set up the joystick
-    pygame.init()
-    pygame.joystick.init()
-    #print "Number of joysticks:", pygame.joystick.get_count()
-    if pygame.joystick.get_count() == 0:
+    self.axisCodes = [ code for axes in pycnc_config.JOY_AXES for code in axes ]
+    self.values = {} # evdev code: value
+    self.axisRanges = {}
+    self.joystick = findDevice(pycnc_config.JOY_IDENTIFIER) if evdev_available else None
+    if self.joystick is None:
       print "No Joystick available"
-      self.joystick = None
-    else:
-      self.joystick = pygame.joystick.Joystick(0)
-      self.joystick.init()
-      
+      return
+    for code in self.axisCodes:
+      try:
+        self.axisRanges[code] = axisRangeFromAbsinfo(self.joystick.absinfo(code))
+      except:
+        pass
+    getHub().subscribe(self.joystick, self.handleEvent)
+
+  def handleEvent(self, event):
+    if event.type in (evdev.ecodes.EV_KEY, evdev.ecodes.EV_ABS):
+      self.values[event.code] = event.value
+
+  def close(self):
+    if self.joystick is not None:
+      getHub().unsubscribe(self.joystick, self.handleEvent)
+
   def getAxis(self, axis):
-    if not self.joystick: return 0
-    if axis < self.joystick.get_numaxes():
-      return self.joystick.get_axis(axis)
-    return 0
-  
+    if isinstance(axis, tuple):
+      if axis[0] >= len(pycnc_config.JOY_AXES) or axis[1] >= len(pycnc_config.JOY_AXES[axis[0]]): return 0
+      code = pycnc_config.JOY_AXES[axis[0]][axis[1]]
+    elif axis < len(self.axisCodes):
+      code = self.axisCodes[axis]
+    else:
+      return 0
+    if code not in self.axisRanges or code not in self.values: return 0
+    return self.axisRanges[code].normalize(self.values[code])
+
   def getHat(self, hat):
-    if not self.joystick: return (0, 0)
-    if hat < self.joystick.get_numhats():
-      return self.joystick.get_hat(hat)
+    if hat < len(pycnc_config.JOY_HATS):
+      xCode, yCode = pycnc_config.JOY_HATS[hat]
+      return (self.values.get(xCode, 0), -self.values.get(yCode, 0)) # evdev is +1 down
     return (0, 0)
-  
+
   def getButton(self, btn):
-    if not self.joystick: return 0
-    if btn < self.joystick.get_numbuttons():
-      return self.joystick.get_button(btn)
+    if btn < len(pycnc_config.JOY_BUTTONS):
+      return 1 if self.values.get(pycnc_config.JOY_BUTTONS[btn], 0) else 0
     return 0
-  
+
   def getMovement(self, axisDict):
     # check axes
     for joyAxisIndex in range(0,len(axisDict['axes'])):
@@ -84,15 +108,10 @@ class JoyStatus:
   
 ## main loop
 if __name__ == '__main__':
-  pygame.init()
   joy = JoyStatus()
   while (True):
-    pygame.event.get()
     xyz = joy.getXYZ()
     if xyz != (0,0,0):
       print xyz
-      
+
     time.sleep(0.1)
-    
-    
-    
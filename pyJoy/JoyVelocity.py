@@ -0,0 +1,114 @@
+# rasPyCNCController
+# Copyright 2016 Francesco Santini <francesco.santini@gmail.com>
+#
+# This file is part of rasPyCNCController.
+#
+# rasPyCNCController is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rasPyCNCController is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rasPyCNCController.  If not, see <http://www.gnu.org/licenses/>.
+
+# Velocity-mode jogging with analog sticks.
+#
+# The axis values are normalized to [-1, 1] from the range reported by the device (evdev absinfo), then the dead zone
+# (JOY_DEADZONE, or the flat region of the device if larger) and the exponential response curve (JOY_EXPO) are
+# applied. The velocity is low-pass filtered (JOY_FILTER_TIME) and sampled at the rate at which jog commands are sent
+# (JOY_SEND_RATE), instead of sending or dropping every input event. A release of the stick is not filtered: the stop
+# is sent at once. The delay from the stick to the jog command is at most about JOY_FILTER_TIME + 1/JOY_SEND_RATE;
+# the jog itself takes effect within JOG_LATENCY.
+
+import math
+import time
+
+import pycnc_config
+
+STOP_THRESHOLD = 0.001 # filtered velocity components below this are zero
+
+
+class AxisRange(object):
+    # range of an analog axis
+
+    def __init__(self, minimum, maximum, flat = 0):
+        self.center = (minimum + maximum) / 2.0
+        self.half = (maximum - minimum) / 2.0
+        self.deadzone = float(flat) / self.half if self.half > 0 else 0.0 # flat region of the device, normalized
+
+    def normalize(self, value):
+        if self.half <= 0:
+            return 0.0
+        return max(-1.0, min(1.0, (value - self.center) / self.half))
+
+
+def axisRangeFromAbsinfo(absinfo):
+    return AxisRange(absinfo.min, absinfo.max, absinfo.flat)
+
+def responseCurve(value, deadzone = None, expo = None):
+    # dead zone, then the rest of the range rescaled to [0, 1] and the exponential curve: (1 - expo) x + expo x^3
+    if deadzone is None: deadzone = pycnc_config.JOY_DEADZONE
+    if expo is None: expo = pycnc_config.JOY_EXPO
+    magnitude = abs(value)
+    if magnitude <= deadzone:
+        return 0.0
+    x = min(1.0, (magnitude - deadzone) / (1.0 - deadzone))
+    x = (1.0 - expo) * x + expo * x ** 3
+    return x if value > 0 else -x
+
+def velocityToJog(velocity, sendRate = None):
+    # relative move event (xyz, feed) for a velocity (fractions of the maximum feed on each axis), None if stopped.
+    # xyz is the distance covered until the next command: with Grbl 1.1 only its direction is used
+    if sendRate is None: sendRate = pycnc_config.JOY_SEND_RATE
+    length = math.sqrt(sum(c ** 2 for c in velocity))
+    if length == 0:
+        return None
+    # go slower in Z moves
+    if velocity[2] != 0:
+        minFeed = pycnc_config.MIN_FEED_Z
+        maxFeed = pycnc_config.MAX_FEED_Z
+    else:
+        minFeed = pycnc_config.MIN_FEED
+        maxFeed = pycnc_config.MAX_FEED
+    feed = int(minFeed + min(1.0, length) * (maxFeed - minFeed))
+    distance = feed / 60.0 / sendRate
+    return [c / length * distance for c in velocity], feed
+
+
+class VelocityFilter(object):
+    # first order low-pass filter of the requested velocity, sampled when a jog command can be sent.
+    # setTarget can be called from the input thread, sample from another one
+
+    def __init__(self, filterTime = None):
+        self.filterTime = pycnc_config.JOY_FILTER_TIME if filterTime is None else filterTime
+        self.target = (0.0, 0.0, 0.0)
+        self.velocity = (0.0, 0.0, 0.0)
+        self.lastSample = None
+
+    def setTarget(self, velocity):
+        self.target = tuple(velocity)
+
+    def isStopped(self):
+        return not any(self.target)
+
+    def sample(self, now = None):
+        if now is None: now = time.time()
+        target = self.target
+        if not any(target):
+            # the stop is immediate
+            self.velocity = (0.0, 0.0, 0.0)
+            self.lastSample = None
+            return self.velocity
+        if self.lastSample is None or self.filterTime <= 0:
+            alpha = 1.0 if self.filterTime <= 0 else 1.0 - math.exp(-1.0 / (pycnc_config.JOY_SEND_RATE * self.filterTime))
+        else:
+            alpha = 1.0 - math.exp(-(now - self.lastSample) / self.filterTime)
+        self.lastSample = now
+        velocity = [v + alpha * (t - v) for v, t in zip(self.velocity, target)]
+        self.velocity = tuple(v if abs(v) >= STOP_THRESHOLD else 0.0 for v in velocity)
+        return self.velocity
@@ -1,4 +1,7 @@
-from PySide.QtCore import Qt
+try:
+    from PySide.QtCore import Qt
+except ImportError:
+    Qt = None # without the graphical interface (raspycnc-run), the keyboard jogger is not available
 
 # GrblWriter
 
@@ -6,6 +9,19 @@ SERIAL_PATTERN="/dev/ttyACM*"
 BAUD=115200
 SERIAL_DEBUG = False # define if serial communication should be shown
 CHECK_GCODE = True # define if every new GCode file should be run in check mode first
+CHECK_REGISTRY_FILE = '~/.raspycnc/checked.sqlite' # results of the check mode, by file content, so that a file is checked only once. None to disable
+# streaming protocol used to run a job:
+# 'charcount' keeps Grbl's serial RX buffer full by counting the characters of the lines that were not acknowledged yet
+# 'simple' sends one line and waits for its ok before sending the next one
+STREAMING_PROTOCOL = 'charcount'
+GRBL_RX_BUFFER_SIZE = 128 # size of the serial RX buffer of Grbl, in bytes
+STATUS_POLL_RATE = 5 # rate (Hz) at which the real machine position is requested from Grbl. 0 to disable
+# how the serial port is read:
+# 'threads' uses a reader thread (and a thread for the status requests)
+# 'select' uses a single thread that waits on the port with poll(), sends the lines with character counting and the status
+# requests; the responses of the lines are Futures
+SERIAL_TRANSPORT = 'threads'
+PROGRESS_UPDATE_RATE = 5 # maximum rate (Hz) of the progress and position updates while a job is streamed. 0 for every line
 
 # filelist
 # patterns for gcode files
@@ -30,11 +46,23 @@ MAX_FEED = 4000
 MIN_FEED_Z = 100
 MAX_FEED_Z = 1000
 
+# continuous jogging with Grbl 1.1: short $J= segments are kept queued in grbl while a jog button is held
+JOG_LATENCY = 0.2 # motion queued ahead (s): a change of direction or speed takes effect within this time. Faster jogs queue their stopping distance, v^2/(2*acceleration), and take longer
+JOG_MIN_SEGMENT_TIME = 0.025 # duration of the shortest jog segment (s)
+JOG_WATCHDOG = 0.5 # the jog stops if it is not confirmed by the jogger within this time (s), e.g. if a release is lost
+GRBL_PLANNER_BLOCKS = 15 # size of the planner buffer of grbl
+
 # GCodeLoader
 G0_FEED = 5000 # feed rate for G0. Default value that should get overwritten by the config
+ESTIMATE_ACCELERATION = True # estimate the job time with the Grbl acceleration settings ($110-$112, $120-$122, $11)
+LOADER_INDEX_SIZE = 20*1024*1024 # files larger than this (in bytes) are not kept in memory: only an index of the line offsets is stored
+ANALYSIS_CACHE_DIR = '~/.raspycnc/cache' # analysis results of the loaded files are stored here. Set to None to disable
+ANALYSIS_CACHE_SIZE = 200*1024*1024 # max size of the analysis cache in bytes. Least recently used files are removed first
+PARALLEL_LOAD_SIZE = 5*1024*1024 # files larger than this (in bytes) are analyzed on all the cores
+PARALLEL_LOAD_PROCESSES = None # number of processes for the parallel analysis. None: one per core
 
 # JoyEventGenerator
-BTN_REPEAT = 100 # repeat time for buttons in ms
+BTN_REPEAT = 100 # repeat time for buttons and held keys in ms. Must be below JOG_WATCHDOG
 
 #JoyFileList
 # values for joystick buttons corresponding to actions in the filelist
@@ -50,24 +78,30 @@ BTN_CANCEL=9
 BTN_ZERO=0
 BTN_ZEROZ=1
 BTN_HOME=2
+# analog sticks jog in velocity mode: the deflection sets the speed
+JOY_DEADZONE = 0.1 # fraction of the range of an analog axis around the center that is ignored
+JOY_EXPO = 0.5 # response curve of the analog axes: 0 is linear, 1 is cubic (finer control near the center)
+JOY_FILTER_TIME = 0.05 # time constant of the smoothing of the analog axes (s). 0 to disable
+JOY_SEND_RATE = 20 # rate of the jog commands while the joystick is deflected (Hz). Must be above 1/JOG_WATCHDOG
 
 # KeyboardJogger
-KEY_XPOS = [Qt.Key_6]
-KEY_XNEG = [Qt.Key_4]
-KEY_YPOS = [Qt.Key_8]
-KEY_YNEG = [Qt.Key_2]
-KEY_ZPOS = [Qt.Key_9]
-KEY_ZNEG = [Qt.Key_3]
-KEY_SETHOME = [Qt.Key_0]
-KEY_SETZ0 = [Qt.Key_Enter]
-KEY_HOME = [Qt.Key_5]
+if Qt is not None:
+    KEY_XPOS = [Qt.Key_6]
+    KEY_XNEG = [Qt.Key_4]
+    KEY_YPOS = [Qt.Key_8]
+    KEY_YNEG = [Qt.Key_2]
+    KEY_ZPOS = [Qt.Key_9]
+    KEY_ZNEG = [Qt.Key_3]
+    KEY_SETHOME = [Qt.Key_0]
+    KEY_SETZ0 = [Qt.Key_Enter]
+    KEY_HOME = [Qt.Key_5]
 
 # JoyStatus
 # Mapping of joystick buttons and axes to movements.
 
 JOY_XAXIS_MAP = {
   'axes' : [ 0, 3, (0,0), (1,0) ], # axis 0 and 3 move along x. 0 is left-right movement of left analog axis; 3 is right analog axis. Tuples correspond to evdev axis
-  'axesMult' : [ 50, 5, 1, 0.1 ], # left axis moves maximum of 50, right axis of 5
+  'axesMult' : [ 50, 5, 1, 0.1 ], # left axis moves maximum of 50, right axis of 5. Evdev axes are in velocity mode: 1 is MAX_FEED, 0.1 a tenth of it
   'hats' : [ (0,0) ], # hat 0 (the only one) axis 0 (left-right) moves by 1 on x axis
   'hatsMult' : [ 1 ],
   'btns' : [], # no buttons are mapped to x movement
@@ -123,3 +157,4 @@ ENABLE_PROBING = True
 PROBING_DISTANCE = 20 # maximum distance the probe should travel in the Z direction
 PROBING_FEED = 10 # speed at which the probe should travel
 PROBING_SPACING = 10 # spacing in the probe grid
+ZCOMP_ARC_TOLERANCE = 0.01 # arcs are split into chords within this distance from the arc, to apply the Z compensation
@@ -21,7 +21,7 @@
 from PySide.QtGui import *
 
 from gcode.GrblWriterBasic import GrblWriterBasic
-from gcode.GrblWriter import GrblWriter
+from gcode.GrblWriterQt import QtGrblWriter
 from JogWidget.JogWidget import JogWidget
 from RunWidget.RunWidget import RunWidget
 from pyFileList.JoyFileList import JoyFileList
@@ -61,7 +61,7 @@ class MainWindow(QStackedWidget):
         if dummy:
             self.grblWriter = GrblWriterBasic()
         else:
-            self.grblWriter = GrblWriter()
+            self.grblWriter = QtGrblWriter()
             self.grblWriter.grbl_error.connect(self.ask_perform_reset)
 
         # here wait for GRBL and show splash screen
@@ -205,7 +205,8 @@ class MainWindow(QStackedWidget):
 
         self.setCurrentWidget(self.runWidget)
         self.runWidget.startJoy()
-        self.runWidget.runGCode(self.jogWidget.file, self.jogWidget.gcode, self.jogWidget.times, self.jogWidget.totalTime, self.jogWidget.bBox)
+        gcode, times, zCompensated, commands, source = self.jogWidget.getJob()
+        self.runWidget.runGCode(self.jogWidget.file, gcode, times, self.jogWidget.totalTime, self.jogWidget.bBox, zCompensated, commands, source)
 
     def runEnd(self):
         self.setCurrentWidget(self.jogWidget)